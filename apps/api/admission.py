@@ -0,0 +1,225 @@
+"""
+Admission control for chat turns, so one tenant's burst cannot monopolize an instance.
+
+Three layers:
+- Per-user token buckets (keyed by user_id from get_current_user): CHAT_RATE_BURST turns at once,
+  refilled at CHAT_RATE_PER_MINUTE. An empty bucket is a 429 with the seconds until the next token.
+- A global ceiling on concurrent turns (CHAT_MAX_CONCURRENT_TURNS) with a short queue in front of
+  it (CHAT_MAX_QUEUED_TURNS). A full queue is rejected at once; a queued turn that does not start
+  within CHAT_QUEUE_TIMEOUT_SECONDS is rejected too. Both answer 429 with Retry-After.
+- A ceiling on concurrent heavy tool runs (screenshots, PDF rendering; HEAVY_TOOL_CONCURRENCY).
+  Tool calls wait for a slot instead of failing, since their turn is already running.
+
+Limits are per worker process. Counters are served at /metrics/admission.
+"""
+import os
+import math
+import time
+import asyncio
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from tracing import span
+
+CHAT_RATE_BURST = int(os.getenv("CHAT_RATE_BURST", "5"))
+CHAT_RATE_PER_MINUTE = float(os.getenv("CHAT_RATE_PER_MINUTE", "20"))
+CHAT_MAX_CONCURRENT_TURNS = int(os.getenv("CHAT_MAX_CONCURRENT_TURNS", "16"))
+CHAT_MAX_QUEUED_TURNS = int(os.getenv("CHAT_MAX_QUEUED_TURNS", "32"))
+CHAT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS", "20"))
+HEAVY_TOOL_CONCURRENCY = int(os.getenv("HEAVY_TOOL_CONCURRENCY", "2"))
+HEAVY_TOOLS = [t.strip() for t in os.getenv(
+    "HEAVY_TOOLS", "AnalyzeWebsiteStyles,TakeMenuScreenshots,FindMenuFiles,PopulateMenuFromDB"
+).split(",") if t.strip()]
+
+# Buckets kept for the most recently active users (an evicted bucket comes back full)
+RATE_BUCKETS_MAX_ENTRIES = 10000
+
+
+class AdmissionRejected(Exception):
+    """A turn was not admitted; main.py turns this into a 429 with Retry-After."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TurnSlot:
+    """A held turn slot; release() is idempotent (streams release from several places)."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._record_turn_duration(time.monotonic() - self._started)
+            self._controller._release_turn()
+
+
+class AdmissionController:
+    def __init__(self):
+        # user_id -> (tokens, last refill time)
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+        self._active = 0
+        self._waiters: "OrderedDict[int, asyncio.Future]" = OrderedDict()
+        self._next_waiter = 0
+        # Recent turn durations, for Retry-After when the queue is full
+        self._avg_turn_seconds = 10.0
+        self._stats = {"admitted": 0, "queued": 0, "rejected_rate": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    # -- per-user rate ---------------------------------------------------------------
+
+    def check_rate(self, user_id: Optional[str]) -> None:
+        """Take one token from the user's bucket or raise AdmissionRejected."""
+        key = user_id or "anonymous"
+        now = time.monotonic()
+        rate = CHAT_RATE_PER_MINUTE / 60.0
+        tokens, updated = self._buckets.pop(key, (float(CHAT_RATE_BURST), now))
+        tokens = min(float(CHAT_RATE_BURST), tokens + (now - updated) * rate)
+        if tokens < 1.0:
+            self._buckets[key] = (tokens, now)
+            self._stats["rejected_rate"] += 1
+            raise AdmissionRejected("rate_limited", (1.0 - tokens) / rate if rate > 0 else 60.0)
+        self._buckets[key] = (tokens - 1.0, now)
+        while len(self._buckets) > RATE_BUCKETS_MAX_ENTRIES:
+            self._buckets.popitem(last=False)
+
+    # -- global turn ceiling -----------------------------------------------------------
+
+    async def acquire_turn(self) -> TurnSlot:
+        """Start now, wait in the bounded queue, or raise AdmissionRejected."""
+        if self._active < CHAT_MAX_CONCURRENT_TURNS and not self._waiters:
+            return self._grant()
+        if len(self._waiters) >= CHAT_MAX_QUEUED_TURNS:
+            self._stats["rejected_queue_full"] += 1
+            raise AdmissionRejected("overloaded", self._estimated_wait())
+
+        waiter_id = self._next_waiter
+        self._next_waiter += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[waiter_id] = waiter
+        self._stats["queued"] += 1
+        granted = False
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), CHAT_QUEUE_TIMEOUT_SECONDS)
+            granted = True
+        except asyncio.TimeoutError:
+            self._stats["rejected_timeout"] += 1
+            raise AdmissionRejected("queue_timeout", self._estimated_wait())
+        finally:
+            self._waiters.pop(waiter_id, None)
+            if not granted and waiter.done():
+                # Granted while timing out or being cancelled: pass the slot on
+                self._release_turn()
+        return TurnSlot(self)
+
+    def _grant(self) -> TurnSlot:
+        self._active += 1
+        self._stats["admitted"] += 1
+        return TurnSlot(self)
+
+    def _release_turn(self) -> None:
+        self._active -= 1
+        self._wake_next()
+
+    def _wake_next(self) -> None:
+        while self._waiters and self._active < CHAT_MAX_CONCURRENT_TURNS:
+            _, waiter = self._waiters.popitem(last=False)
+            if not waiter.done():
+                self._active += 1
+                self._stats["admitted"] += 1
+                waiter.set_result(True)
+
+    def _estimated_wait(self) -> float:
+        queued = len(self._waiters) + 1
+        return self._avg_turn_seconds * queued / max(1, CHAT_MAX_CONCURRENT_TURNS)
+
+    def _record_turn_duration(self, seconds: float) -> None:
+        self._avg_turn_seconds = 0.9 * self._avg_turn_seconds + 0.1 * seconds
+
+    async def admit(self, user_id: Optional[str]) -> TurnSlot:
+        """Rate check, then a global slot; the caller releases it when the turn ends."""
+        self.check_rate(user_id)
+        return await self.acquire_turn()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "active_turns": self._active,
+            "queued_turns": len(self._waiters),
+            "max_concurrent_turns": CHAT_MAX_CONCURRENT_TURNS,
+            "max_queued_turns": CHAT_MAX_QUEUED_TURNS,
+            "rate_burst": CHAT_RATE_BURST,
+            "rate_per_minute": CHAT_RATE_PER_MINUTE,
+            "avg_turn_seconds": round(self._avg_turn_seconds, 2),
+            "heavy_tools": heavy_tool_stats(),
+        }
+
+
+# -- heavy tool ceiling ---------------------------------------------------------------
+
+_heavy_slots = threading.BoundedSemaphore(HEAVY_TOOL_CONCURRENCY)
+_heavy_lock = threading.Lock()
+_heavy_stats = {"running": 0, "waiting": 0, "runs": 0, "waited_runs": 0, "total_wait_seconds": 0.0}
+
+
+def run_heavy(tool_name: str, run, *args, **kwargs):
+    """Run a heavy tool call once one of the HEAVY_TOOL_CONCURRENCY slots is free."""
+    queued_at = time.perf_counter()
+    with _heavy_lock:
+        _heavy_stats["waiting"] += 1
+    with span("tool.heavy_slot_wait", tool=tool_name):
+        _heavy_slots.acquire()
+    waited = time.perf_counter() - queued_at
+    with _heavy_lock:
+        _heavy_stats["waiting"] -= 1
+        _heavy_stats["running"] += 1
+        _heavy_stats["runs"] += 1
+        _heavy_stats["total_wait_seconds"] += waited
+        _heavy_stats["waited_runs"] += waited > 0.001
+    try:
+        return run(*args, **kwargs)
+    finally:
+        with _heavy_lock:
+            _heavy_stats["running"] -= 1
+        _heavy_slots.release()
+
+
+def instrument_heavy_tools() -> None:
+    """Put run() of the HEAVY_TOOLS classes behind the heavy-work ceiling."""
+    from agency_swarm.tools import BaseTool
+
+    pending = list(BaseTool.__subclasses__())
+    while pending:
+        tool_class = pending.pop()
+        pending.extend(tool_class.__subclasses__())
+        run = tool_class.__dict__.get("run")
+        if tool_class.__name__ not in HEAVY_TOOLS or run is None or getattr(run, "_heavy", False):
+            continue
+
+        def make_run(original, tool_name):
+            @functools.wraps(original)
+            def heavy_run(self, *args, **kwargs):
+                return run_heavy(tool_name, original, self, *args, **kwargs)
+            heavy_run._heavy = True
+            return heavy_run
+
+        tool_class.run = make_run(run, tool_class.__name__)
+
+
+def heavy_tool_stats() -> Dict[str, Any]:
+    with _heavy_lock:
+        stats = dict(_heavy_stats)
+    total_wait = stats.pop("total_wait_seconds")
+    stats["concurrency"] = HEAVY_TOOL_CONCURRENCY
+    stats["avg_wait_ms"] = round(total_wait / stats["runs"] * 1000, 1) if stats["runs"] else 0.0
+    return stats
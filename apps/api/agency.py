@@ -6,11 +6,23 @@ os.environ.setdefault("FASTMCP_DEPRECATION_WARNINGS", "false")
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-from dotenv import load_dotenv
+from environment import load_environment
+
+# Before agency_swarm and the tools read their settings (no-op when main.py already did)
+load_environment()
+
 from agency_swarm import Agency
 from menu_creator import menu_creator
+from tracing import setup_tracing
+from tool_profiling import instrument_tool_profiling
+from admission import instrument_heavy_tools
 
-load_dotenv()
+# Spans for tool runs, HTTP, Playwright and model calls (after the tools are imported)
+setup_tracing()
+# Per-call tool measurements and slow-call log (only with TOOL_PROFILING=true)
+instrument_tool_profiling()
+# Concurrent heavy tool runs (browser, PDF rendering) capped at HEAVY_TOOL_CONCURRENCY
+instrument_heavy_tools()
 
 
 def create_agency(load_threads_callback=None, save_threads_callback=None):
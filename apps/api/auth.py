@@ -2,6 +2,7 @@
 Authentication utilities for FastAPI JWT authentication.
 """
 import os
+import secrets
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -9,18 +10,7 @@ from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
-
-# Load environment variables
-from dotenv import load_dotenv
-load_dotenv()
-
-# Try to import Supabase client
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
-except ImportError:
-    SUPABASE_AVAILABLE = False
-    Client = None
+from thread_persistence import SUPABASE_AVAILABLE, get_supabase_client
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -33,6 +23,11 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))  # Default 24 hours
 
+# Users (Supabase user id, username or email) allowed to act on every restaurant's menus
+ADMIN_USERS = {u.strip() for u in os.getenv("ADMIN_USERS", "").split(",") if u.strip()}
+# Bearer token for metrics scrapers (/metrics*), as an alternative to an admin user's token
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
 
 class Token(BaseModel):
     """Token response model."""
@@ -143,6 +138,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
             
             if supabase_url and supabase_anon_key:
                 # Create client with anon key for user token validation
+                from supabase import create_client
                 user_supabase = create_client(supabase_url, supabase_anon_key)
                 
                 # Verify token and get user from Supabase Auth
@@ -178,26 +174,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     }
 
 
-def _get_supabase_client() -> Optional[Client]:
+def is_admin(user: dict) -> bool:
+    """Whether an authenticated user (from get_current_user) is listed in ADMIN_USERS."""
+    return any(user.get(key) in ADMIN_USERS for key in ("user_id", "username", "email") if user.get(key))
+
+
+async def require_metrics_access(token: str = Depends(oauth2_scheme)) -> None:
     """
-    Create Supabase client from environment variables.
-    
-    Returns:
-        Supabase Client if credentials available, None otherwise
+    Dependency for the /metrics endpoints (they expose thread ids, span attributes and tool
+    arguments): accepts the METRICS_TOKEN bearer token or the token of an admin user.
     """
-    if not SUPABASE_AVAILABLE:
-        return None
-    
-    supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL") or os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-    
-    if not supabase_url or not supabase_key:
-        return None
-    
-    try:
-        return create_client(supabase_url, supabase_key)
-    except Exception:
-        return None
+    if METRICS_TOKEN and secrets.compare_digest(token.encode("utf-8"), METRICS_TOKEN.encode("utf-8")):
+        return
+    user = await get_current_user(token)
+    if not is_admin(user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Metrics require an admin user or the metrics token")
 
 
 # Example user database (for local development only)
@@ -238,7 +229,7 @@ def get_user(username: str) -> Optional[UserInDB]:
         UserInDB object if found, None otherwise
     """
     # Try Supabase first (production mode)
-    supabase = _get_supabase_client()
+    supabase = get_supabase_client()
     if supabase:
         try:
             response = supabase.table("api_users").select("*").eq("username", username).single().execute()
@@ -0,0 +1,108 @@
+"""
+Load test: concurrent chat turns on one event loop (one uvicorn worker).
+
+Each simulated turn does what a /chat turn does around the model:
+create the agency (blocking thread-history load), wait for the model, run a blocking tool
+(Agency Swarm dispatches sync tools with asyncio.to_thread), wait for the model again and
+save the thread history (blocking, called from PersistenceHooks on the loop).
+
+"before": history load/save run on the event loop, tools on the default executor
+          (min(32, cpu_count + 4) threads).
+"after":  history load via asyncio.to_thread, saves via tool_runtime.background_save,
+          tools on the bounded tool pool installed by tool_runtime.install_tool_executor.
+
+Reports turns/s, p50/p95 turn latency and the worst event-loop lag (delay of a 10 ms ticker).
+
+Usage (from apps/api):
+    python benchmarks/concurrent_chats.py [concurrent_chats] [tool_seconds] [db_seconds]
+"""
+import sys
+import time
+import asyncio
+import statistics
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+
+import tool_runtime  # noqa: E402
+
+MODEL_SECONDS = 0.05
+
+
+def blocking_db_call(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+def blocking_tool(seconds: float) -> str:
+    time.sleep(seconds)
+    return "Screenshot saved"
+
+
+async def measure_loop_lag(stop: asyncio.Event, samples: list) -> None:
+    interval = 0.01
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def chat_turn(mode: str, tool_seconds: float, db_seconds: float) -> float:
+    started = time.perf_counter()
+    if mode == "before":
+        blocking_db_call(db_seconds)
+    else:
+        await asyncio.to_thread(blocking_db_call, db_seconds)
+
+    await asyncio.sleep(MODEL_SECONDS)
+    await asyncio.to_thread(blocking_tool, tool_seconds)
+    await asyncio.sleep(MODEL_SECONDS)
+
+    if mode == "before":
+        blocking_db_call(db_seconds)
+    else:
+        tool_runtime.background_save(lambda messages: blocking_db_call(db_seconds))([])
+    return time.perf_counter() - started
+
+
+async def run_scenario(mode: str, chats: int, tool_seconds: float, db_seconds: float) -> dict:
+    if mode == "after":
+        tool_runtime.install_tool_executor()
+
+    stop = asyncio.Event()
+    lag_samples: list = []
+    ticker = asyncio.create_task(measure_loop_lag(stop, lag_samples))
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(chat_turn(mode, tool_seconds, db_seconds) for _ in range(chats)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+    latencies = sorted(latencies)
+    return {
+        "turns_per_second": chats / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "max_loop_lag": max(lag_samples) if lag_samples else 0.0,
+    }
+
+
+def main() -> None:
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    tool_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    db_seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+
+    print(f"{chats} concurrent chats, tool {tool_seconds}s, thread load/save {db_seconds}s each\n")
+    for mode in ("before", "after"):
+        result = asyncio.run(run_scenario(mode, chats, tool_seconds, db_seconds))
+        print(
+            f"{mode:>6}: {result['turns_per_second']:6.1f} turns/s  "
+            f"p50 {result['p50']:.2f}s  p95 {result['p95']:.2f}s  "
+            f"max loop lag {result['max_loop_lag'] * 1000:.0f} ms"
+        )
+    tool_runtime.flush_background_saves()
+
+
+if __name__ == "__main__":
+    main()
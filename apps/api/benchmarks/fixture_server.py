@@ -0,0 +1,321 @@
+"""
+Local fixture server for the offline benchmarks.
+
+Serves a recorded restaurant website (benchmarks/fixtures/site: homepage, menu pages,
+stylesheet) plus generated binary fixtures (menu PDFs and images, built once with PyMuPDF and
+Pillow into cache/benchmarks/site), and a minimal PostgREST stand-in under /rest/v1/ so the
+Supabase client code paths of the tools run unchanged against local data.
+
+The PostgREST stand-in supports what the tools use: eq./in. filters, limit, top-level column
+selection with embedded resources returned as stored, PATCH (update) and POST (insert/upsert)
+with Prefer: return=representation|minimal.
+
+Usage:
+    python benchmarks/fixture_server.py                  # serve on a free port until Ctrl+C
+    python benchmarks/fixture_server.py record <url>     # record a live site into fixtures/<host>/
+"""
+import re
+import sys
+import json
+import uuid
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urljoin, urlparse
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+API_DIR = BENCHMARKS_DIR.parent
+FIXTURES_DIR = BENCHMARKS_DIR / "fixtures"
+SITE_DIR = FIXTURES_DIR / "site"
+GENERATED_DIR = API_DIR / "cache" / "benchmarks" / "site"
+
+# Any three dot-separated segments pass supabase-py's key format check
+FAKE_SERVICE_KEY = "benchmark.service.key"
+FIXTURE_RESTAURANT_ID = "00000000-0000-4000-8000-000000000001"
+FIXTURE_MENU_ID = "00000000-0000-4000-8000-000000000002"
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".json": "application/json",
+}
+
+
+# ---------------------------------------------------------------------------
+# Binary fixtures
+# ---------------------------------------------------------------------------
+
+def ensure_binary_fixtures() -> None:
+    """Build the PDF and image fixtures once (deterministic content)."""
+    files_dir = GENERATED_DIR / "files"
+    files_dir.mkdir(parents=True, exist_ok=True)
+
+    import fitz
+    from PIL import Image, ImageDraw
+
+    for name, pages in (("carta.pdf", 3), ("menu-vinos.pdf", 1)):
+        path = files_dir / name
+        if path.exists():
+            continue
+        document = fitz.open()
+        for page_number in range(pages):
+            page = document.new_page(width=595, height=842)
+            page.insert_text((72, 90), f"Casa Lola - {name} - página {page_number + 1}", fontsize=20)
+            for line in range(30):
+                page.insert_text((72, 140 + line * 20), f"Plato {page_number}-{line} ........ {8 + line % 12},50 EUR", fontsize=11)
+        document.save(str(path))
+        document.close()
+
+    for name, size, color in (("menu-postres.png", (1200, 1600), (253, 247, 238)), ("../hero.png", (1600, 900), (47, 62, 44)), ("../logo.png", (256, 256), (200, 85, 61))):
+        path = files_dir / name
+        if path.exists():
+            continue
+        image = Image.new("RGB", size, color)
+        draw = ImageDraw.Draw(image)
+        for row in range(0, size[1], 40):
+            draw.text((40, row), f"Casa Lola {name} {row}", fill=(31, 29, 26))
+        image.save(path, format="PNG", optimize=False)
+
+
+# ---------------------------------------------------------------------------
+# PostgREST stand-in
+# ---------------------------------------------------------------------------
+
+class FixtureDatabase:
+    """In-memory tables keyed by id."""
+
+    def __init__(self):
+        self.tables: Dict[str, Dict[str, Dict[str, Any]]] = {"menus": {}, "conversation_threads": {}}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def seed_menu(self, menu_id: str = FIXTURE_MENU_ID, categories: int = 8, items_per_category: int = 12) -> Dict[str, Any]:
+        """Store a menu row with its restaurant, categories and items embedded (PopulateMenuFromDB's select)."""
+        row = {
+            "id": menu_id,
+            "name": "Carta",
+            "restaurant_id": FIXTURE_RESTAURANT_ID,
+            "is_default": True,
+            "html_content": None,
+            "created_at": "2024-01-01T00:00:00+00:00",
+            "restaurant": {"name": "Casa Lola"},
+            "categories": [
+                {
+                    "id": f"cat-{c}",
+                    "name": f"Categoría {c}",
+                    "description": f"Selección de temporada {c}" if c % 2 == 0 else None,
+                    "position": c,
+                    "items": [
+                        {
+                            "id": f"item-{c}-{i}",
+                            "name": f"Plato {c}-{i}",
+                            "description": "Cocinado a fuego lento con verduras de temporada & hierbas",
+                            "price_cents": 850 + 75 * i,
+                            "currency": "EUR",
+                            "is_visible": True,
+                            "created_at": f"2024-01-01T00:{c:02d}:{i:02d}+00:00",
+                        }
+                        for i in range(items_per_category)
+                    ],
+                }
+                for c in range(categories)
+            ],
+        }
+        with self.lock:
+            self.tables["menus"][menu_id] = row
+        return row
+
+    @staticmethod
+    def _select_keys(select: str) -> Optional[List[str]]:
+        if not select or select == "*":
+            return None
+        keys, depth, token = [], 0, ""
+        for char in select + ",":
+            if char == "," and depth == 0:
+                token = token.strip()
+                if token:
+                    name = token.split("(")[0]
+                    keys.append(name.split(":")[0].strip())
+                token = ""
+                continue
+            depth += char == "("
+            depth -= char == ")"
+            token += char
+        return keys
+
+    @staticmethod
+    def _matches(row: Dict[str, Any], filters: List[tuple]) -> bool:
+        for column, operator, value in filters:
+            if operator == "eq" and str(row.get(column)).lower() != value.lower():
+                return False
+            if operator == "in" and str(row.get(column)) not in value.strip("()").split(","):
+                return False
+        return True
+
+    def query(self, method: str, table: str, params: List[tuple], body: Any) -> List[Dict[str, Any]]:
+        with self.lock:
+            self.requests += 1
+            rows = self.tables.setdefault(table, {})
+            filters, select, limit = [], None, None
+            for key, value in params:
+                if key == "select":
+                    select = value
+                elif key == "limit":
+                    limit = int(value)
+                elif key in ("order", "on_conflict", "columns") or "." in key:
+                    # ordering / embedded filters: fixture data is stored in the expected order
+                    continue
+                elif "." in value:
+                    operator, operand = value.split(".", 1)
+                    filters.append((key, operator, operand))
+
+            if method == "GET":
+                keys = self._select_keys(select)
+                result = []
+                for row in rows.values():
+                    if not self._matches(row, filters):
+                        continue
+                    if keys is None:
+                        result.append({k: v for k, v in row.items() if not isinstance(v, (dict, list)) or k == "thread_data"})
+                    else:
+                        result.append({k: row.get(k) for k in keys if k in row})
+                return result[:limit] if limit is not None else result
+
+            if method == "PATCH":
+                updated = []
+                for row in rows.values():
+                    if self._matches(row, filters):
+                        row.update(body)
+                        updated.append({k: v for k, v in row.items() if not isinstance(v, (dict, list))})
+                return updated
+
+            if method == "POST":
+                written = []
+                for record in body if isinstance(body, list) else [body]:
+                    record_id = record.get("id") or str(uuid.uuid4())
+                    row = rows.setdefault(record_id, {"id": record_id})
+                    row.update(record)
+                    written.append({k: v for k, v in row.items() if not isinstance(v, (dict, list))})
+                return written
+
+            if method == "DELETE":
+                deleted = [row_id for row_id, row in rows.items() if self._matches(row, filters)]
+                return [rows.pop(row_id) for row_id in deleted]
+        return []
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    server_version = "MenooFixtures/1.0"
+    database: FixtureDatabase = None  # set by start_fixture_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _rest(self) -> None:
+        parsed = urlparse(self.path)
+        table = parsed.path[len("/rest/v1/"):].strip("/")
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"null") if length else None
+        rows = self.database.query(self.command, table, parse_qsl(parsed.query, keep_blank_values=True), body)
+
+        if "return=minimal" in (self.headers.get("Prefer") or "") and self.command != "GET":
+            self.send_response(204)
+            self.end_headers()
+            return
+        self._send(200 if self.command == "GET" else 201, json.dumps(rows).encode("utf-8"), "application/json")
+
+    def _static(self) -> None:
+        relative = urlparse(self.path).path.lstrip("/") or "index.html"
+        for base in (SITE_DIR, GENERATED_DIR):
+            path = (base / relative).resolve()
+            if path.is_dir():
+                path = path / "index.html"
+            if str(path).startswith(str(base.resolve())) and path.is_file():
+                self._send(200, path.read_bytes(), CONTENT_TYPES.get(path.suffix.lower(), "application/octet-stream"))
+                return
+        self._send(404, b"Not found", "text/plain")
+
+    def do_GET(self):
+        self._rest() if self.path.startswith("/rest/v1/") else self._static()
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        self._rest()
+
+    def do_PATCH(self):
+        self._rest()
+
+    def do_DELETE(self):
+        self._rest()
+
+
+def start_fixture_server(database: Optional[FixtureDatabase] = None):
+    """Start the server on a free local port in a daemon thread. Returns (server, base_url, database)."""
+    ensure_binary_fixtures()
+    database = database or FixtureDatabase()
+    handler = type("BoundFixtureHandler", (FixtureHandler,), {"database": database})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", database
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+ASSET_PATTERN = re.compile(r"""(?:href|src)=["']([^"'#]+\.(?:css|pdf|png|jpe?g|webp|gif))["']""", re.IGNORECASE)
+
+
+def record_site(url: str) -> Path:
+    """Save a live homepage and its same-site stylesheets, PDFs and images as a fixture directory."""
+    import requests
+
+    origin = urlparse(url)
+    target = FIXTURES_DIR / origin.netloc.replace(":", "_")
+    target.mkdir(parents=True, exist_ok=True)
+
+    html = requests.get(url, timeout=15).text
+    for asset in sorted(set(ASSET_PATTERN.findall(html))):
+        asset_url = urljoin(url, asset)
+        parsed = urlparse(asset_url)
+        if parsed.netloc != origin.netloc:
+            continue
+        destination = target / parsed.path.lstrip("/")
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            destination.write_bytes(requests.get(asset_url, timeout=30).content)
+        except Exception as e:
+            print(f"Skipped {asset_url}: {e}")
+            continue
+        # Serve the asset from the fixture server instead of the live origin
+        html = html.replace(asset_url, "/" + parsed.path.lstrip("/"))
+
+    (target / "index.html").write_text(html, encoding="utf-8")
+    return target
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "record":
+        print(f"Recorded into {record_site(sys.argv[2])}")
+        sys.exit(0)
+
+    fixture_server, base_url, fixture_db = start_fixture_server()
+    fixture_db.seed_menu()
+    print(f"Serving fixtures on {base_url} (Supabase URL: {base_url}, key: {FAKE_SERVICE_KEY})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fixture_server.shutdown()
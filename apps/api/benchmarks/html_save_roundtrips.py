@@ -0,0 +1,133 @@
+"""
+Benchmark: database round trips per menu HTML save.
+
+Compares the old "verify menu, then try every candidate column" pattern with the shared
+single UPDATE ... RETURNING helper in menu_creator/tools/html_storage.py. Uses an in-memory
+stand-in for the Supabase client that counts every executed request, so it runs offline.
+
+Usage:
+    python benchmarks/html_save_roundtrips.py [saves]
+"""
+import sys
+import importlib.util
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+
+def load_module(name: str, relative_path: str):
+    """Load a tool module by path (avoids importing agency_swarm through the package)."""
+    spec = importlib.util.spec_from_file_location(name, API_DIR / relative_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+html_storage = load_module("html_storage", "menu_creator/tools/html_storage.py")
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class CountingQuery:
+    """Minimal PostgREST-like query builder over a single in-memory menus table."""
+
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.operation = None
+        self.columns = "*"
+        self.payload = None
+        self.filters = {}
+        self.row_limit = None
+        self.single_row = False
+        self.returning = None
+
+    def select(self, *columns):
+        if self.operation == "update":
+            # Columns returned by the write (PostgREST ?select= on a PATCH)
+            self.returning = columns
+            return self
+        self.operation, self.columns = "select", ", ".join(columns) or "*"
+        return self
+
+    def update(self, payload):
+        self.operation, self.payload = "update", payload
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def _check_columns(self, names):
+        for name in names:
+            if name != "*" and name not in self.client.columns:
+                raise Exception(f"column menus.{name} does not exist")
+
+    def execute(self):
+        self.client.round_trips += 1
+        rows = [r for r in self.client.rows if all(r.get(k) == v for k, v in self.filters.items())]
+        if self.operation == "select":
+            self._check_columns(c.strip() for c in self.columns.split(","))
+            if self.row_limit is not None:
+                rows = rows[:self.row_limit]
+            return _Response(rows[0] if self.single_row and rows else rows)
+        self._check_columns(self.payload.keys())
+        for row in rows:
+            row.update(self.payload)
+        if self.returning is None:
+            return _Response([dict(r) for r in rows])
+        return _Response([{c: r[c] for c in self.returning} for r in rows])
+
+
+class CountingClient:
+    def __init__(self, columns):
+        self.columns = set(columns)
+        self.rows = [{c: None for c in columns} | {"id": "menu-1", "name": "Demo"}]
+        self.round_trips = 0
+
+    def table(self, name):
+        return CountingQuery(self, name)
+
+
+def legacy_save(supabase, menu_id, html, field_name="html_content"):
+    """The pre-change pattern: verify the menu, then try each candidate column in turn."""
+    supabase.table("menus").select("id, name").eq("id", menu_id).single().execute()
+    for name in [field_name, "html_content", "html", "menu_html"]:
+        try:
+            if supabase.table("menus").update({name: html}).eq("id", menu_id).execute().data:
+                return name
+        except Exception:
+            continue
+    return None
+
+
+def run(saves: int = 20):
+    html = "<html><head></head><body>" + "x" * 1000 + "</body></html>"
+    print(f"Round trips for {saves} saves")
+    print(f"{'schema column':<16}{'before':>10}{'after':>10}{'per save (after)':>20}")
+    for column in ["html_content", "html", "menu_html"]:
+        legacy_client = CountingClient(["id", "name", "restaurant_id", column])
+        for _ in range(saves):
+            legacy_save(legacy_client, "menu-1", html)
+
+        html_storage.forget_html_column()
+        client = CountingClient(["id", "name", "restaurant_id", column])
+        for _ in range(saves):
+            html_storage.save_menu_html(client, "menu-1", html)
+
+        print(f"{column:<16}{legacy_client.round_trips:>10}{client.round_trips:>10}{client.round_trips / saves:>20.2f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,164 @@
+"""
+Import-time budget check for the API server (cold start on Cloud Run).
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter, parses the report and
+fails when:
+- the total import time (median over --repeat runs) exceeds the budget, or
+- a module that must load lazily (agency_swarm, the Agents SDK, Supabase, the tools' HTML,
+  image and browser libraries) is imported by `import main`.
+
+With --health it also starts uvicorn and measures the time until /health reports ready, which
+includes the startup warm-up (run with WARMUP_ENABLED=false to time imports and startup only).
+
+Usage (from apps/api):
+    python benchmarks/import_budget.py                       # budget from IMPORT_BUDGET_MS (800)
+    python benchmarks/import_budget.py --budget-ms 600 --top 15
+    python benchmarks/import_budget.py --health --health-budget-ms 2000
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "800"))
+
+# Loaded on first agency creation / tool call, never by `import main`
+LAZY_MODULES = [
+    "agency_swarm",
+    "agents",
+    "openai",
+    "menu_creator",
+    "supabase",
+    "postgrest",
+    "bs4",
+    "requests",
+    "PIL",
+    "fitz",
+    "chevron",
+    "playwright",
+]
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Rows of `-X importtime` output: module, depth, self and cumulative time in ms."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            rows.append({
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            })
+        except ValueError:
+            continue
+    return rows
+
+
+def profile_import(module: str) -> List[Dict[str, Any]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=API_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def time_to_health(timeout: float = 60.0) -> float:
+    """Seconds from spawning uvicorn until /health answers 200 (after the warm-up)."""
+    import urllib.request
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=API_DIR,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise SystemExit("uvicorn exited before answering /health")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise SystemExit(f"/health did not answer within {timeout:.0f}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check the import-time budget of the API server.")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters to profile (median total)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--health", action="store_true", help="Also measure time until /health reports ready")
+    parser.add_argument("--health-budget-ms", type=float, default=None)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    runs = [profile_import(args.module) for _ in range(max(1, args.repeat))]
+    totals = [sum(row["cumulative_ms"] for row in rows if row["depth"] == 0) for rows in runs]
+    rows = runs[totals.index(statistics.median_low(totals))]
+    imported = {row["module"] for row in rows}
+
+    top_level = sorted((r for r in rows if r["depth"] == 0), key=lambda r: r["cumulative_ms"], reverse=True)
+    by_self = sorted(rows, key=lambda r: r["self_ms"], reverse=True)
+    report: Dict[str, Any] = {
+        "module": args.module,
+        "total_ms": round(statistics.median(totals), 1),
+        "budget_ms": args.budget_ms,
+        "modules_imported": len(rows),
+        "top_cumulative": [{"module": r["module"], "ms": round(r["cumulative_ms"], 1)} for r in top_level[:args.top]],
+        "top_self": [{"module": r["module"], "ms": round(r["self_ms"], 1)} for r in by_self[:args.top]],
+        "eager_lazy_modules": [m for m in LAZY_MODULES if m in imported],
+    }
+    if args.health:
+        report["time_to_health_ms"] = round(time_to_health() * 1000, 1)
+
+    failures = []
+    if report["total_ms"] > args.budget_ms:
+        failures.append(f"import {args.module} took {report['total_ms']} ms (budget {args.budget_ms:.0f} ms)")
+    if report["eager_lazy_modules"]:
+        failures.append(f"imported eagerly: {', '.join(report['eager_lazy_modules'])}")
+    if args.health_budget_ms is not None and report.get("time_to_health_ms", 0) > args.health_budget_ms:
+        failures.append(f"/health ready after {report['time_to_health_ms']} ms (budget {args.health_budget_ms:.0f} ms)")
+    report["failures"] = failures
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import {args.module}: {report['total_ms']} ms (budget {args.budget_ms:.0f} ms), {report['modules_imported']} modules")
+        print("\nSlowest top-level imports (cumulative):")
+        for entry in report["top_cumulative"]:
+            print(f"  {entry['ms']:>8.1f} ms  {entry['module']}")
+        print("\nSlowest modules (self):")
+        for entry in report["top_self"]:
+            print(f"  {entry['ms']:>8.1f} ms  {entry['module']}")
+        if "time_to_health_ms" in report:
+            print(f"\nTime until /health is ready: {report['time_to_health_ms']} ms")
+        for failure in failures:
+            print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+End-to-end load test for the FastAPI service (main.app) with a scripted model backend.
+
+The service runs in a child process under uvicorn, exactly as deployed, except that:
+- the MenuCreator agent's model is a deterministic ScriptedModel (Agents SDK Model interface)
+  that calls one tool (ReadHTMLPart on the menu in context by default), then streams a reply
+- Supabase points at the fixture server's PostgREST stand-in (thread persistence and tools)
+- a /__loadtest/stats route reports RSS, len(_agencies) and event-loop lag
+
+The parent drives concurrent conversations (several turns each, own thread_id) through /chat
+or /chat/stream and reports throughput, p50/p95/p99 turn latency (and time to first text for
+streams), memory growth per agency and event-loop lag.
+
+Usage (from apps/api):
+    python benchmarks/load_test.py --conversations 50 --concurrency 20 --turns 3 --endpoint stream
+    python benchmarks/load_test.py --model-latency 0.5 --tool ""      # no tool calls
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+API_DIR = BENCHMARKS_DIR.parent
+sys.path.insert(0, str(API_DIR))
+sys.path.insert(0, str(BENCHMARKS_DIR))
+
+LOAD_TEST_JWT_SECRET = "load-test-secret"
+
+
+# ---------------------------------------------------------------------------
+# Server side (child process)
+# ---------------------------------------------------------------------------
+
+def build_scripted_model(latency: float, tool_name: str, tool_arguments: str, reply: str):
+    """Agents SDK model that scripts one tool call per user message, then a text reply."""
+    from agents.items import ModelResponse
+    from agents.models.interface import Model
+    from agents.usage import Usage
+    from openai.types.responses import (
+        Response,
+        ResponseCompletedEvent,
+        ResponseFunctionToolCall,
+        ResponseOutputMessage,
+        ResponseOutputText,
+        ResponseTextDeltaEvent,
+    )
+
+    def item_field(item: Any, key: str) -> Any:
+        return item.get(key) if isinstance(item, dict) else getattr(item, key, None)
+
+    class ScriptedModel(Model):
+        def _next_output(self, model_input) -> List[Any]:
+            items = model_input if isinstance(model_input, list) else [{"role": "user", "content": model_input}]
+            tool_called = False
+            for item in reversed(items):
+                if item_field(item, "role") == "user":
+                    break
+                if item_field(item, "type") == "function_call_output":
+                    tool_called = True
+            if tool_name and not tool_called:
+                return [ResponseFunctionToolCall(
+                    type="function_call", id=f"fc_{uuid.uuid4().hex[:16]}", call_id=f"call_{uuid.uuid4().hex[:16]}",
+                    name=tool_name, arguments=tool_arguments, status="completed",
+                )]
+            return [ResponseOutputMessage(
+                id=f"msg_{uuid.uuid4().hex[:16]}", type="message", role="assistant", status="completed",
+                content=[ResponseOutputText(type="output_text", text=reply, annotations=[])],
+            )]
+
+        async def get_response(self, system_instructions, input, model_settings, tools, output_schema,
+                               handoffs, tracing, *, previous_response_id=None, conversation_id=None, prompt=None):
+            await asyncio.sleep(latency)
+            return ModelResponse(output=self._next_output(input), usage=Usage(requests=1), response_id=None)
+
+        async def stream_response(self, system_instructions, input, model_settings, tools, output_schema,
+                                  handoffs, tracing, *, previous_response_id=None, conversation_id=None, prompt=None):
+            await asyncio.sleep(latency)
+            output = self._next_output(input)
+            sequence = 0
+            if output[0].type == "message":
+                for word in reply.split(" "):
+                    yield ResponseTextDeltaEvent(
+                        type="response.output_text.delta", item_id=output[0].id, output_index=0,
+                        content_index=0, delta=word + " ", logprobs=[], sequence_number=sequence,
+                    )
+                    sequence += 1
+                    await asyncio.sleep(0)
+            response = Response.model_construct(
+                id=f"resp_{uuid.uuid4().hex[:16]}", created_at=time.time(), model="scripted", object="response",
+                output=output, tool_choice="auto", tools=[], parallel_tool_calls=False, top_p=None, usage=None,
+            )
+            yield ResponseCompletedEvent(type="response.completed", response=response, sequence_number=sequence)
+
+    return ScriptedModel()
+
+
+def serve(args) -> None:
+    """Child process: main.app with the scripted model and a stats route."""
+    import uvicorn
+    import main
+    from menu_creator import menu_creator
+
+    menu_creator.model = build_scripted_model(args.model_latency, args.tool, args.tool_arguments, args.reply)
+
+    lag_samples: List[float] = []
+
+    async def monitor_loop_lag():
+        interval = 0.01
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag_samples.append(time.perf_counter() - started - interval)
+
+    @main.app.on_event("startup")
+    async def start_lag_monitor():
+        main._background_tasks.add(asyncio.create_task(monitor_loop_lag()))
+
+    @main.app.get("/__loadtest/stats")
+    async def load_test_stats(reset: bool = False):
+        samples = sorted(lag_samples)
+        if reset:
+            lag_samples.clear()
+        with open("/proc/self/statm") as f:
+            rss_kb = int(f.read().split()[1]) * (os.sysconf("SC_PAGE_SIZE") // 1024)
+        return {
+            "rss_kb": rss_kb,
+            "agencies": len(main._agencies),
+            "loop_lag_ms": {
+                "p50": round(samples[len(samples) // 2] * 1000, 2) if samples else 0.0,
+                "p99": round(samples[int(0.99 * (len(samples) - 1))] * 1000, 2) if samples else 0.0,
+                "max": round(samples[-1] * 1000, 2) if samples else 0.0,
+            },
+        }
+
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# ---------------------------------------------------------------------------
+# Load generator (parent process)
+# ---------------------------------------------------------------------------
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else 0.0
+
+
+async def run_turn(client, endpoint: str, thread_id: str, menu_id: str, message: str) -> Dict[str, Any]:
+    payload = {"message": message, "thread_id": thread_id, "menu_id": menu_id}
+    started = time.perf_counter()
+    first_text = None
+    if endpoint == "chat":
+        response = await client.post("/chat", json=payload)
+        ok = response.status_code == 200
+    else:
+        ok = False
+        async with client.stream("POST", "/chat/stream", json=payload) as response:
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                if event.get("type") == "text_delta" and first_text is None:
+                    first_text = time.perf_counter() - started
+                elif event.get("type") == "done":
+                    ok = True
+                elif event.get("type") == "error":
+                    break
+    return {"ok": ok, "status": response.status_code, "latency": time.perf_counter() - started, "first_text": first_text}
+
+
+async def drive(args, base_url: str, token: str, menu_id: str) -> Dict[str, Any]:
+    import httpx
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    turns: List[Dict[str, Any]] = []
+
+    async def conversation(client, index: int):
+        async with semaphore:
+            thread_id = f"loadtest-{uuid.uuid4().hex[:12]}"
+            for turn in range(args.turns):
+                turns.append(await run_turn(client, args.endpoint, thread_id, menu_id, f"Mensaje {turn} de la conversación {index}"))
+
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=300, limits=limits) as client:
+        before = (await client.get("/__loadtest/stats", params={"reset": True})).json()
+        started = time.perf_counter()
+        await asyncio.gather(*(conversation(client, i) for i in range(args.conversations)))
+        elapsed = time.perf_counter() - started
+        after = (await client.get("/__loadtest/stats")).json()
+
+    latencies = [t["latency"] for t in turns if t["ok"]]
+    first_texts = [t["first_text"] for t in turns if t["first_text"] is not None]
+    new_agencies = after["agencies"] - before["agencies"]
+    return {
+        "turns": len(turns),
+        "failed": sum(not t["ok"] for t in turns),
+        "failed_by_status": {str(s): sum(not t["ok"] and t["status"] == s for t in turns) for s in {t["status"] for t in turns if not t["ok"]}},
+        "elapsed_s": round(elapsed, 2),
+        "turns_per_second": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {p: round(percentile(latencies, q) * 1000, 1) for p, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+        "first_text_ms": {p: round(percentile(first_texts, q) * 1000, 1) for p, q in (("p50", 0.5), ("p95", 0.95))} if first_texts else None,
+        "agencies": {"before": before["agencies"], "after": after["agencies"]},
+        "rss_growth_kb": after["rss_kb"] - before["rss_kb"],
+        "rss_per_new_agency_kb": round((after["rss_kb"] - before["rss_kb"]) / new_agencies, 1) if new_agencies else None,
+        "loop_lag_ms": after["loop_lag_ms"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test main.app with a scripted model backend.")
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3, help="Messages per conversation")
+    parser.add_argument("--endpoint", choices=("chat", "stream"), default="stream")
+    parser.add_argument("--model-latency", type=float, default=0.2, help="Seconds per scripted model call")
+    parser.add_argument("--tool", default="ReadHTMLPart", help="Tool the model calls once per message ('' for none)")
+    parser.add_argument("--tool-arguments", default=json.dumps({"part": "header"}))
+    parser.add_argument("--reply", default="Listo, he revisado la cabecera del menú y todo está correcto.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    from fixture_server import FAKE_SERVICE_KEY, FIXTURE_MENU_ID, start_fixture_server
+    from mobile_hardening import generate_menu_html
+
+    fixture_server, fixture_url, database = start_fixture_server()
+    database.seed_menu()["html_content"] = generate_menu_html(8, 12)
+
+    env = dict(
+        os.environ,
+        NEXT_PUBLIC_SUPABASE_URL=fixture_url,
+        SUPABASE_SERVICE_ROLE_KEY=FAKE_SERVICE_KEY,
+        NEXT_PUBLIC_SUPABASE_ANON_KEY="",
+        SUPABASE_ANON_KEY="",
+        JWT_SECRET_KEY=LOAD_TEST_JWT_SECRET,
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-load-test"),
+        OPENAI_AGENTS_DISABLE_TRACING="1",
+    )
+    # Every conversation runs as the same user: lift the per-user rate limit (admission.py)
+    # unless the caller sets one, so the test measures the service rather than the limiter
+    env.setdefault("CHAT_RATE_BURST", "100000")
+    env.setdefault("CHAT_RATE_PER_MINUTE", "1000000")
+    os.environ["JWT_SECRET_KEY"] = LOAD_TEST_JWT_SECRET
+    from auth import create_access_token
+    token = create_access_token({"sub": "loadtest", "user_id": "loadtest"})
+
+    child = subprocess.Popen([sys.executable, __file__, "--serve", *sys.argv[1:]], cwd=API_DIR, env=env)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        import httpx
+        deadline = time.time() + 60
+        while True:
+            try:
+                if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if child.poll() is not None or time.time() > deadline:
+                raise SystemExit("Server did not start")
+            time.sleep(0.2)
+
+        report = asyncio.run(drive(args, base_url, token, FIXTURE_MENU_ID))
+        report["db_requests"] = database.requests
+        print(json.dumps(report, indent=2))
+    finally:
+        child.terminate()
+        child.wait(timeout=10)
+        fixture_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: ensure_mobile_optimized_html on large generated menus.
+
+Compares the lexical fast path with the tree-based (BeautifulSoup) hardening used before,
+for documents that still need hardening and for documents that are already hardened, and
+checks that already-hardened documents come back byte-identical (including heads whose
+scripts, styles or comments contain viewport metas or the baseline marker as plain text).
+
+Usage (from apps/api):
+    python benchmarks/mobile_hardening.py [categories] [items_per_category]
+"""
+import sys
+import time
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from menu_creator.tools.SaveHTMLFile import (  # noqa: E402
+    MOBILE_BASELINE_MARKER,
+    MOBILE_VIEWPORT_CONTENT,
+    ensure_mobile_optimized_html,
+    _ensure_mobile_optimized_html_tree,
+)
+
+# Heads where a viewport meta or the baseline marker only appears inside raw text
+RAW_TEXT_HEADS = [
+    '<script>var s=\'<meta name="viewport" content="x">\';</script>',
+    '<!-- <meta name="viewport" content="x"> -->',
+    f'<style>/* {MOBILE_BASELINE_MARKER} */</style><script>// </head> <meta name="viewport"></script>',
+    f"<script>var marker = '{MOBILE_BASELINE_MARKER}';</script><style>body {{ color: red; }}</style>",
+]
+
+
+def generate_menu_html(categories: int, items_per_category: int) -> str:
+    """Build a realistic menu document (no viewport, no baseline CSS)."""
+    sections = []
+    for c in range(categories):
+        items = "".join(
+            f'<li class="menu-item"><span class="item-name">Dish {c}-{i}</span>'
+            f'<p class="item-description">Slow-cooked with seasonal vegetables &amp; herbs ({c}/{i})</p>'
+            f'<span class="item-price">{10 + i % 15}.50 €</span></li>\n'
+            for i in range(items_per_category)
+        )
+        sections.append(f'<section class="menu-section"><h2>Category {c}</h2><ul>\n{items}</ul></section>\n')
+    return (
+        "<!DOCTYPE html>\n<html lang=\"es\">\n<head>\n<meta charset=\"utf-8\">\n<title>Menu</title>\n"
+        "<style>\nbody { font-family: Georgia, serif; }\n.menu-item { display: flex; }\n</style>\n</head>\n"
+        f"<body>\n<header><h1>Restaurant</h1></header>\n<main>\n{''.join(sections)}</main>\n"
+        "<footer>Prices include VAT</footer>\n</body>\n</html>\n"
+    )
+
+
+def time_call(func, html: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(html)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(categories: int = 40, items_per_category: int = 30, repeat: int = 20):
+    raw_html = generate_menu_html(categories, items_per_category)
+    hardened_html = ensure_mobile_optimized_html(raw_html)
+
+    print(f"Menu: {categories} categories x {items_per_category} items, {len(raw_html) / 1024:.0f} KB")
+    print(f"{'document':<20}{'tree (ms)':>12}{'fast (ms)':>12}{'speedup':>10}")
+    for label, html in [("needs hardening", raw_html), ("already hardened", hardened_html)]:
+        tree_ms = time_call(_ensure_mobile_optimized_html_tree, html, repeat)
+        fast_ms = time_call(ensure_mobile_optimized_html, html, repeat)
+        print(f"{label:<20}{tree_ms:>12.2f}{fast_ms:>12.2f}{tree_ms / fast_ms:>9.0f}x")
+
+    identical = ensure_mobile_optimized_html(hardened_html) == hardened_html
+    for head in RAW_TEXT_HEADS:
+        hardened = ensure_mobile_optimized_html(f"<html><head>{head}</head><body>x</body></html>")
+        viewport = BeautifulSoup(hardened, "html.parser").head.find("meta", attrs={"name": "viewport"})
+        identical = (
+            identical
+            and viewport is not None
+            and viewport.get("content") == MOBILE_VIEWPORT_CONTENT
+            and MOBILE_BASELINE_MARKER in hardened.split("</style>")[0]
+            and ensure_mobile_optimized_html(hardened) == hardened
+        )
+    print(f"\nAlready-hardened output byte-identical: {identical}")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
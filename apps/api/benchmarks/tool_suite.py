@@ -0,0 +1,227 @@
+"""
+Offline benchmark suite for the menu_creator tools.
+
+Runs the tools against the local fixture server (benchmarks/fixture_server.py): a recorded
+restaurant site with stylesheets, PDFs and images, and a PostgREST stand-in that the tools'
+Supabase clients talk to. No network access or credentials are needed.
+
+For every case it reports median/min latency over the repeats, peak Python allocations
+(tracemalloc, measured on a separate run), RSS growth and output size, and writes the results
+to benchmarks/results/<git-sha>.json so baselines can be compared across commits.
+
+Cases that need a Playwright browser report their error output when Chromium is not installed.
+
+Usage (from apps/api):
+    python benchmarks/tool_suite.py [--repeat 5] [--only FindMenuFiles,ReadHTMLPart]
+    python benchmarks/tool_suite.py --compare benchmarks/results/<baseline-sha>.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+API_DIR = BENCHMARKS_DIR.parent
+sys.path.insert(0, str(API_DIR))
+sys.path.insert(0, str(BENCHMARKS_DIR))
+
+from fixture_server import (  # noqa: E402
+    FAKE_SERVICE_KEY,
+    FIXTURE_MENU_ID,
+    FIXTURES_DIR,
+    GENERATED_DIR,
+    start_fixture_server,
+)
+
+RESULTS_DIR = BENCHMARKS_DIR / "results"
+BENCHMARK_HTML_FILENAME = "benchmark-menu.html"
+BENCHMARK_TEMPLATE_FILENAME = "benchmark-template.html"
+
+
+class FixtureContext:
+    """Stand-in for the agency run context (tools call .get/.set on it)."""
+
+    def __init__(self, **values):
+        self.values = dict(values)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+def _rss_kb() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * (os.sysconf("SC_PAGE_SIZE") // 1024)
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _output_size(result: Any) -> int:
+    if isinstance(result, str):
+        return len(result.encode("utf-8"))
+    if isinstance(result, (list, tuple)):
+        return sum(_output_size(part) for part in result)
+    return len(str(result).encode("utf-8"))
+
+
+def _outcome(result: Any) -> str:
+    text = result if isinstance(result, str) else ""
+    return "error" if text.lstrip().lower().startswith("error") else "ok"
+
+
+def build_cases(base_url: str) -> List[Tuple[str, Callable[[], Any]]]:
+    """Benchmark cases: (name, factory returning a ready-to-run tool instance)."""
+    from menu_creator.tools.FindMenuFiles import FindMenuFiles
+    from menu_creator.tools.AnalyzeWebsiteStyles import AnalyzeWebsiteStyles
+    from menu_creator.tools.TakeMenuScreenshots import TakeMenuScreenshots
+    from menu_creator.tools.UploadMenuImages import UploadMenuImages
+    from menu_creator.tools.PopulateMenuFromDB import PopulateMenuFromDB, CACHE_DIR
+    from menu_creator.tools.SaveHTMLFile import SaveHTMLFile
+    from menu_creator.tools.UpdateHTMLFile import UpdateHTMLFile
+    from menu_creator.tools.ReadHTMLPart import ReadHTMLPart
+    from menu_creator.tools.SaveMenuToDB import SaveMenuToDB
+    from mobile_hardening import generate_menu_html
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    (CACHE_DIR / BENCHMARK_TEMPLATE_FILENAME).write_text(
+        (FIXTURES_DIR / "menu_template.html").read_text(encoding="utf-8"), encoding="utf-8"
+    )
+    menu_html = generate_menu_html(12, 20)
+    image_paths = json.dumps([str(GENERATED_DIR / "files" / "menu-postres.png"), str(GENERATED_DIR / "hero.png")])
+    patch = json.dumps([
+        {"op": "edit_css_rule", "selector": ".menu-item", "css": "display: flex; gap: 1rem;"},
+        {"op": "insert_item", "selector": "section.menu-section ul", "html": "<li class=\"menu-item\">Nuevo plato</li>"},
+    ])
+
+    def with_context(tool, **values):
+        tool._context = FixtureContext(**values)
+        return tool
+
+    return [
+        ("FindMenuFiles", lambda: with_context(FindMenuFiles(website_url=f"{base_url}/", use_web_search=False))),
+        ("AnalyzeWebsiteStyles", lambda: with_context(AnalyzeWebsiteStyles(website_url=f"{base_url}/", take_screenshots=False))),
+        ("AnalyzeWebsiteStyles+screenshots", lambda: with_context(AnalyzeWebsiteStyles(website_url=f"{base_url}/", take_screenshots=True))),
+        ("TakeMenuScreenshots", lambda: with_context(TakeMenuScreenshots(menu_urls=json.dumps([{"url": f"{base_url}/carta.html", "type": "page"}])))),
+        ("UploadMenuImages", lambda: with_context(UploadMenuImages(image_paths=image_paths))),
+        ("PopulateMenuFromDB", lambda: with_context(PopulateMenuFromDB(menu_id=FIXTURE_MENU_ID, template_filename=BENCHMARK_TEMPLATE_FILENAME))),
+        ("SaveHTMLFile", lambda: with_context(SaveHTMLFile(html_content=menu_html, filename=BENCHMARK_HTML_FILENAME))),
+        ("ReadHTMLPart:sections", lambda: with_context(ReadHTMLPart(part="sections", filename=BENCHMARK_HTML_FILENAME))),
+        ("UpdateHTMLFile:patch", lambda: with_context(UpdateHTMLFile(patch_operations=patch, filename=BENCHMARK_HTML_FILENAME))),
+        ("SaveHTMLFile:db", lambda: with_context(SaveHTMLFile(html_content=menu_html, filename=BENCHMARK_HTML_FILENAME, menu_id=FIXTURE_MENU_ID))),
+        ("ReadHTMLPart:db", lambda: with_context(ReadHTMLPart(part="header", menu_id=FIXTURE_MENU_ID))),
+        ("SaveMenuToDB", lambda: with_context(SaveMenuToDB(menu_id=FIXTURE_MENU_ID, html_filename=BENCHMARK_HTML_FILENAME))),
+    ]
+
+
+def measure(factory: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Latency over `repeat` runs (after one warm-up), then one traced run for allocations."""
+    result = factory().run()  # warm-up: imports, caches, browser binaries
+    timings = []
+    rss_before = _rss_kb()
+    for _ in range(repeat):
+        tool = factory()
+        started = time.perf_counter()
+        result = tool.run()
+        timings.append(time.perf_counter() - started)
+    rss_delta = _rss_kb() - rss_before
+
+    tool = factory()
+    tracemalloc.start()
+    tool.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+        "min_ms": round(min(timings) * 1000, 2),
+        "peak_alloc_kb": round(peak / 1024, 1),
+        "rss_delta_kb": rss_delta,
+        "output_bytes": _output_size(result),
+        "outcome": _outcome(result),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: Dict[str, Any], baseline_path: Path) -> None:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    print(f"\nCompared with {baseline.get('revision')} ({baseline_path.name}):")
+    print(f"{'case':36} {'median ms':>22} {'peak alloc KB':>24} {'output bytes':>24}")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            print(f"{name:36} (new case)")
+            continue
+
+        def cell(key):
+            old, new = before.get(key) or 0, result.get(key) or 0
+            change = f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+            return f"{old:>8} → {new:<8} {change:>5}"
+
+        print(f"{name:36} {cell('median_ms'):>22} {cell('peak_alloc_kb'):>24} {cell('output_bytes'):>24}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the menu_creator tools.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="Comma-separated case names (prefix match)")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<git-sha>.json)")
+    parser.add_argument("--compare", help="Baseline results file to compare with")
+    args = parser.parse_args()
+
+    server, base_url, database = start_fixture_server()
+    database.seed_menu()
+    # Tools create their Supabase clients from these at call time
+    os.environ["NEXT_PUBLIC_SUPABASE_URL"] = base_url
+    os.environ["SUPABASE_SERVICE_ROLE_KEY"] = FAKE_SERVICE_KEY
+
+    cases = build_cases(base_url)
+    if args.only:
+        prefixes = [p.strip() for p in args.only.split(",")]
+        cases = [(name, factory) for name, factory in cases if any(name.startswith(p) for p in prefixes)]
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": {},
+    }
+    print(f"{'case':36} {'median ms':>10} {'min ms':>10} {'peak alloc KB':>14} {'RSS Δ KB':>9} {'output B':>10}  outcome")
+    for name, factory in cases:
+        requests_before = database.requests
+        result = measure(factory, args.repeat)
+        result["db_requests_per_run"] = round((database.requests - requests_before) / (args.repeat + 2), 1)
+        report["results"][name] = result
+        print(
+            f"{name:36} {result['median_ms']:>10} {result['min_ms']:>10} {result['peak_alloc_kb']:>14} "
+            f"{result['rss_delta_kb']:>9} {result['output_bytes']:>10}  {result['outcome']}"
+        )
+    server.shutdown()
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{report['revision']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(report, Path(args.compare))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Bulk menu regeneration: re-populate many menus with a template in one job.
+
+After a template or design change, every affected menu has to be re-rendered with
+PopulateMenuFromDB's data and saved like SaveMenuToDB does. This runner:
+- fetches menu data in batches (one embedded select per batch of menu_ids)
+- renders in a process pool (compiled template + fragment caches per worker)
+- writes each result with an UPDATE of the HTML column only, so menus deleted or renamed
+  while the job runs are not recreated or overwritten
+- reports progress and throughput, and records progress in a state file so a failed
+  or interrupted job resumes where it stopped
+
+The API runs it as a background job (POST /menus/regenerate, see jobs.py); only admins may
+regenerate menus of other users' restaurants.
+
+Usage:
+    python bulk_regenerate.py --template menu.html <menu_id> [<menu_id> ...]
+    python bulk_regenerate.py --template menu.html --ids-file menu_ids.txt --job-name redesign-2026
+"""
+import os
+import sys
+import re
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from environment import load_environment
+
+# Before the tool modules read their settings
+load_environment()
+
+from menu_creator.tools.PopulateMenuFromDB import (
+    CACHE_DIR,
+    PopulateMenuFromDB,
+    read_template,
+    render_template,
+)
+from menu_creator.tools.html_storage import resolve_html_column, save_menu_html
+from menu_creator.tools.html_index import db_source_key, invalidate_html_index
+from thread_persistence import get_supabase_client
+
+# State files for resumable jobs (not cache/jobs, which holds the background job snapshots)
+JOBS_DIR = Path(__file__).resolve().parent / "cache" / "regenerate_jobs"
+JOB_NAME_PATTERN = r"[A-Za-z0-9_-]{1,64}"
+
+BULK_FETCH_BATCH_SIZE = int(os.getenv("BULK_FETCH_BATCH_SIZE", "50"))
+BULK_RENDER_WORKERS = int(os.getenv("BULK_RENDER_WORKERS", str(os.cpu_count() or 2)))
+
+# Worker-process state (set once per worker by the pool initializer)
+_worker_template: Optional[Dict[str, str]] = None
+
+
+def _init_render_worker(template_content: str, template_hash: str) -> None:
+    global _worker_template
+    _worker_template = {"content": template_content, "hash": template_hash}
+
+
+def _render_menu(job: Dict) -> Dict:
+    """Render one menu in a worker process. Returns {"id", "html"} or {"id", "error"}."""
+    try:
+        html = render_template(_worker_template["content"], job["template_data"], _worker_template["hash"])
+        return {"id": job["id"], "html": html}
+    except Exception as e:
+        return {"id": job["id"], "error": str(e)}
+
+
+def _load_state(state_path: Path, template_hash: str) -> Dict:
+    """Load a job state file; a state recorded for a different template is discarded."""
+    if state_path.exists():
+        try:
+            state = json.loads(state_path.read_text(encoding="utf-8"))
+            if state.get("template_hash") == template_hash:
+                return state
+        except Exception:
+            pass
+    return {"template_hash": template_hash, "completed": [], "failed": {}}
+
+
+def _save_state(state_path: Path, state: Dict) -> None:
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = state_path.with_suffix(".tmp")
+    temp_path.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    os.replace(temp_path, state_path)
+
+
+def _owned_restaurant_ids(supabase, owner_user_id: str) -> set:
+    response = supabase.table("restaurants").select("id").eq("owner_user_id", owner_user_id).execute()
+    return {row["id"] for row in (response.data or [])}
+
+
+def run_bulk_regeneration(
+    menu_ids: List[str],
+    template_filename: str = "menu.html",
+    job_name: Optional[str] = None,
+    batch_size: int = BULK_FETCH_BATCH_SIZE,
+    workers: int = BULK_RENDER_WORKERS,
+    field_name: str = "html_content",
+    progress_callback: Optional[Callable[[Dict], None]] = None,
+    owner_user_id: Optional[str] = None,
+    stop_event: Optional[threading.Event] = None,
+) -> Dict:
+    """
+    Re-populate the given menus with a template and save them to the database.
+
+    Args:
+        menu_ids: Menus to regenerate (duplicates are ignored)
+        template_filename: Mustache template in cache/menus/ (same as PopulateMenuFromDB)
+        job_name: Name of the resumable job; menus completed by a previous run of the same
+            job and template are skipped
+        batch_size: Menus per fetch query
+        workers: Render processes (1 renders in-process)
+        field_name: Preferred HTML column (resolved like SaveMenuToDB)
+        progress_callback: Called with the progress dict after every batch
+        owner_user_id: Only regenerate menus of this user's restaurants (others are reported
+            as not found); None for all menus
+        stop_event: Checked between batches; when set, the job stops and can be resumed later
+
+    Returns:
+        Summary dict with counts, failures, elapsed time and throughput
+    """
+    if job_name is not None and not re.fullmatch(JOB_NAME_PATTERN, job_name):
+        raise ValueError(f"Invalid job name '{job_name}' (letters, digits, '-' and '_', at most 64)")
+
+    supabase = get_supabase_client()
+    if not supabase:
+        raise RuntimeError("Supabase credentials not found. Please set NEXT_PUBLIC_SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in .env")
+
+    template_path = CACHE_DIR / os.path.basename(template_filename)
+    if not template_path.exists():
+        raise FileNotFoundError(f"Template file not found: {template_path}")
+    template_content, template_hash = read_template(template_path)
+
+    column = resolve_html_column(supabase, field_name)
+    if not column:
+        raise RuntimeError("No HTML column found in menus table")
+    owned_restaurants = _owned_restaurant_ids(supabase, owner_user_id) if owner_user_id is not None else None
+
+    job_name = job_name or f"regenerate-{template_hash[:12]}"
+    state_path = JOBS_DIR / f"{job_name}.json"
+    state = _load_state(state_path, template_hash)
+    completed = set(state["completed"])
+
+    pending = [menu_id for menu_id in dict.fromkeys(menu_ids) if menu_id not in completed]
+    progress = {
+        "job_name": job_name,
+        "total": len(pending) + len(completed & set(menu_ids)),
+        "skipped_already_done": len(completed & set(menu_ids)),
+        "completed": 0,
+        "failed": 0,
+        "elapsed_seconds": 0.0,
+        "menus_per_second": 0.0,
+    }
+
+    helper = PopulateMenuFromDB(template_filename=template_filename)
+    started = time.perf_counter()
+
+    executor = None
+    if workers > 1:
+        # spawn: the API calls this from a worker thread, and forking a threaded process is unsafe
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_render_worker,
+            initargs=(template_content, template_hash),
+        )
+    else:
+        _init_render_worker(template_content, template_hash)
+
+    try:
+        for batch_start in range(0, len(pending), batch_size):
+            if stop_event is not None and stop_event.is_set():
+                progress["stopped"] = True
+                break
+            batch = pending[batch_start:batch_start + batch_size]
+
+            # 1) Fetch the whole batch with one embedded select
+            try:
+                response = helper._menu_query(supabase).in_("id", batch).execute()
+                rows = {row["id"]: row for row in (response.data or [])}
+            except Exception as e:
+                for menu_id in batch:
+                    state["failed"][menu_id] = f"fetch failed: {e}"
+                progress["failed"] += len(batch)
+                _save_state(state_path, state)
+                continue
+
+            jobs = []
+            for menu_id in batch:
+                row = rows.get(menu_id)
+                if row and owned_restaurants is not None and row.get("restaurant_id") not in owned_restaurants:
+                    row = None
+                menu = helper._menu_from_row(row) if row else None
+                if not menu:
+                    state["failed"][menu_id] = "menu not found"
+                    progress["failed"] += 1
+                    continue
+                jobs.append({
+                    "id": menu_id,
+                    "template_data": helper._transform_to_template_data(menu),
+                })
+
+            # 2) Render in the worker pool
+            if executor:
+                results = list(executor.map(_render_menu, jobs))
+            else:
+                results = [_render_menu(job) for job in jobs]
+
+            # 3) Write only the HTML column of each menu (a deleted menu stays deleted)
+            for result in results:
+                menu_id = result["id"]
+                if "error" in result:
+                    state["failed"][menu_id] = f"render failed: {result['error']}"
+                    progress["failed"] += 1
+                    continue
+                row, _, error = save_menu_html(supabase, menu_id, result["html"], column)
+                if error or not row:
+                    state["failed"][menu_id] = f"save failed: {error}" if error else "menu not found"
+                    progress["failed"] += 1
+                    continue
+                state["completed"].append(menu_id)
+                state["failed"].pop(menu_id, None)
+                invalidate_html_index(db_source_key(menu_id))
+                progress["completed"] += 1
+
+            _save_state(state_path, state)
+
+            elapsed = time.perf_counter() - started
+            progress["elapsed_seconds"] = round(elapsed, 3)
+            progress["menus_per_second"] = round(progress["completed"] / elapsed, 2) if elapsed else 0.0
+            if progress_callback:
+                progress_callback(dict(progress))
+    finally:
+        if executor:
+            executor.shutdown()
+
+    progress["failures"] = {menu_id: state["failed"][menu_id] for menu_id in pending if menu_id in state["failed"]}
+    progress["state_file"] = str(state_path)
+    return progress
+
+
+def _print_progress(progress: Dict) -> None:
+    done = progress["completed"] + progress["failed"] + progress["skipped_already_done"]
+    print(
+        f"[{progress['job_name']}] {done}/{progress['total']} "
+        f"(ok: {progress['completed']}, failed: {progress['failed']}, skipped: {progress['skipped_already_done']}) "
+        f"- {progress['menus_per_second']} menus/s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-populate many menus with a template (resumable).")
+    parser.add_argument("menu_ids", nargs="*", help="Menu UUIDs to regenerate")
+    parser.add_argument("--ids-file", help="File with one menu UUID per line")
+    parser.add_argument("--template", default="menu.html", help="Template filename in cache/menus/ (default: menu.html)")
+    parser.add_argument("--job-name", help="Job name used for the resumable state file in cache/regenerate_jobs/")
+    parser.add_argument("--batch-size", type=int, default=BULK_FETCH_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=BULK_RENDER_WORKERS)
+    parser.add_argument("--field-name", default="html_content")
+    args = parser.parse_args()
+
+    ids = list(args.menu_ids)
+    if args.ids_file:
+        ids.extend(line.strip() for line in Path(args.ids_file).read_text(encoding="utf-8").splitlines() if line.strip())
+    if not ids:
+        parser.error("Provide menu ids as arguments or with --ids-file")
+
+    summary = run_bulk_regeneration(
+        ids,
+        template_filename=args.template,
+        job_name=args.job_name,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        field_name=args.field_name,
+        progress_callback=_print_progress,
+    )
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary["failed"] else 0)
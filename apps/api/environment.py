@@ -0,0 +1,22 @@
+"""
+Loads .env once per process.
+
+Entry points (main.py, agency.py, bulk_regenerate.py) call load_environment() before importing
+modules that read their configuration at import time; library modules and tools only read
+os.environ.
+"""
+import threading
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_environment() -> None:
+    """Load apps/api/.env (or the nearest parent .env) into os.environ; later calls are no-ops."""
+    global _loaded
+    with _lock:
+        if _loaded:
+            return
+        from dotenv import load_dotenv
+        load_dotenv()
+        _loaded = True
@@ -0,0 +1,324 @@
+"""
+Compaction of conversation history before it is sent to the model again.
+
+Agency Swarm re-sends the whole thread on every turn, so without compaction a long menu-design
+session pays for every earlier screenshot and HTML dump again on each message. Turns older than
+the last HISTORY_KEEP_RECENT_TURNS are compacted:
+- images in tool outputs (UploadMenuImages, PreviewImageFromURL, PopulateMenuFromDB previews) and
+  in user messages become a short text line: the tool, its arguments and the text it returned
+- full HTML documents (ReadHTMLPart("all") outputs, html arguments of SaveHTMLFile and
+  UpdateHTMLFile) go to the artifact store and become a handle with the title, size and section
+  count, which the HTML tools accept as input (a plain content hash if the store is unavailable)
+- while the history is still over HISTORY_TOKEN_BUDGET (estimated), the oldest turns are folded
+  into one summary message: per turn the user's request, the tools used and the reply
+
+Recent turns are never changed, and turns are only folded as a whole, so every function_call keeps
+its function_call_output. Compaction is deterministic (no model call) and idempotent.
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+HISTORY_COMPACTION_ENABLED = os.getenv("HISTORY_COMPACTION_ENABLED", "true").lower() in ("1", "true", "yes")
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "24000"))
+HISTORY_KEEP_RECENT_TURNS = int(os.getenv("HISTORY_KEEP_RECENT_TURNS", "2"))
+HISTORY_HTML_MIN_CHARS = int(os.getenv("HISTORY_HTML_MIN_CHARS", "2000"))
+
+# Rough token cost of an image input (low-detail tiles) and of text (characters per token)
+IMAGE_TOKENS = 800
+CHARS_PER_TOKEN = 4
+SUMMARY_REQUEST_CHARS = 200
+SUMMARY_REPLY_CHARS = 300
+# Lines kept in the summary message (the oldest turns drop out first)
+SUMMARY_MAX_LINES = 40
+
+SUMMARY_ORIGIN = "history_summary"
+
+HTML_DOCUMENT_PATTERN = re.compile(r"<(?:!doctype\s+html|html|body)[\s>]", re.IGNORECASE)
+HTML_TITLE_PATTERN = re.compile(r"<(title|h1)[^>]*>(.*?)</\1>", re.IGNORECASE | re.DOTALL)
+HTML_SECTION_PATTERN = re.compile(r"<section[\s>]", re.IGNORECASE)
+HTML_TAG_PATTERN = re.compile(r"<[^>]+>")
+DATA_URI_PATTERN = re.compile(r"data:[\w/+.-]+;base64,[A-Za-z0-9+/=]+")
+
+_stats_lock = threading.Lock()
+_stats = {"runs": 0, "images": 0, "html": 0, "turns_summarized": 0, "tokens_before": 0, "tokens_after": 0}
+
+
+def estimate_tokens(value: Any) -> int:
+    """Estimated input tokens of a history item (images at a flat IMAGE_TOKENS each)."""
+    text = value if isinstance(value, str) else json.dumps(value, default=str, ensure_ascii=False)
+    images = 0
+
+    def count_image(_match):
+        nonlocal images
+        images += 1
+        return ""
+
+    text = DATA_URI_PATTERN.sub(count_image, text)
+    return len(text) // CHARS_PER_TOKEN + images * IMAGE_TOKENS
+
+
+def _store_html(html: str) -> Optional[str]:
+    """Artifact handle for the document (the tools package loads with the agency, never before)."""
+    try:
+        from menu_creator.tools.artifact_store import store_artifact
+        return store_artifact(html, "html", media_type="text/html")
+    except Exception:
+        return None
+
+
+def html_reference(html: str) -> str:
+    """Artifact handle (or content hash) for an HTML document, with enough structure to talk about it."""
+    handle = _store_html(html)
+    title_match = HTML_TITLE_PATTERN.search(html)
+    title = HTML_TAG_PATTERN.sub("", title_match.group(2)).strip()[:80] if title_match else ""
+    sections = len(HTML_SECTION_PATTERN.findall(html))
+    details = ", ".join(part for part in (
+        f'title "{title}"' if title else "",
+        f"{sections} sections" if sections else "",
+        f"{len(html)} chars",
+    ) if part)
+    if handle:
+        return (f"[HTML {handle} omitted from history ({details}); pass the handle as html_content to reuse "
+                f"this version, or use ReadHTMLPart for the current content]")
+    digest = hashlib.sha256(html.encode("utf-8")).hexdigest()[:16]
+    return f"[HTML sha256:{digest} omitted from history ({details}); use ReadHTMLPart for the current content]"
+
+
+def _is_html_document(text: str) -> bool:
+    return len(text) >= HISTORY_HTML_MIN_CHARS and HTML_DOCUMENT_PATTERN.search(text[:5000]) is not None
+
+
+def _compact_text(text: str, counts: Dict[str, int]) -> str:
+    if _is_html_document(text):
+        counts["html"] += 1
+        return html_reference(text)
+    return text
+
+
+def _compact_arguments(arguments: str, counts: Dict[str, int]) -> str:
+    """Replace HTML documents passed as tool arguments (SaveHTMLFile, UpdateHTMLFile)."""
+    if not isinstance(arguments, str) or len(arguments) < HISTORY_HTML_MIN_CHARS:
+        return arguments
+    try:
+        parsed = json.loads(arguments)
+    except ValueError:
+        return arguments
+    if not isinstance(parsed, dict):
+        return arguments
+    compacted = {key: _compact_text(value, counts) if isinstance(value, str) else value for key, value in parsed.items()}
+    return json.dumps(compacted, ensure_ascii=False) if compacted != parsed else arguments
+
+
+def _describe_call(call: Optional[Dict[str, Any]]) -> str:
+    if not call:
+        return "a tool"
+    arguments = call.get("arguments") or ""
+    if len(arguments) > 200:
+        arguments = arguments[:200] + "…"
+    return f"{call.get('name') or 'a tool'}({arguments})" if arguments not in ("", "{}") else str(call.get("name") or "a tool")
+
+
+def _compact_output(output: Any, call: Optional[Dict[str, Any]], counts: Dict[str, int]) -> Any:
+    """Tool output without images (a text line instead) or full HTML (a hash reference)."""
+    if isinstance(output, str):
+        return _compact_text(output, counts)
+    if not isinstance(output, list):
+        return output
+
+    texts, images = [], 0
+    for part in output:
+        part_type = part.get("type") if isinstance(part, dict) else None
+        if part_type in ("input_image", "image"):
+            images += 1
+        elif part_type == "input_file":
+            texts.append(f"[file {part.get('filename') or ''} omitted]".replace("  ", " "))
+        elif part_type in ("input_text", "text"):
+            texts.append(_compact_text(part.get("text") or "", counts))
+        else:
+            return output  # unknown content: leave the item untouched
+    if not images:
+        return output
+    counts["images"] += images
+    summary = " ".join(text.strip() for text in texts if text.strip())
+    if len(summary) > 500:
+        summary = summary[:500] + "…"
+    line = f"[{images} image(s) from {_describe_call(call)} omitted from history]"
+    return f"{line} {summary}" if summary else line
+
+
+def _compact_message_content(content: Any, counts: Dict[str, int]) -> Any:
+    if isinstance(content, str):
+        return _compact_text(content, counts)
+    if not isinstance(content, list):
+        return content
+    compacted = []
+    for part in content:
+        part_type = part.get("type") if isinstance(part, dict) else None
+        if part_type == "input_image":
+            counts["images"] += 1
+            compacted.append({"type": "input_text", "text": "[image omitted from history]"})
+        elif part_type == "input_file" and part.get("file_data"):
+            compacted.append({"type": "input_text", "text": f"[file {part.get('filename') or ''} omitted from history]"})
+        elif part_type in ("input_text", "output_text") and isinstance(part.get("text"), str):
+            compacted.append({**part, "text": _compact_text(part["text"], counts)})
+        else:
+            compacted.append(part)
+    return compacted
+
+
+def _compact_item(item: Dict[str, Any], calls: Dict[str, Dict[str, Any]], counts: Dict[str, int]) -> Dict[str, Any]:
+    item_type = item.get("type")
+    if item_type == "function_call_output":
+        output = _compact_output(item.get("output"), calls.get(item.get("call_id")), counts)
+        return item if output is item.get("output") or output == item.get("output") else {**item, "output": output}
+    if item_type == "function_call":
+        arguments = _compact_arguments(item.get("arguments"), counts)
+        return item if arguments == item.get("arguments") else {**item, "arguments": arguments}
+    if "content" in item and item.get("role") in ("user", "assistant", "system", "developer"):
+        content = _compact_message_content(item.get("content"), counts)
+        return item if content == item.get("content") else {**item, "content": content}
+    return item
+
+
+def _is_turn_start(item: Dict[str, Any]) -> bool:
+    """A user message from the end user (not an agent-to-agent message) starts a turn."""
+    return item.get("role") == "user" and item.get("type", "message") == "message" and not item.get("callerAgent")
+
+
+def _split_turns(messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    turns: List[List[Dict[str, Any]]] = []
+    for item in messages:
+        if not turns or (_is_turn_start(item) and turns[-1]):
+            turns.append([])
+        turns[-1].append(item)
+    return turns
+
+
+def _text_of(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part.get("text") or "" for part in content if isinstance(part, dict))
+    return ""
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def summarize_turn(turn: List[Dict[str, Any]]) -> str:
+    """One line per turn: the request, the tools used and the final reply."""
+    request = next((_text_of(item.get("content")) for item in turn if _is_turn_start(item)), "")
+    tools = [item.get("name") for item in turn if item.get("type") == "function_call" and item.get("name")]
+    replies = [_text_of(item.get("content")) for item in turn if item.get("role") == "assistant"]
+    parts = [f"User: {_shorten(request, SUMMARY_REQUEST_CHARS)}"] if request else []
+    if tools:
+        parts.append("Tools: " + ", ".join(dict.fromkeys(tools)))
+    if replies and replies[-1].strip():
+        parts.append(f"Assistant: {_shorten(replies[-1], SUMMARY_REPLY_CHARS)}")
+    return "- " + " | ".join(parts) if parts else ""
+
+
+def _summary_item(lines: List[str], template: Dict[str, Any]) -> Dict[str, Any]:
+    item = {
+        "type": "message",
+        "role": "system",
+        "content": "Summary of the earlier conversation (older turns were compacted):\n" + "\n".join(lines),
+        "message_origin": SUMMARY_ORIGIN,
+    }
+    for key in ("agent", "timestamp"):
+        if key in template:
+            item[key] = template[key]
+    item["callerAgent"] = None
+    return item
+
+
+def compact_history(messages: List[Dict[str, Any]], token_budget: int = None,
+                    keep_recent_turns: int = None) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Return the compacted history and what was done (the input list is not modified)."""
+    token_budget = HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+    keep_recent_turns = HISTORY_KEEP_RECENT_TURNS if keep_recent_turns is None else keep_recent_turns
+    counts = {"images": 0, "html": 0, "turns_summarized": 0, "tokens_before": 0, "tokens_after": 0}
+    if not messages:
+        return messages, counts
+
+    turns = _split_turns([item for item in messages if isinstance(item, dict)])
+    summary_lines: List[str] = []
+    summary_template: Optional[Dict[str, Any]] = None
+    if turns and turns[0] and turns[0][0].get("message_origin") == SUMMARY_ORIGIN:
+        # Previous summary: keep its lines and fold it into the new one
+        existing = turns[0].pop(0)
+        summary_template = existing
+        summary_lines = [line for line in _text_of(existing.get("content")).splitlines()[1:] if line.strip()]
+        if not turns[0]:
+            turns.pop(0)
+
+    older = max(0, len(turns) - keep_recent_turns)
+    token_counts = [sum(estimate_tokens(item) for item in turn) for turn in turns]
+    counts["tokens_before"] = sum(token_counts) + estimate_tokens(summary_lines)
+
+    calls = {item.get("call_id"): item for turn in turns for item in turn if item.get("type") == "function_call"}
+    for index in range(older):
+        compacted = [_compact_item(item, calls, counts) for item in turns[index]]
+        if any(new is not old for new, old in zip(compacted, turns[index])):
+            turns[index] = compacted
+            token_counts[index] = sum(estimate_tokens(item) for item in compacted)
+
+    folded = 0
+    while folded < older and sum(token_counts[folded:]) + estimate_tokens(summary_lines) > token_budget:
+        line = summarize_turn(turns[folded])
+        if line:
+            summary_lines.append(line)
+        summary_template = summary_template or turns[folded][0]
+        folded += 1
+    counts["turns_summarized"] = folded
+
+    result = [item for turn in turns[folded:] for item in turn]
+    summary_lines = summary_lines[-SUMMARY_MAX_LINES:]
+    if summary_lines:
+        result.insert(0, _summary_item(summary_lines, summary_template or (result[0] if result else {})))
+    counts["tokens_after"] = sum(token_counts[folded:]) + estimate_tokens(summary_lines)
+    return result, counts
+
+
+def compact_thread_manager(thread_manager: Any) -> Dict[str, int]:
+    """Compact an agency's in-memory history in place (the next save persists the compacted form)."""
+    if not HISTORY_COMPACTION_ENABLED:
+        return {}
+    messages = thread_manager.get_all_messages()
+    compacted, counts = compact_history(messages)
+    if counts["images"] or counts["html"] or counts["turns_summarized"]:
+        thread_manager.replace_messages(compacted)
+        _record(counts)
+    return counts
+
+
+def compact_loaded_history(messages: Optional[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+    """load_threads_callback wrapper: history loaded from the database, compacted."""
+    if not HISTORY_COMPACTION_ENABLED or not messages:
+        return messages
+    compacted, counts = compact_history(messages)
+    if counts["images"] or counts["html"] or counts["turns_summarized"]:
+        _record(counts)
+    return compacted
+
+
+def _record(counts: Dict[str, int]) -> None:
+    with _stats_lock:
+        _stats["runs"] += 1
+        for key, value in counts.items():
+            _stats[key] += value
+
+
+def compaction_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["token_budget"] = HISTORY_TOKEN_BUDGET
+    stats["keep_recent_turns"] = HISTORY_KEEP_RECENT_TURNS
+    stats["enabled"] = HISTORY_COMPACTION_ENABLED
+    return stats
@@ -0,0 +1,149 @@
+"""
+Idempotency keys for /chat, so a client retrying after a network timeout does not run the turn
+(model calls, screenshots, DB writes) a second time.
+
+A request carries a key (ChatRequest.idempotency_key or the Idempotency-Key header), scoped to
+the user. While a turn with that key runs, a retry attaches to the same computation and gets its
+result; the computation runs as its own task, so it also finishes (and is cached) when the first
+client has gone away. Completed responses are kept IDEMPOTENCY_TTL_SECONDS. Failed turns are not
+cached: a retry after an error runs again.
+
+Reusing a key for a different request (other message, thread or menu) is rejected.
+
+With several workers (state_dir set), completed responses are also written to <state_dir>, and
+main.py checks again once it holds the thread's turn lock: a retry that reached another worker
+while the first attempt was running then returns that attempt's response.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "1000"))
+IDEMPOTENCY_MAX_KEY_LENGTH = 200
+
+# Expired response files are removed every this many writes (multi-worker mode)
+_PRUNE_EVERY_WRITES = 100
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request."""
+
+
+def request_fingerprint(*parts: Optional[str]) -> str:
+    return hashlib.sha256("\x1f".join(part or "" for part in parts).encode("utf-8")).hexdigest()
+
+
+class IdempotencyCache:
+    def __init__(self, state_dir: Optional[Path] = None):
+        # (user_id, key) -> (fingerprint, response, expires at)
+        self._completed: "OrderedDict[Tuple[str, str], Tuple[str, Any, float]]" = OrderedDict()
+        # (user_id, key) -> (fingerprint, task computing the response)
+        self._in_flight: Dict[Tuple[str, str], Tuple[str, asyncio.Task]] = {}
+        self._state_dir = state_dir
+        self._writes = 0
+        self._stats = {"executed": 0, "replayed": 0, "attached": 0, "conflicts": 0}
+
+    async def run(self, user_id: Optional[str], key: str, fingerprint: str,
+                  compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Return (response, replayed): the cached or in-flight response for this key, or the
+        result of compute() (a JSON-serializable dict), which is then cached.
+        """
+        scope = self.scope(user_id, key)
+        cached = self.completed(scope, fingerprint)
+        if cached is not None:
+            self._stats["replayed"] += 1
+            return cached, True
+
+        in_flight = self._in_flight.get(scope)
+        if in_flight is not None:
+            self._check_fingerprint(in_flight[0], fingerprint)
+            self._stats["attached"] += 1
+            # shield: this retry going away must not cancel the computation
+            return await asyncio.shield(in_flight[1]), True
+
+        task = asyncio.create_task(compute())
+        self._in_flight[scope] = (fingerprint, task)
+        self._stats["executed"] += 1
+        task.add_done_callback(lambda done: self._finish(scope, fingerprint, done))
+        return await asyncio.shield(task), False
+
+    def completed(self, scope: Tuple[str, str], fingerprint: str) -> Optional[Any]:
+        """Cached response for this key (from any worker in multi-worker mode), if still fresh."""
+        entry = self._completed.get(scope)
+        if entry is None and self._state_dir is not None:
+            entry = self._read_persisted(scope)
+        if entry is None or entry[2] < time.time():
+            self._completed.pop(scope, None)
+            return None
+        self._check_fingerprint(entry[0], fingerprint)
+        return entry[1]
+
+    def scope(self, user_id: Optional[str], key: str) -> Tuple[str, str]:
+        return (user_id or "anonymous", key[:IDEMPOTENCY_MAX_KEY_LENGTH])
+
+    def _check_fingerprint(self, stored: str, fingerprint: str) -> None:
+        if stored != fingerprint:
+            self._stats["conflicts"] += 1
+            raise IdempotencyConflict("Idempotency key was already used for a different request")
+
+    def _finish(self, scope: Tuple[str, str], fingerprint: str, task: asyncio.Task) -> None:
+        self._in_flight.pop(scope, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        entry = (fingerprint, task.result(), time.time() + IDEMPOTENCY_TTL_SECONDS)
+        self._completed[scope] = entry
+        self._completed.move_to_end(scope)
+        while len(self._completed) > IDEMPOTENCY_MAX_ENTRIES:
+            self._completed.popitem(last=False)
+        if self._state_dir is not None:
+            self._persist(scope, entry)
+
+    def _path(self, scope: Tuple[str, str]) -> Path:
+        return self._state_dir / (hashlib.sha256("\x1f".join(scope).encode("utf-8")).hexdigest() + ".json")
+
+    def _persist(self, scope: Tuple[str, str], entry: Tuple[str, Any, float]) -> None:
+        path = self._path(scope)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self._state_dir.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(list(entry), default=str), encoding="utf-8")
+            os.replace(tmp, path)
+            self._prune_files()
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Warning: Could not persist idempotent response: {e}")
+
+    def _read_persisted(self, scope: Tuple[str, str]) -> Optional[Tuple[str, Any, float]]:
+        try:
+            fingerprint, response, expires_at = json.loads(self._path(scope).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return fingerprint, response, expires_at
+
+    def _prune_files(self) -> None:
+        """Drop response files older than the TTL."""
+        self._writes += 1
+        if self._writes % _PRUNE_EVERY_WRITES:
+            return
+        cutoff = time.time() - IDEMPOTENCY_TTL_SECONDS
+        for path in self._state_dir.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "in_flight": len(self._in_flight),
+            "cached": len(self._completed),
+            "ttl_seconds": IDEMPOTENCY_TTL_SECONDS,
+            "shared": self._state_dir is not None,
+        }
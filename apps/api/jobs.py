@@ -0,0 +1,315 @@
+"""
+Background jobs for long agency runs (a full "analyze site → … → save" generation).
+
+POST /jobs answers at once with a job id; the turn runs as a task on this worker, so no HTTP
+request has to stay open for minutes (Cloud Run request timeout). While it runs, the job keeps
+a log of progress events (tool_start / tool_end with tool name and durations, agent switches,
+status changes), each stamped with its sequence number and the elapsed time since submission.
+
+POST /menus/regenerate submits bulk menu regenerations as jobs too (progress events per batch).
+
+Clients poll GET /jobs/{id}?after=<seq> or follow GET /jobs/{id}/events (SSE, resumable with
+Last-Event-ID), and cancel with DELETE /jobs/{id}.
+
+At most JOB_MAX_CONCURRENT jobs run at a time per worker; up to JOB_MAX_QUEUED more wait in
+"queued", further submissions are rejected (429). Finished jobs are kept JOB_RETENTION_SECONDS.
+
+With several workers (state_dir set), changes are also written to <state_dir>/<id>.json (at most
+every JOB_PERSIST_INTERVAL_SECONDS per job, by a writer thread; status changes at once) and
+cancellation goes through a <id>.cancel marker, so any worker can answer polls and cancels.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from admission import AdmissionRejected
+
+JOB_MAX_CONCURRENT = int(os.getenv("JOB_MAX_CONCURRENT", "2"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "20"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+# Stored progress events per job (the oldest are dropped first)
+JOB_MAX_EVENTS = 500
+# How often followers on other workers re-read a job, and running jobs check for a cancel marker
+JOB_POLL_SECONDS = 1.0
+# Multi-worker mode: a job's state file is rewritten at most this often while it runs
+JOB_PERSIST_INTERVAL_SECONDS = 0.5
+
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class Job:
+    def __init__(self, user_id: Optional[str], thread_id: Optional[str] = None, menu_id: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.thread_id = thread_id
+        self.menu_id = menu_id
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.current_tool: Optional[str] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self.task: Optional[asyncio.Task] = None
+        self._seq = 0
+        self._created = time.perf_counter()
+        # Set (and replaced) on every change; followers wait on it
+        self.changed = asyncio.Event()
+        self._on_change: Optional[Callable[["Job"], None]] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        """Record a progress event (text deltas are not stored; the final text is the result)."""
+        if event["type"] == "text_delta":
+            return
+        if event["type"] == "tool_start":
+            self.current_tool = event.get("tool")
+        elif event["type"] == "tool_end":
+            self.current_tool = None
+        self._seq += 1
+        self.events.append({
+            "seq": self._seq,
+            "elapsed_ms": round((time.perf_counter() - self._created) * 1000),
+            **event,
+        })
+        if len(self.events) > JOB_MAX_EVENTS:
+            del self.events[0]
+        self._notify()
+
+    def set_status(self, status: str) -> None:
+        self.status = status
+        if status == "running":
+            self.started_at = time.time()
+        elif status in TERMINAL_STATUSES:
+            self.finished_at = time.time()
+            self.current_tool = None
+        self.emit({"type": "status", "status": status})
+
+    def _notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def snapshot(self, after: int = 0) -> Dict[str, Any]:
+        """Job state with the events newer than sequence number `after`."""
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "thread_id": self.thread_id,
+            "menu_id": self.menu_id,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_ms": round((end - self.created_at) * 1000),
+            "current_tool": self.current_tool,
+            "result": self.result,
+            "error": self.error,
+            "last_seq": self._seq,
+            "events": [event for event in self.events if event["seq"] > after],
+        }
+
+
+JobRunner = Callable[[Job], Awaitable[Any]]
+
+
+class JobManager:
+    def __init__(self, state_dir: Optional[Path] = None):
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._state_dir = state_dir
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Multi-worker mode: jobs changed since their state file was last written
+        self._dirty: set = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._stats = {"submitted": 0, "succeeded": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+
+    @property
+    def shared(self) -> bool:
+        return self._state_dir is not None
+
+    def submit(self, runner: JobRunner, user_id: Optional[str], thread_id: Optional[str] = None,
+               menu_id: Optional[str] = None) -> Job:
+        """Queue a job (raises AdmissionRejected when JOB_MAX_QUEUED jobs are already waiting)."""
+        self._prune()
+        queued = sum(job.status == "queued" for job in self._jobs.values())
+        if queued >= JOB_MAX_QUEUED:
+            self._stats["rejected"] += 1
+            raise AdmissionRejected("too_many_jobs", 30.0)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(JOB_MAX_CONCURRENT)
+
+        job = Job(user_id, thread_id, menu_id)
+        if self._state_dir is not None:
+            self._state_dir.mkdir(parents=True, exist_ok=True)
+            job._on_change = self._persist
+        self._jobs[job.id] = job
+        self._stats["submitted"] += 1
+        job.set_status("queued")
+        job.task = asyncio.create_task(self._run(job, runner))
+        return job
+
+    async def _run(self, job: Job, runner: JobRunner) -> None:
+        watcher = asyncio.create_task(self._watch_cancel(job)) if self._state_dir is not None else None
+        try:
+            async with self._slots:
+                job.set_status("running")
+                job.result = await runner(job)
+            job.set_status("succeeded")
+        except asyncio.CancelledError:
+            job.set_status("cancelled")
+        except Exception as e:
+            job.error = str(e)
+            job.set_status("failed")
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            self._stats[job.status] = self._stats.get(job.status, 0) + 1
+
+    async def _watch_cancel(self, job: Job) -> None:
+        """Multi-worker mode: cancel the job when another worker left a cancel marker."""
+        marker = self._state_dir / f"{job.id}.cancel"
+        while not job.done:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            if marker.exists():
+                job.task.cancel()
+                return
+
+    def get(self, job_id: str, user_id: Optional[str], after: int = 0) -> Optional[Dict[str, Any]]:
+        """Snapshot of the user's job (None when unknown or owned by someone else)."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.snapshot(after) if job.user_id == user_id else None
+        snapshot = self._read_persisted(job_id)
+        if snapshot is None or snapshot["user_id"] != user_id:
+            return None
+        snapshot["events"] = [event for event in snapshot["events"] if event["seq"] > after]
+        return snapshot
+
+    def cancel(self, job_id: str, user_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Request cancellation; the job ends as "cancelled" unless it already finished."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            if job.user_id != user_id:
+                return None
+            snapshot = job.snapshot()
+            if not job.done and job.task is not None:
+                job.task.cancel()
+                snapshot["cancel_requested"] = True
+            return snapshot
+        snapshot = self._read_persisted(job_id)
+        if snapshot is None or snapshot["user_id"] != user_id:
+            return None
+        if snapshot["status"] not in TERMINAL_STATUSES:
+            (self._state_dir / f"{job_id}.cancel").touch()
+            snapshot["cancel_requested"] = True
+        return snapshot
+
+    async def follow(self, job_id: str, user_id: Optional[str], after: int = 0,
+                     heartbeat_seconds: float = 15.0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield the job's events after `after` as they happen, then its final snapshot.
+        None is yielded when nothing happened for heartbeat_seconds.
+        """
+        idle = 0.0
+        while True:
+            job = self._jobs.get(job_id)
+            # Taken before the snapshot, so changes made while the caller handles our yields still wake us
+            changed = job.changed if job is not None else None
+            snapshot = self.get(job_id, user_id, after)
+            if snapshot is None:
+                return
+            for event in snapshot.pop("events"):
+                after = event["seq"]
+                yield event
+            if snapshot["status"] in TERMINAL_STATUSES:
+                yield {"type": "job", **snapshot}
+                return
+            if changed is not None:
+                try:
+                    await asyncio.wait_for(changed.wait(), heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield None
+            else:
+                await asyncio.sleep(JOB_POLL_SECONDS)
+                idle += JOB_POLL_SECONDS
+                if idle >= heartbeat_seconds:
+                    idle = 0.0
+                    yield None
+
+    def _persist(self, job: Job) -> None:
+        """Schedule a write of the job's state file (progress is batched; status changes are written at once)."""
+        self._dirty.add(job.id)
+        if job.events and job.events[-1]["type"] == "status":
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(JOB_PERSIST_INTERVAL_SECONDS, self._flush)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        payloads = []
+        for job_id in self._dirty:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                payloads.append((job.id, json.dumps(job.snapshot(), default=str)))
+        self._dirty.clear()
+        if payloads:
+            if self._writer is None:
+                # One thread: writes stay in order, and the event loop never waits on the disk
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-state")
+            self._writer.submit(self._write_files, payloads)
+
+    def _write_files(self, payloads) -> None:
+        for job_id, payload in payloads:
+            path = self._state_dir / f"{job_id}.json"
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            try:
+                tmp.write_text(payload, encoding="utf-8")
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"Warning: Could not persist job {job_id}: {e}")
+
+    def _read_persisted(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if self._state_dir is None or not job_id.isalnum():
+            return None
+        try:
+            return json.loads((self._state_dir / f"{job_id}.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _prune(self) -> None:
+        """Forget finished jobs older than JOB_RETENTION_SECONDS (and their state files)."""
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id, job in list(self._jobs.items()):
+            if job.done and job.finished_at < cutoff:
+                del self._jobs[job_id]
+                if self._state_dir is not None:
+                    for suffix in (".json", ".cancel"):
+                        (self._state_dir / f"{job_id}{suffix}").unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            **self._stats,
+            "jobs": statuses,
+            "max_concurrent": JOB_MAX_CONCURRENT,
+            "max_queued": JOB_MAX_QUEUED,
+            "shared": self.shared,
+        }
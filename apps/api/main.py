@@ -3,28 +3,47 @@ FastAPI server for Agency Swarm menu creation service.
 Deployed on Google Cloud Run.
 """
 import os
+import time
+import uuid
 import asyncio
-from typing import Optional
-from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.responses import JSONResponse
+import weakref
+import threading
+from pathlib import Path
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Depends, Response, Cookie, Header, status
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from dotenv import load_dotenv
-from agency import create_agency
-from thread_persistence import save_threads, load_threads
+from environment import load_environment
+
+# Load environment variables (before the modules below read their settings)
+load_environment()
+
+# agency (agency_swarm + tools) and bulk_regenerate are imported on first use, so the
+# server answers health checks without paying for them (see benchmarks/import_budget.py)
+from thread_persistence import save_threads, load_threads, thread_exists
+from tool_runtime import install_tool_executor, shutdown_tool_executor, background_save, flush_background_saves
+from thread_locks import ThreadTurnLocks
+from tracing import span, traced, render_prometheus, recent_traces
+from tool_profiling import tool_profile_summary
+from warmup import run_warmup, is_ready, warmup_status
+from admission import AdmissionController, AdmissionRejected, TurnSlot
+from jobs import Job, JobManager
+from history_compaction import compact_loaded_history, compact_thread_manager, compaction_stats
+from idempotency import IdempotencyCache, IdempotencyConflict, request_fingerprint
+from sse_stream import SSE_HEADERS, SSE_QUEUE_MAX_EVENTS, HEARTBEAT_FRAME, format_sse, stream_events, sse_frames, stop_producer
 from auth import (
     authenticate_user,
     create_access_token,
     get_current_user,
+    is_admin,
+    require_metrics_access,
     Token,
     ACCESS_TOKEN_EXPIRE_MINUTES,
 )
 from datetime import timedelta
 
-# Load environment variables
-load_dotenv()
-
 # Initialize FastAPI app
 app = FastAPI(
     title="Menu Creation Agency API",
@@ -51,36 +70,194 @@ app.add_middleware(
 # Global agency instances per thread (to support thread persistence)
 _agencies = {}
 
+# Agencies being created (thread history loading), so concurrent requests and prefetches share one load
+_agency_loads = {}
+
+# Strong references to fire-and-forget prefetch tasks
+_background_tasks = set()
+
+# Worker processes serving this instance (set by serve.py; see the Dockerfile)
+WORKER_COUNT = int(os.getenv("WEB_CONCURRENCY", "1"))
+THREAD_LOCK_DIR = Path(__file__).resolve().parent / "cache" / "thread_locks"
+
+# Serializes turns on the same thread (different threads still run concurrently);
+# with several workers, also across processes
+_thread_locks = ThreadTurnLocks(lock_dir=THREAD_LOCK_DIR if WORKER_COUNT > 1 else None)
+
+# Saved-history version each in-memory agency was loaded at (multi-worker mode)
+_agency_versions = {}
+
+# Per-user rate limits and the global turn ceiling (see admission.py)
+_admission = AdmissionController()
+
+# Background agency runs (POST /jobs); with several workers their state is shared through files
+JOB_STATE_DIR = Path(__file__).resolve().parent / "cache" / "jobs"
+_jobs = JobManager(state_dir=JOB_STATE_DIR if WORKER_COUNT > 1 else None)
+
+# Responses of /chat turns sent with an idempotency key (client retries reuse them)
+IDEMPOTENCY_STATE_DIR = Path(__file__).resolve().parent / "cache" / "idempotency"
+_idempotency = IdempotencyCache(state_dir=IDEMPOTENCY_STATE_DIR if WORKER_COUNT > 1 else None)
+
+# Identifies this instance in thread-owner hints (Cloud Run sets K_REVISION)
+INSTANCE_ID = f"{os.getenv('K_REVISION', 'local')}-{uuid.uuid4().hex[:8]}"
+THREAD_OWNER_HEADER = "X-Thread-Owner"
+THREAD_OWNER_COOKIE = "menoo_thread_owner"
+
+# warm: agency already in memory; cold: history loaded here; handoffs: cookie named another instance
+# stale: reloaded because another worker ran a turn on the thread since it was loaded here
+_affinity_stats = {"warm": 0, "cold": 0, "prefetched": 0, "handoffs": 0, "stale": 0}
+
+
+@app.on_event("startup")
+async def startup():
+    """
+    Run blocking tool calls on a bounded thread pool instead of the event loop's default one,
+    then warm up in the background (the server already listens; /health waits for it).
+    """
+    install_tool_executor()
+    task = asyncio.create_task(run_warmup({"agency": warm_agency}))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Flush pending thread saves and stop the tool pool."""
+    shutdown_tool_executor()
+
+
+async def _create_agency(thread_id: Optional[str]):
+    """Create an agency for a thread; loading its history runs in the thread pool."""
+    def load_callback():
+        if thread_id:
+            return compact_loaded_history(load_threads(thread_id))
+        return None
+    
+    # Saves are queued to a background writer; Agency Swarm calls this on the event loop
+    save_callback = background_save(lambda thread_dict: save_threads(thread_dict, thread_id))
+    
+    def build():
+        # First call imports agency_swarm and the tools, also off the event loop
+        from agency import create_agency
+        return create_agency(
+            load_threads_callback=load_callback if thread_id else None,
+            save_threads_callback=save_callback if thread_id else None
+        )
+    
+    # Read before loading: a save that lands during the load makes this agency stale, not current
+    version = _thread_locks.read_version(thread_id) if thread_id else None
+    agency = await asyncio.to_thread(build)
+    _agency_versions[thread_id or "default"] = version
+    return agency
+
+
+async def finish_turn(thread_id: Optional[str]) -> None:
+    """
+    Multi-worker mode: before the turn's lock is released, wait for its history save and
+    bump the thread's version, so another worker reloads the history instead of using an
+    older in-memory copy.
+    """
+    if not thread_id or not _thread_locks.shared:
+        return
+    await asyncio.to_thread(flush_background_saves, 30)
+    _agency_versions[thread_id] = _thread_locks.bump_version(thread_id)
+
+
+async def compact_agency_history(agency) -> None:
+    """
+    Compact older turns (images, HTML dumps, summary past the token budget) before the history
+    is sent to the model again; see history_compaction.py. Called while holding the turn lock.
+    """
+    with span("history.compact"):
+        await asyncio.to_thread(compact_thread_manager, agency.thread_manager)
+
+
+async def admit_turn(current_user: dict) -> TurnSlot:
+    """Admit a chat turn for this user or answer 429 with Retry-After (before any work is done)."""
+    try:
+        return await _admission.admit(current_user.get("user_id"))
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.reason,
+            headers={"Retry-After": e.retry_after_header},
+        )
+
+
+def set_thread_owner(response: Response, thread_id: Optional[str]) -> None:
+    """
+    Tell the client (and any proxy) which instance holds this thread warm.
+    
+    Cloud Run session affinity (--session-affinity) routes a client's requests to the same
+    instance with its own cookie; the hint lets clients and logs detect when a conversation
+    moved to another instance (which then reloads the history once).
+    """
+    response.headers[THREAD_OWNER_HEADER] = INSTANCE_ID
+    if thread_id:
+        # SameSite=None: the web app calls the API cross-site with credentials
+        response.set_cookie(THREAD_OWNER_COOKIE, INSTANCE_ID, httponly=True, samesite="none", secure=True)
+
+
+def record_thread_owner(previous_owner: Optional[str]) -> None:
+    """Count requests for a conversation that was last served by another instance."""
+    if previous_owner and previous_owner != INSTANCE_ID:
+        _affinity_stats["handoffs"] += 1
+
+
+async def prefetch_agency(thread_id: str) -> None:
+    """
+    Background warm-up of a thread's agency (history load) ahead of its next turn.
+    Threads without saved history are skipped, so unknown ids never leave an agency in memory.
+    """
+    try:
+        if not await asyncio.to_thread(thread_exists, thread_id):
+            return
+        await get_agency(thread_id)
+        _affinity_stats["prefetched"] += 1
+    except Exception as e:
+        print(f"Warning: Could not prefetch thread {thread_id}: {e}")
+
 
-def get_agency(thread_id: Optional[str] = None):
+@traced("get_agency")
+async def get_agency(thread_id: Optional[str] = None):
     """
     Get or create the agency instance for a specific thread.
     If thread_id is provided, loads thread history from database.
+    
+    Creating an agency loads the thread history synchronously, so it runs in the
+    thread pool to keep other conversations responsive.
     """
     global _agencies
     
     # Use thread_id as key, or "default" if not provided
     key = thread_id or "default"
     
-    if key not in _agencies:
-        # Create agency with thread persistence callbacks
-        def load_callback():
-            if thread_id:
-                return load_threads(thread_id)
-            return None
-        
-        def save_callback(thread_dict):
-            if thread_id:
-                save_threads(thread_dict, thread_id)
-        
-        _agencies[key] = create_agency(
-            load_threads_callback=load_callback if thread_id else None,
-            save_threads_callback=save_callback if thread_id else None
-        )
+    if key in _agencies and thread_id and _thread_locks.shared:
+        if _agency_versions.get(key) != _thread_locks.read_version(key):
+            _affinity_stats["stale"] += 1
+            _agencies.pop(key, None)
+    
+    if key in _agencies:
+        _affinity_stats["warm"] += 1
+    else:
+        load = _agency_loads.get(key)
+        if load is None:
+            _affinity_stats["cold"] += 1
+            load = asyncio.create_task(_create_agency(thread_id))
+            _agency_loads[key] = load
+            load.add_done_callback(lambda _: _agency_loads.pop(key, None))
+        # shield: a cancelled request must not cancel a load other requests are waiting on
+        _agencies[key] = await asyncio.shield(load)
     
     return _agencies[key]
 
 
+async def warm_agency() -> str:
+    """Warm-up step: import agency_swarm and the tools and build the shared default agency."""
+    await get_agency(None)
+    return "ok"
+
+
 class ChatRequest(BaseModel):
     """Request model for chat endpoint."""
     message: str
@@ -89,6 +266,10 @@ class ChatRequest(BaseModel):
         default=None,
         description="UUID of the menu to work with. If provided, HTML tools will save/read from database instead of file system. Recommended for Cloud Run/API usage."
     )
+    idempotency_key: Optional[str] = Field(
+        default=None,
+        description="Client-chosen key, the same on retries of one message. /chat then runs the turn once (same as the Idempotency-Key header)."
+    )
 
 
 class ChatResponse(BaseModel):
@@ -97,6 +278,17 @@ class ChatResponse(BaseModel):
     thread_id: str
 
 
+class RegenerateMenusRequest(BaseModel):
+    """Request model for bulk menu regeneration."""
+    menu_ids: List[str] = Field(description="UUIDs of the menus to re-populate and save")
+    template_filename: str = Field(default="menu.html", description="Mustache template in cache/menus/")
+    job_name: Optional[str] = Field(
+        default=None,
+        pattern=r"^[A-Za-z0-9_-]{1,64}$",
+        description="Resumable job name. Re-sending the same job skips menus that were already regenerated with this template."
+    )
+
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
@@ -109,10 +301,113 @@ async def root():
 
 @app.get("/health")
 async def health():
-    """Health check endpoint for Cloud Run."""
+    """
+    Health check endpoint for Cloud Run.
+    
+    Answers 503 while the startup warm-up runs, so a startup probe on /health only
+    sends traffic once agency, DB client, bcrypt and browser are warm.
+    """
+    if not is_ready():
+        return JSONResponse(status_code=503, content={"status": "warming", "warmup": warmup_status()})
     return {"status": "healthy"}
 
 
+@app.get("/metrics/warmup", dependencies=[Depends(require_metrics_access)])
+async def metrics_warmup():
+    """Outcome and duration of each startup warm-up step."""
+    return warmup_status()
+
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_access)])
+async def metrics():
+    """Latency histograms per traced operation (Prometheus text format)."""
+    return render_prometheus()
+
+
+@app.get("/metrics/traces", dependencies=[Depends(require_metrics_access)])
+async def traces(limit: int = 20):
+    """Most recent traces with their spans, e.g. to see where one menu generation spent its time."""
+    return recent_traces(limit)
+
+
+@app.get("/metrics/tools", dependencies=[Depends(require_metrics_access)])
+async def tool_metrics():
+    """Per-tool profiling aggregates (TOOL_PROFILING=true); slow calls are in the slow-call log."""
+    return tool_profile_summary()
+
+
+@app.get("/metrics/threads", dependencies=[Depends(require_metrics_access)])
+async def thread_metrics():
+    """Per-thread turn queue (active threads, queued turns, lock wait times) and thread affinity counters."""
+    return {
+        **_thread_locks.stats(),
+        "instance": INSTANCE_ID,
+        "workers": WORKER_COUNT,
+        "pid": os.getpid(),
+        "agencies_in_memory": len(_agencies),
+        "affinity": dict(_affinity_stats),
+        "compaction": compaction_stats(),
+    }
+
+
+@app.get("/metrics/admission", dependencies=[Depends(require_metrics_access)])
+async def admission_metrics():
+    """Admitted, queued and rejected turns, per-user rate settings and heavy tool slots (this worker)."""
+    return _admission.stats()
+
+
+@app.get("/metrics/jobs", dependencies=[Depends(require_metrics_access)])
+async def job_metrics():
+    """Background jobs on this worker by status, plus submitted/finished/rejected counters."""
+    return _jobs.stats()
+
+
+@app.get("/metrics/idempotency", dependencies=[Depends(require_metrics_access)])
+async def idempotency_metrics():
+    """Turns executed, replayed from cache or attached to an in-flight run by idempotency key."""
+    return _idempotency.stats()
+
+
+@app.get("/metrics/cache", dependencies=[Depends(require_metrics_access)])
+async def cache_metrics():
+    """Entries and size per namespace of the cache shared by the worker processes, and the artifact store."""
+    def stats():
+        from menu_creator.tools.shared_cache import cache_stats
+        from menu_creator.tools.artifact_store import artifact_stats
+        return {**cache_stats(), "artifacts": artifact_stats()}
+    return await asyncio.to_thread(stats)
+
+
+@app.post("/threads/{thread_id}/prefetch", status_code=202)
+async def prefetch_thread(
+    thread_id: str,
+    response: Response,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Warm a conversation on this instance before its next message.
+    
+    Call when a chat is opened: the thread history is loaded in the background, so the
+    first /chat or /chat/stream turn does not pay for the reload. Returns immediately.
+    Only threads with saved history are loaded; each call counts against the user's chat rate.
+    """
+    try:
+        _admission.check_rate(current_user.get("user_id"))
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.reason,
+            headers={"Retry-After": e.retry_after_header},
+        )
+    warm = thread_id in _agencies
+    if not warm and thread_id not in _agency_loads:
+        task = asyncio.create_task(prefetch_agency(thread_id))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    set_thread_owner(response, thread_id)
+    return {"thread_id": thread_id, "warm": warm, "instance": INSTANCE_ID}
+
+
 @app.post("/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """
@@ -170,129 +465,422 @@ async def read_users_me(current_user: dict = Depends(get_current_user)):
     return current_user
 
 
+async def run_chat_turn(request: ChatRequest, current_user: dict, idempotency: Optional[tuple] = None) -> dict:
+    """
+    One /chat turn: admission, the thread's turn lock, the agency run.
+    
+    idempotency is (scope, fingerprint) when the request carries an idempotency key.
+    """
+    slot = await admit_turn(current_user)
+    try:
+        async with _thread_locks.turn(request.thread_id or "default"):
+            with span("chat.turn", endpoint="/chat"):
+                if idempotency is not None:
+                    # Multi-worker mode: an earlier attempt may have finished on another worker
+                    # while this one waited for the thread's lock
+                    cached = _idempotency.completed(*idempotency)
+                    if cached is not None:
+                        return cached
+        
+                # Get agency instance for this thread (loads history if thread_id provided)
+                agency = await get_agency(request.thread_id)
+                await compact_agency_history(agency)
+        
+                # Store menu_id in agency context if provided (secure, not in message)
+                # Use context_override to pass menu_id securely to tools
+                context_override = {}
+                if request.menu_id:
+                    context_override = {"menu_id": request.menu_id}
+        
+                # Get response from agency with context override
+                # Tools will automatically retrieve menu_id from context
+                # Thread history is automatically loaded/saved via callbacks
+                run_result = await agency.get_response(
+                    request.message,
+                    recipient_agent=None,  # Uses entry point agent
+                    context_override=context_override if context_override else None,
+                )
+        
+                # Extract response text from RunResult
+                # Try multiple ways to get the response text
+                if hasattr(run_result, 'messages') and run_result.messages:
+                    response_text = run_result.messages[-1].content
+                elif hasattr(run_result, 'content'):
+                    response_text = run_result.content
+                elif hasattr(run_result, 'text'):
+                    response_text = run_result.text
+                else:
+                    response_text = str(run_result)
+        
+                # Get thread ID from run result or use provided one
+                thread_id = request.thread_id
+                if not thread_id:
+                    if hasattr(run_result, 'thread_id'):
+                        thread_id = run_result.thread_id
+                    elif hasattr(run_result, 'thread') and hasattr(run_result.thread, 'id'):
+                        thread_id = run_result.thread.id
+                    else:
+                        thread_id = "default"
+        
+                await finish_turn(request.thread_id)
+                return ChatResponse(
+                    response=response_text,
+                    thread_id=thread_id
+                ).model_dump()
+    except IdempotencyConflict:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing request: {str(e)}"
+        )
+    finally:
+        slot.release()
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
+    response: Response,
+    thread_owner: Optional[str] = Cookie(default=None, alias=THREAD_OWNER_COOKIE),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Send a message to the agency and get a response.
     
+    Retries with the same idempotency key (ChatRequest.idempotency_key or the Idempotency-Key
+    header) attach to the running turn or get its cached response instead of running it again;
+    those responses carry "Idempotent-Replayed: true".
+    
     Args:
         request: ChatRequest with message, optional thread_id, and optional menu_id
         
     Returns:
         ChatResponse with agent response and thread_id
     """
+    record_thread_owner(thread_owner)
+    set_thread_owner(response, request.thread_id)
+    key = request.idempotency_key or idempotency_key
+    if not key:
+        return await run_chat_turn(request, current_user)
+    
+    user_id = current_user.get("user_id")
+    fingerprint = request_fingerprint(request.message, request.thread_id, request.menu_id)
+    scope = _idempotency.scope(user_id, key)
     try:
-        # Get agency instance for this thread (loads history if thread_id provided)
-        agency = get_agency(request.thread_id)
-        
-        # Store menu_id in agency context if provided (secure, not in message)
-        # Use context_override to pass menu_id securely to tools
-        context_override = {}
-        if request.menu_id:
-            context_override = {"menu_id": request.menu_id}
-        
-        # Get response from agency with context override
-        # Tools will automatically retrieve menu_id from context
-        # Thread history is automatically loaded/saved via callbacks
-        run_result = await agency.get_response(
-            request.message,
-            recipient_agent=None,  # Uses entry point agent
-            context_override=context_override if context_override else None,
-        )
-        
-        # Extract response text from RunResult
-        # Try multiple ways to get the response text
-        if hasattr(run_result, 'messages') and run_result.messages:
-            response_text = run_result.messages[-1].content
-        elif hasattr(run_result, 'content'):
-            response_text = run_result.content
-        elif hasattr(run_result, 'text'):
-            response_text = run_result.text
-        else:
-            response_text = str(run_result)
-        
-        # Get thread ID from run result or use provided one
-        thread_id = request.thread_id
-        if not thread_id:
-            if hasattr(run_result, 'thread_id'):
-                thread_id = run_result.thread_id
-            elif hasattr(run_result, 'thread') and hasattr(run_result.thread, 'id'):
-                thread_id = run_result.thread.id
-            else:
-                thread_id = "default"
-        
-        return ChatResponse(
-            response=response_text,
-            thread_id=thread_id
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error processing request: {str(e)}"
+        result, replayed = await _idempotency.run(
+            user_id, key, fingerprint,
+            lambda: run_chat_turn(request, current_user, idempotency=(scope, fingerprint)),
         )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
 
 @app.post("/chat/stream")
 async def chat_stream(
     request: ChatRequest,
+    thread_owner: Optional[str] = Cookie(default=None, alias=THREAD_OWNER_COOKIE),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Stream responses from the agency (Server-Sent Events).
     
+    Events are typed and compact (see sse_stream.py): start, text_delta, tool_start,
+    tool_end, progress, error and done. Only text_delta carries "content".
+    
     Args:
         request: ChatRequest with message, optional thread_id, and optional menu_id
         
     Returns:
         StreamingResponse with SSE events
     """
-    from fastapi.responses import StreamingResponse
-    
     async def generate():
+        started = time.perf_counter()
+        first_text_at = None
+        bytes_sent = 0
+        event_id = 0
+        producer = None
+        
+        def frame(event):
+            nonlocal bytes_sent, event_id
+            event_id += 1
+            encoded = format_sse(event, event_id)
+            bytes_sent += len(encoded.encode("utf-8"))
+            return encoded
+        
+        # Flush headers and a first frame before the (possibly slow) agency load
+        yield frame({"type": "start", "thread_id": request.thread_id})
+        
+        thread_key = request.thread_id or "default"
+        if _thread_locks.queue_depth(thread_key):
+            # Another turn is running on this conversation; this one starts after it
+            yield frame({"type": "progress", "stage": "queued", "ahead": _thread_locks.queue_depth(thread_key)})
+        
         try:
-            # Get agency instance for this thread (loads history if thread_id provided)
-            agency = get_agency(request.thread_id)
+            async with _thread_locks.turn(thread_key) as queue_wait:
+                with span("chat.turn", endpoint="/chat/stream"):
+                    # Get agency instance for this thread (loads history if thread_id provided)
+                    agency = await get_agency(request.thread_id)
+                    await compact_agency_history(agency)
+            
+                    # Store menu_id in agency context if provided (secure, not in message)
+                    # Use context_override to pass menu_id securely to tools
+                    context_override = {}
+                    if request.menu_id:
+                        context_override = {"menu_id": request.menu_id}
+            
+                    # Get stream (synchronous call returns stream object)
+                    # Tools will automatically retrieve menu_id from context
+                    stream = agency.get_response_stream(
+                        request.message,
+                        recipient_agent=None,  # Uses entry point agent
+                        context_override=context_override if context_override else None,
+                    )
+            
+                    # The producer pauses when the queue is full, so a slow client applies backpressure
+                    queue = asyncio.Queue(maxsize=SSE_QUEUE_MAX_EVENTS)
+                    producer = asyncio.create_task(stream_events(stream, queue))
+                    try:
+                        async for event in sse_frames(queue):
+                            if event is None:
+                                yield HEARTBEAT_FRAME
+                                continue
+                            if event["type"] == "text_delta" and first_text_at is None:
+                                first_text_at = time.perf_counter()
+                            yield frame(event)
+                    finally:
+                        # Client gone: stop the run before the thread's turn lock is released
+                        await stop_producer(producer)
             
-            # Store menu_id in agency context if provided (secure, not in message)
-            # Use context_override to pass menu_id securely to tools
-            context_override = {}
-            if request.menu_id:
-                context_override = {"menu_id": request.menu_id}
+                    # Get final result
+                    final_result = await stream.wait_final_result()
+                    final_output = getattr(final_result, "final_output", final_result)
+                    # Before "done": a client that disconnects on it must not skip the save barrier
+                    await finish_turn(request.thread_id)
+                    yield frame({
+                        "type": "done",
+                        "thread_id": request.thread_id,
+                        "result": final_output if isinstance(final_output, str) else str(final_output),
+                        "duration_ms": round((time.perf_counter() - started) * 1000),
+                        "ttfb_ms": round((first_text_at - started) * 1000) if first_text_at else None,
+                        "queue_wait_ms": round(queue_wait * 1000),
+                        "bytes_sent": bytes_sent,
+                    })
             
-            # Get stream (synchronous call returns stream object)
-            # Tools will automatically retrieve menu_id from context
+        except Exception as e:
+            yield frame({"type": "error", "message": str(e)})
+        finally:
+            # Client disconnected or stream failed: stop consuming the agency stream
+            if producer is not None and not producer.done():
+                producer.cancel()
+            slot.release()
+    
+    record_thread_owner(thread_owner)
+    # Admitted before the response starts, so a rejection is a plain 429 rather than an SSE error
+    slot = await admit_turn(current_user)
+    body = generate()
+    # Also release if the body is never iterated (client gone before the first frame)
+    weakref.finalize(body, slot.release)
+    streaming_response = StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+    set_thread_owner(streaming_response, request.thread_id)
+    return streaming_response
+
+
+async def acquire_job_turn(job: Job) -> TurnSlot:
+    """A global turn slot for a background job; unlike /chat it waits instead of failing with 429."""
+    while True:
+        try:
+            return await _admission.acquire_turn()
+        except AdmissionRejected as e:
+            job.emit({"type": "progress", "stage": "waiting_for_capacity", "retry_after": e.retry_after_header})
+            await asyncio.sleep(e.retry_after)
+
+
+async def run_chat_job(job: Job, request: ChatRequest) -> str:
+    """Run one agency turn for a background job, recording its progress events on the job."""
+    # Jobs count against the same concurrent-turn ceiling as /chat and /chat/stream
+    slot = await acquire_job_turn(job)
+    try:
+        return await _run_chat_job_turn(job, request)
+    finally:
+        slot.release()
+
+
+async def _run_chat_job_turn(job: Job, request: ChatRequest) -> str:
+    async with _thread_locks.turn(request.thread_id or "default"):
+        with span("chat.turn", endpoint="/jobs"):
+            agency = await get_agency(request.thread_id)
+            await compact_agency_history(agency)
+            context_override = {"menu_id": request.menu_id} if request.menu_id else None
             stream = agency.get_response_stream(
                 request.message,
                 recipient_agent=None,  # Uses entry point agent
-                context_override=context_override if context_override else None,
+                context_override=context_override,
             )
             
-            # Iterate over stream events
-            async for event in stream:
-                # Format event as JSON for SSE
-                import json
-                event_data = json.dumps({
-                    "type": getattr(event, 'type', 'message'),
-                    "content": str(event),
-                })
-                yield f"data: {event_data}\n\n"
+            # Same event translation as /chat/stream; the job keeps tool and progress events
+            queue = asyncio.Queue(maxsize=SSE_QUEUE_MAX_EVENTS)
+            producer = asyncio.create_task(stream_events(stream, queue))
+            try:
+                async for event in sse_frames(queue):
+                    if event is not None:
+                        job.emit(event)
+            finally:
+                await stop_producer(producer)
             
-            # Get final result
             final_result = await stream.wait_final_result()
-            yield f"data: {json.dumps({'type': 'done', 'result': str(final_result)})}\n\n"
-            
-        except Exception as e:
-            import json
-            error_data = json.dumps({"type": "error", "message": str(e)})
-            yield f"data: {error_data}\n\n"
+            final_output = getattr(final_result, "final_output", final_result)
+            await finish_turn(request.thread_id)
+            return final_output if isinstance(final_output, str) else str(final_output)
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    request: ChatRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Run a chat turn in the background (long menu generations).
     
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream"
-    )
+    Returns the job id immediately. Poll GET /jobs/{job_id} or follow GET /jobs/{job_id}/events
+    for progress (tool started/finished, elapsed time); the final text is the job's "result".
+    """
+    try:
+        _admission.check_rate(current_user.get("user_id"))
+        job = _jobs.submit(
+            lambda job: run_chat_job(job, request),
+            user_id=current_user.get("user_id"),
+            thread_id=request.thread_id,
+            menu_id=request.menu_id,
+        )
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.reason,
+            headers={"Retry-After": e.retry_after_header},
+        )
+    return job.snapshot()
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    after: int = 0,
+    current_user: dict = Depends(get_current_user)
+):
+    """Job status, result and the progress events after sequence number `after`."""
+    snapshot = _jobs.get(job_id, current_user.get("user_id"), after)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return snapshot
+
+
+@app.get("/jobs/{job_id}/events")
+async def follow_job(
+    job_id: str,
+    after: int = 0,
+    last_event_id: Optional[str] = Header(default=None, alias="Last-Event-ID"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Progress events of a job as Server-Sent Events, ending with a "job" event that carries the
+    final status and result. Reconnecting clients resume after Last-Event-ID.
+    """
+    user_id = current_user.get("user_id")
+    if last_event_id and last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+    if _jobs.get(job_id, user_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def generate():
+        async for event in _jobs.follow(job_id, user_id, after):
+            if event is None:
+                yield HEARTBEAT_FRAME
+            else:
+                yield format_sse(event, event.get("seq"))
+    
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Cancel a queued or running job (a finished job is returned unchanged)."""
+    snapshot = _jobs.cancel(job_id, current_user.get("user_id"))
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return snapshot
+
+
+async def run_regeneration_job(job: Job, request: RegenerateMenusRequest, owner_user_id: Optional[str]) -> dict:
+    """Run bulk_regenerate in a thread, recording its per-batch progress on the job."""
+    loop = asyncio.get_running_loop()
+    stop = threading.Event()
+    
+    def progress(update: dict) -> None:
+        loop.call_soon_threadsafe(job.emit, {"type": "progress", **update})
+    
+    def run():
+        from bulk_regenerate import run_bulk_regeneration
+        return run_bulk_regeneration(
+            request.menu_ids,
+            template_filename=request.template_filename,
+            job_name=request.job_name,
+            progress_callback=progress,
+            owner_user_id=owner_user_id,
+            stop_event=stop,
+        )
+    
+    try:
+        # The job (and its first import) is blocking: DB round trips + process pool
+        return await asyncio.to_thread(run)
+    except asyncio.CancelledError:
+        # The thread stops after its current batch; completed menus are skipped on resume
+        stop.set()
+        raise
+
+
+@app.post("/menus/regenerate", status_code=202)
+async def regenerate_menus(
+    request: RegenerateMenusRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Re-populate many menus with a template and save them (see bulk_regenerate.py).
+    
+    Runs as a background job: returns the job id immediately; follow it with GET /jobs/{job_id}
+    (one "progress" event per batch, the summary as the job's "result") and cancel it with
+    DELETE /jobs/{job_id}. Failed menus are retried when the same job_name is sent again.
+    
+    Admins (ADMIN_USERS) may regenerate any menu; other users only menus of their own
+    restaurants, the rest are reported as not found.
+    """
+    if not request.menu_ids:
+        raise HTTPException(status_code=400, detail="menu_ids must not be empty")
+    user_id = current_user.get("user_id")
+    owner_user_id = None if is_admin(current_user) else user_id
+    if owner_user_id is None and not is_admin(current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to regenerate menus")
+    
+    try:
+        job = _jobs.submit(lambda job: run_regeneration_job(job, request, owner_user_id), user_id=user_id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.reason,
+            headers={"Retry-After": e.retry_after_header},
+        )
+    return job.snapshot()
 
 
 if __name__ == "__main__":
@@ -8,13 +8,22 @@ import json
 import re
 from typing import Dict, List, Any, Optional
 from pathlib import Path
-from dotenv import load_dotenv
 
-load_dotenv()
+# Cache shared by the worker processes (homepage fetches, style profiles).
+# Some tests dynamically load this module without package context, so we need fallbacks.
+try:
+    from .shared_cache import cache_get, cache_set, fetch_page  # type: ignore
+except Exception:  # pragma: no cover
+    try:
+        from menu_creator.tools.shared_cache import cache_get, cache_set, fetch_page  # type: ignore
+    except Exception:  # pragma: no cover
+        from shared_cache import cache_get, cache_set, fetch_page  # type: ignore
 
-# Cache directory for screenshots
+# Cache directory for screenshots (created on first write)
 CACHE_IMAGES_DIR = Path(__file__).resolve().parent.parent.parent / "cache" / "images"
-CACHE_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+
+# How long a website's style analysis is reused (shared cache, all workers)
+STYLE_PROFILE_TTL_SECONDS = float(os.getenv("STYLE_PROFILE_TTL_SECONDS", str(24 * 3600)))
 
 # Menu-related keywords in multiple languages
 MENU_KEYWORDS = [
@@ -64,15 +73,20 @@ class AnalyzeWebsiteStyles(BaseTool):
         Step 8: Return comprehensive style analysis as JSON with menu screenshots
         """
         try:
-            # Step 1: Fetch website content
+            # A recent analysis of the same site (by any worker) is reused
+            profile_key = f"{self.website_url}|screenshots={self.take_screenshots}"
+            cached_profile = self._cached_style_profile(profile_key)
+            if cached_profile is not None:
+                return cached_profile
+            
+            # Step 1: Fetch website content (shared page cache: FindMenuFiles fetches the same homepage)
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
-            response = requests.get(self.website_url, headers=headers, timeout=10)
-            response.raise_for_status()
+            page, _ = fetch_page(self.website_url, headers=headers, timeout=10)
             
             # Step 2: Parse HTML
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = BeautifulSoup(page, 'html.parser')
             
             # Step 3: Extract CSS styles
             css_styles = self._extract_css_styles(soup, self.website_url)
@@ -108,13 +122,29 @@ class AnalyzeWebsiteStyles(BaseTool):
                 "menu_screenshots": menu_screenshots
             }
             
-            return json.dumps(style_analysis, indent=2)
+            result = json.dumps(style_analysis, indent=2)
+            cache_set("style_profiles", profile_key, result, ttl_seconds=STYLE_PROFILE_TTL_SECONDS)
+            return result
             
         except requests.RequestException as e:
             return f"Error fetching website: {str(e)}"
         except Exception as e:
             return f"Error analyzing website: {str(e)}"
 
+    def _cached_style_profile(self, profile_key: str) -> Optional[str]:
+        """Cached analysis, unless one of its screenshots is gone from the image cache."""
+        cached = cache_get("style_profiles", profile_key)
+        if cached is None:
+            return None
+        try:
+            result = cached.decode("utf-8")
+            screenshots = json.loads(result).get("menu_screenshots", [])
+        except (UnicodeDecodeError, ValueError, AttributeError):
+            return None
+        if any(not Path(s.get("screenshot_path", "")).exists() for s in screenshots):
+            return None
+        return result
+
     def _extract_css_styles(self, soup: BeautifulSoup, base_url: str) -> Dict[str, Any]:
         """Extract CSS styles from inline styles and linked stylesheets"""
         css_data = {
@@ -411,6 +441,7 @@ class AnalyzeWebsiteStyles(BaseTool):
             parsed = urlparse(url)
             domain = parsed.netloc.replace('www.', '').replace('.', '_')
             filename = f"menu_{domain}_{index}.png"
+            CACHE_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
             screenshot_path = CACHE_IMAGES_DIR / filename
             
             with sync_playwright() as p:
@@ -6,15 +6,22 @@ from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 import json
 import re
+import hashlib
 from typing import Dict, List, Any, Optional
 from pathlib import Path
-from dotenv import load_dotenv
 
-load_dotenv()
+# Cache shared by the worker processes (homepage fetches).
+# Some tests dynamically load this module without package context, so we need fallbacks.
+try:
+    from .shared_cache import fetch_page  # type: ignore
+except Exception:  # pragma: no cover
+    try:
+        from menu_creator.tools.shared_cache import fetch_page  # type: ignore
+    except Exception:  # pragma: no cover
+        from shared_cache import fetch_page  # type: ignore
 
-# Cache directory for menu files
+# Cache directory for menu files (created on first write)
 CACHE_IMAGES_DIR = Path(__file__).resolve().parent.parent.parent / "cache" / "images"
-CACHE_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
 # Menu-related keywords in multiple languages
 MENU_KEYWORDS = [
@@ -37,6 +44,31 @@ MENU_KEYWORDS = [
 # File extensions for menu files
 MENU_FILE_EXTENSIONS = ['.pdf', '.png', '.jpg', '.jpeg', '.gif', '.webp']
 
+# Download limits: anything larger is almost certainly not a menu (videos, archives)
+MAX_DOWNLOAD_BYTES = int(os.getenv("MENU_DOWNLOAD_MAX_BYTES", str(25 * 1024 * 1024)))  # 25 MB
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB network reads / buffered writes
+SNIFF_BYTES = 16  # Enough for every signature below
+
+# Magic-byte signatures -> canonical extension (the URL extension is not trusted)
+FILE_SIGNATURES = [
+    (b"%PDF-", ".pdf"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+
+def sniff_file_extension(head: bytes) -> Optional[str]:
+    """Detect the real file type from its first bytes. Returns None for unsupported types (HTML, video, ...)."""
+    for signature, extension in FILE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    # WebP is a RIFF container: "RIFF" <size> "WEBP"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
 
 class FindMenuFiles(BaseTool):
     """
@@ -64,11 +96,11 @@ class FindMenuFiles(BaseTool):
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
-            response = requests.get(self.website_url, headers=headers, timeout=10)
-            response.raise_for_status()
+            # Shared page cache: AnalyzeWebsiteStyles fetches the same homepage
+            page, _ = fetch_page(self.website_url, headers=headers, timeout=10)
             
             # Step 2: Parse HTML
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = BeautifulSoup(page, 'html.parser')
             
             # Step 3: Find menu files and URLs
             menu_files = []
@@ -124,7 +156,7 @@ class FindMenuFiles(BaseTool):
                     file_info = {
                         "url": menu_file["url"],
                         "type": download_result.get("type", menu_file["type"]),
-                        "extension": menu_file["extension"],
+                        "extension": download_result.get("extension", menu_file["extension"]),
                         "filename": menu_file["filename"],
                         "original_file": download_result["original_file"],
                         "original_filename": download_result["original_filename"]
@@ -159,38 +191,72 @@ class FindMenuFiles(BaseTool):
             return f"Error finding menu files: {str(e)}"
 
     def _download_file(self, url: str, filename: str) -> Optional[Dict[str, Any]]:
-        """Download a menu file (PDF or image) and save it to cache. Converts PDFs to images."""
+        """
+        Download a menu file (PDF or image) and save it to cache. Converts PDFs to images.
+        
+        The file type is sniffed from the first bytes (not the URL extension), downloads are
+        aborted as soon as they exceed MAX_DOWNLOAD_BYTES, and files are stored under their
+        content hash so a menu already on disk is never written (or converted) twice.
+        """
+        temp_path = None
         try:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
             
-            response = requests.get(url, headers=headers, timeout=15, stream=True)
-            response.raise_for_status()
-            
-            # Create safe filename
-            safe_filename = "".join(c for c in filename if c.isalnum() or c in "._-")[:100]
-            if not safe_filename:
-                from urllib.parse import urlparse
-                parsed = urlparse(url)
-                safe_filename = os.path.basename(parsed.path) or "menu_file"
-            
-            file_path = CACHE_IMAGES_DIR / safe_filename
+            with requests.get(url, headers=headers, timeout=15, stream=True) as response:
+                response.raise_for_status()
+                
+                # Reject oversized files before reading the body when the server tells us the size
+                content_length = response.headers.get('content-length')
+                if content_length and content_length.isdigit() and int(content_length) > MAX_DOWNLOAD_BYTES:
+                    return None
+                
+                chunks = response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+                
+                # Sniff the real file type from the first bytes
+                head = b""
+                for chunk in chunks:
+                    head += chunk
+                    if len(head) >= SNIFF_BYTES:
+                        break
+                file_ext = sniff_file_extension(head)
+                if not file_ext:
+                    # HTML error page, video or any other non-menu payload
+                    return None
+                
+                # Stream to a temp file while hashing, aborting on oversize
+                digest = hashlib.sha256()
+                total_bytes = 0
+                CACHE_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+                temp_path = CACHE_IMAGES_DIR / f".download_{os.getpid()}_{id(self)}.part"
+                with open(temp_path, 'wb', buffering=DOWNLOAD_CHUNK_SIZE) as f:
+                    for chunk in self._prepend(head, chunks):
+                        total_bytes += len(chunk)
+                        if total_bytes > MAX_DOWNLOAD_BYTES:
+                            raise ValueError(f"Download exceeds {MAX_DOWNLOAD_BYTES} bytes")
+                        digest.update(chunk)
+                        f.write(chunk)
             
-            # Download file
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            # Content-addressed filename: identical files share one cache entry
+            file_path = CACHE_IMAGES_DIR / f"menu_{digest.hexdigest()[:16]}{file_ext}"
+            if file_path.exists():
+                temp_path.unlink()
+            else:
+                os.replace(temp_path, file_path)
+            temp_path = None
             
             result = {
                 "original_file": str(file_path),
                 "original_filename": file_path.name,
-                "converted_images": []
+                "converted_images": [],
+                "extension": file_ext,
+                "size_bytes": total_bytes
             }
             
             # If it's a PDF, convert to images
-            if file_path.suffix.lower() == '.pdf':
-                converted_images = self._convert_pdf_to_images(file_path)
+            if file_ext == '.pdf':
+                converted_images = self._find_converted_images(file_path) or self._convert_pdf_to_images(file_path)
                 if converted_images:
                     result["converted_images"] = converted_images
                     result["type"] = "pdf_converted"
@@ -202,11 +268,39 @@ class FindMenuFiles(BaseTool):
             return result
             
         except Exception as e:
-            # Download failed - return None but don't fail
+            # Download failed or was rejected - return None but don't fail
             return None
+        finally:
+            if temp_path is not None and temp_path.exists():
+                temp_path.unlink()
+
+    @staticmethod
+    def _prepend(head: bytes, chunks):
+        """Yield the already-sniffed head followed by the remaining chunks."""
+        if head:
+            yield head
+        yield from chunks
+
+    def _find_converted_images(self, pdf_path: Path) -> List[Dict[str, str]]:
+        """Return page images from a previous conversion of the same (content-addressed) PDF."""
+        converted_images = []
+        page_num = 1
+        while True:
+            image_filename = f"{pdf_path.stem}_page_{page_num}.png"
+            image_path = CACHE_IMAGES_DIR / image_filename
+            if not image_path.exists():
+                break
+            converted_images.append({
+                "page": page_num,
+                "image_path": str(image_path),
+                "image_filename": image_filename
+            })
+            page_num += 1
+        return converted_images
 
     def _convert_pdf_to_images(self, pdf_path: Path) -> List[Dict[str, str]]:
         """Convert PDF file to images (one image per page)"""
+        CACHE_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
         try:
             # Try PyMuPDF (fitz) first - faster and doesn't require external dependencies
             try:
@@ -4,31 +4,268 @@ from agency_swarm.tools.utils import tool_output_image_from_path
 from pydantic import Field
 import os
 import json
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict
+from collections.abc import Callable, Iterator, Sequence
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Union
-from dotenv import load_dotenv
+from typing import Dict, List, Any, Optional, Union, Tuple
 
-load_dotenv()
+# Rendered fragments are also shared between worker processes; outputs go to the artifact store.
+# The Supabase client is the one shared by the HTML tools (html_storage).
+# Some tests dynamically load this module without package context, so we need fallbacks.
+try:
+    from .shared_cache import cache_get, cache_set  # type: ignore
+    from .artifact_store import store_artifact  # type: ignore
+    from .html_storage import SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+except Exception:  # pragma: no cover
+    try:
+        from menu_creator.tools.shared_cache import cache_get, cache_set  # type: ignore
+        from menu_creator.tools.artifact_store import store_artifact  # type: ignore
+        from menu_creator.tools.html_storage import SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+    except Exception:  # pragma: no cover
+        from shared_cache import cache_get, cache_set  # type: ignore
+        from artifact_store import store_artifact  # type: ignore
+        from html_storage import SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
 
-# Cache directory for HTML menus
+# Cache directory for HTML menus (created on first write)
 CACHE_DIR = Path(__file__).resolve().parent.parent.parent / "cache" / "menus"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
-# Try to import Supabase client
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
-except ImportError:
-    SUPABASE_AVAILABLE = False
-    Client = None
+# One embedded PostgREST select: menu -> restaurant(name) -> categories -> visible items.
+# Only the columns the template needs are requested.
+MENU_TEMPLATE_SELECT = (
+    "id, name, restaurant_id, is_default, "
+    "restaurant:restaurants(name), "
+    "categories(id, name, description, position, "
+    "items(id, name, description, price_cents, currency, is_visible, created_at))"
+)
 
 # Try to import chevron (Mustache template engine)
 try:
     import chevron
+    from chevron.tokenizer import tokenize as chevron_tokenize
+    from chevron.renderer import _get_key as chevron_get_key, _html_escape as chevron_html_escape
     CHEVRON_AVAILABLE = True
 except ImportError:
     CHEVRON_AVAILABLE = False
 
+# Compiled-template cache: content hash -> Python render function built from the Mustache tokens.
+# Re-rendering the same template with new menu data never re-tokenizes or re-walks the token stream.
+TEMPLATE_CACHE_MAX_ENTRIES = int(os.getenv("TEMPLATE_CACHE_MAX_ENTRIES", "32"))
+_compiled_templates: "OrderedDict[str, Callable[[Dict], str]]" = OrderedDict()
+# Template file (path, mtime, size) -> (content, content hash), so unchanged files are not re-read or re-hashed
+_template_files: Dict[Tuple[str, int, int], Tuple[str, str]] = {}
+_template_cache_lock = threading.Lock()
+
+# Fragment cache for top-level list sections ({{#categories}}): one rendered fragment per element,
+# keyed by template, section, element content hash and the hash of the surrounding data. When one
+# item changes, only its category is re-rendered; every other fragment is spliced in from cache.
+# Misses fall back to the shared cache ("fragments"), so a fragment rendered by one worker is
+# reused by the others.
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", "4096"))
+_rendered_fragments: "OrderedDict[Tuple[str, int, str, str], str]" = OrderedDict()
+_render_stats: contextvars.ContextVar = contextvars.ContextVar("menu_render_stats", default=None)
+
+
+def template_content_hash(template_content: str) -> str:
+    return hashlib.sha256(template_content.encode("utf-8")).hexdigest()
+
+
+def _lookup(key: str, scopes: List[Any]) -> Any:
+    """chevron's _get_key, with a fast path for plain keys found in the innermost dict scope."""
+    first = scopes[0]
+    if type(first) is dict and key in first:
+        value = first[key]
+        if type(value) in (str, list, dict, int, float, bool):
+            return value if value in (0, False) else (value or "")
+    return chevron_get_key(key, scopes)
+
+
+def _data_hash(data: Any) -> str:
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def _render_cached_fragments(scope, scopes, output, children, fragment_prefix):
+    """Render each element of a top-level list section, reusing fragments whose inputs are unchanged."""
+    template_hash, section_position, key = fragment_prefix
+    context = {k: v for k, v in scopes[-1].items() if k != key} if isinstance(scopes[-1], dict) else scopes[-1]
+    context_hash = _data_hash(context)
+    stats = _render_stats.get()
+
+    for thing in scope:
+        if not thing:
+            continue
+        cache_key = (template_hash, section_position, _data_hash(thing), context_hash)
+        with _template_cache_lock:
+            fragment = _rendered_fragments.get(cache_key)
+            if fragment is not None:
+                _rendered_fragments.move_to_end(cache_key)
+
+        if fragment is None:
+            shared_key = ":".join(str(part) for part in cache_key)
+            shared = cache_get("fragments", shared_key)
+            if shared is not None:
+                fragment = shared.decode("utf-8")
+            else:
+                fragment_output: List[str] = []
+                inner = [thing] + scopes
+                for child in children:
+                    child(inner, fragment_output)
+                fragment = "".join(fragment_output)
+                cache_set("fragments", shared_key, fragment)
+            with _template_cache_lock:
+                _rendered_fragments[cache_key] = fragment
+                while len(_rendered_fragments) > FRAGMENT_CACHE_MAX_ENTRIES:
+                    _rendered_fragments.popitem(last=False)
+            if stats is not None:
+                stats["fragments_rendered" if shared is None else "fragments_reused"] += 1
+        elif stats is not None:
+            stats["fragments_reused"] += 1
+
+        output.append(fragment)
+
+
+def _compile_nodes(tokens: List[Tuple[str, str]], position: int = 0, end_key: Optional[str] = None, template_hash: Optional[str] = None) -> Tuple[List[Callable], int]:
+    """
+    Turn a token stream into a list of node functions (scopes, output) -> None.
+    Mirrors chevron.render semantics for literals, variables, sections and inverted sections.
+    Top-level list sections (when template_hash is given) render through the fragment cache.
+    """
+    top_level = end_key is None
+    nodes = []
+    while position < len(tokens):
+        tag, key = tokens[position]
+        position += 1
+
+        if tag == "end":
+            if key == end_key:
+                return nodes, position
+            continue
+
+        if tag == "literal":
+            nodes.append(lambda scopes, output, text=key: output.append(text))
+
+        elif tag == "variable":
+            def variable(scopes, output, key=key):
+                thing = _lookup(key, scopes)
+                if thing is True and key == ".":
+                    # Inverted sections push True; chevron then prints the enclosing scope
+                    thing = scopes[1]
+                output.append(chevron_html_escape(thing if isinstance(thing, str) else str(thing)))
+            nodes.append(variable)
+
+        elif tag == "no escape":
+            def no_escape(scopes, output, key=key):
+                thing = _lookup(key, scopes)
+                output.append(thing if isinstance(thing, str) else str(thing))
+            nodes.append(no_escape)
+
+        elif tag in ("section", "inverted section"):
+            section_start = position - 1
+            children, position = _compile_nodes(tokens, position, key)
+            section_tokens = tokens[section_start:position]
+
+            if tag == "inverted section":
+                def inverted(scopes, output, key=key, children=children):
+                    if not _lookup(key, scopes):
+                        inner = [True] + scopes
+                        for child in children:
+                            child(inner, output)
+                nodes.append(inverted)
+            else:
+                fragment_prefix = (template_hash, section_start, key) if top_level and template_hash else None
+
+                def section(scopes, output, key=key, children=children, section_tokens=section_tokens, fragment_prefix=fragment_prefix):
+                    scope = _lookup(key, scopes)
+                    if isinstance(scope, Callable):
+                        # Lambdas receive the raw section text; let chevron handle them
+                        output.append(chevron.render(section_tokens, scopes=list(scopes)))
+                    elif fragment_prefix and isinstance(scope, Sequence) and not isinstance(scope, str):
+                        _render_cached_fragments(scope, scopes, output, children, fragment_prefix)
+                    elif isinstance(scope, (Sequence, Iterator)) and not isinstance(scope, str):
+                        for thing in scope:
+                            if not thing:
+                                continue
+                            inner = [thing] + scopes
+                            for child in children:
+                                child(inner, output)
+                    elif scope:
+                        inner = [scope] + scopes
+                        for child in children:
+                            child(inner, output)
+                nodes.append(section)
+
+        # Comments and delimiter changes produce no output (the tokenizer already applied delimiters)
+
+    return nodes, position
+
+
+def compile_template(template_content: str, content_hash: Optional[str] = None) -> Callable[[Dict], str]:
+    """Return a render function for the template, compiling it only on the first use of this content."""
+    content_hash = content_hash or template_content_hash(template_content)
+    with _template_cache_lock:
+        compiled = _compiled_templates.get(content_hash)
+        if compiled is not None:
+            _compiled_templates.move_to_end(content_hash)
+            return compiled
+
+    tokens = list(chevron_tokenize(template_content))
+    if any(tag == "partial" for tag, _ in tokens):
+        # Partials depend on the file system at render time; keep chevron's implementation
+        def compiled(data: Dict, tokens=tokens) -> str:
+            return chevron.render(tokens, data)
+    else:
+        nodes, _ = _compile_nodes(tokens, template_hash=content_hash)
+
+        def compiled(data: Dict, nodes=nodes) -> str:
+            output: List[str] = []
+            scopes = [data]
+            for node in nodes:
+                node(scopes, output)
+            return "".join(output)
+
+    with _template_cache_lock:
+        _compiled_templates[content_hash] = compiled
+        while len(_compiled_templates) > TEMPLATE_CACHE_MAX_ENTRIES:
+            _compiled_templates.popitem(last=False)
+    return compiled
+
+
+def read_template(template_path: Path) -> Tuple[str, str]:
+    """Read a template file, returning (content, content hash); cached on path + mtime + size."""
+    stat = template_path.stat()
+    key = (str(template_path.resolve()), stat.st_mtime_ns, stat.st_size)
+    with _template_cache_lock:
+        cached = _template_files.get(key)
+    if cached is not None:
+        return cached
+
+    with open(template_path, 'r', encoding='utf-8') as f:
+        template_content = f.read()
+    cached = (template_content, template_content_hash(template_content))
+
+    with _template_cache_lock:
+        # Keep one entry per path: drop versions of this file that are now stale
+        for stale_key in [k for k in _template_files if k[0] == key[0]]:
+            del _template_files[stale_key]
+        _template_files[key] = cached
+    return cached
+
+
+def render_template(template_content: str, template_data: Dict, content_hash: Optional[str] = None, stats: Optional[Dict[str, int]] = None) -> str:
+    """
+    Render a Mustache template through the compiled-template and fragment caches.
+    If a stats dict is given, it receives fragments_rendered / fragments_reused counts.
+    """
+    if stats is not None:
+        stats.setdefault("fragments_rendered", 0)
+        stats.setdefault("fragments_reused", 0)
+    token = _render_stats.set(stats)
+    try:
+        return compile_template(template_content, content_hash)(template_data)
+    finally:
+        _render_stats.reset(token)
 
 class PopulateMenuFromDB(BaseTool):
     """
@@ -56,6 +293,11 @@ class PopulateMenuFromDB(BaseTool):
     - Logo URLs, images, or design elements (add from style analysis)
     - Colors, fonts, or typography (add in CSS from style analysis)
     - Layout or styling (design in template)
+    
+    **Data edits (prices, names):** the screenshot is only re-taken when the template changed
+    since the last one, so re-populating after a data edit costs the database query and the
+    render of the changed categories, not a browser launch. Set take_screenshot=True to
+    review the layout with the new data anyway.
     """
     menu_id: Optional[str] = Field(
         default=None,
@@ -73,87 +315,89 @@ class PopulateMenuFromDB(BaseTool):
         default="menu-populated.html",
         description="Filename for the populated menu output. Defaults to 'menu-populated.html'."
     )
+    take_screenshot: Optional[bool] = Field(
+        default=None,
+        description="Whether to screenshot the populated menu. By default a screenshot is only taken when the template changed since the last one (data-only edits skip it). Set True to always take one, False to never."
+    )
 
-    def _get_supabase_client(self) -> Optional[Client]:
-        """Create Supabase client from environment variables"""
-        if not SUPABASE_AVAILABLE:
+    def _menu_query(self, supabase):
+        """
+        Build the single-round-trip menu query.
+        Invisible items are filtered server-side; categories are ordered by position and
+        items by creation time (the items table has no position column).
+        """
+        return (
+            supabase.table("menus")
+            .select(MENU_TEMPLATE_SELECT)
+            .eq("categories.items.is_visible", True)
+            .order("position", desc=False, foreign_table="categories")
+            .order("created_at", desc=False, foreign_table="categories.items")
+        )
+
+    def _menu_from_row(self, menu: Dict) -> Optional[Dict]:
+        """Convert an embedded menu row into the menu structure used by _transform_to_template_data"""
+        restaurant_id = menu.get("restaurant_id") or menu.get("restaurantId")
+        if not restaurant_id:
             return None
         
-        supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL") or os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+        restaurant = menu.get("restaurant") or {}
+        restaurant_name = restaurant.get("name") if isinstance(restaurant, dict) else None
         
-        if not supabase_url or not supabase_key:
-            return None
+        categories = []
+        for category in sorted(menu.get("categories") or [], key=lambda c: c.get("position") or 0):
+            items = []
+            for item in category.get("items") or []:
+                is_visible = item.get("is_visible", item.get("isVisible", True))
+                if is_visible:
+                    price_cents = item.get("price_cents", item.get("priceCents", 0))
+                    items.append({
+                        "id": item["id"],
+                        "name": item["name"],
+                        "description": item.get("description", ""),
+                        "priceCents": price_cents,
+                        "currency": item.get("currency", "EUR"),
+                        "isVisible": is_visible
+                    })
+            
+            categories.append({
+                "id": category["id"],
+                "name": category["name"],
+                "description": category.get("description", ""),
+                "dishes": items
+            })
         
+        return {
+            "id": menu["id"],
+            "name": menu["name"],
+            "restaurantId": restaurant_id,
+            "restaurantName": restaurant_name,
+            "categories": categories
+        }
+
+    def _fetch_menu_from_supabase(self, supabase, menu_id: str) -> Optional[Dict]:
+        """Fetch menu, restaurant name and categories with visible items in one query"""
         try:
-            return create_client(supabase_url, supabase_key)
-        except Exception:
-            return None
-    
-    def _fetch_menu_from_supabase(self, supabase: Client, menu_id: str) -> Optional[Dict]:
-        """Fetch menu data directly from Supabase"""
-        try:
-            # Fetch menu
-            menu_response = supabase.table("menus").select("*").eq("id", menu_id).single().execute()
+            menu_response = self._menu_query(supabase).eq("id", menu_id).limit(1).execute()
             if not menu_response.data:
                 return None
-            
-            menu = menu_response.data
-            restaurant_id = menu.get("restaurant_id") or menu.get("restaurantId")
-            if not restaurant_id:
-                return None
-            
-            # Fetch restaurant (only name needed - logo/images come from agent's style analysis)
-            restaurant_response = supabase.table("restaurants").select("name").eq("id", restaurant_id).single().execute()
-            restaurant_name = restaurant_response.data.get("name") if restaurant_response.data else None
-            
-            # Fetch categories with items (ordered by position)
-            categories_response = supabase.table("categories").select("*, items(*)").eq("menu_id", menu_id).order("position", desc=False).execute()
-            
-            categories = []
-            for category in categories_response.data:
-                items = []
-                category_items = category.get("items", [])
-                for item in category_items:
-                    is_visible = item.get("is_visible", item.get("isVisible", True))
-                    if is_visible:
-                        price_cents = item.get("price_cents", item.get("priceCents", 0))
-                        items.append({
-                            "id": item["id"],
-                            "name": item["name"],
-                            "description": item.get("description", ""),
-                            "priceCents": price_cents,
-                            "currency": item.get("currency", "EUR"),
-                            "isVisible": is_visible
-                        })
-                
-                categories.append({
-                    "id": category["id"],
-                    "name": category["name"],
-                    "description": category.get("description", ""),
-                    "dishes": items
-                })
-            
-            return {
-                "id": menu["id"],
-                "name": menu["name"],
-                "restaurantId": restaurant_id,
-                "restaurantName": restaurant_name,
-                "categories": categories
-            }
+            return self._menu_from_row(menu_response.data[0])
         except Exception:
             return None
     
-    def _fetch_default_menu_from_supabase(self, supabase: Client, restaurant_id: str) -> Optional[Dict]:
-        """Fetch default menu for a restaurant"""
+    def _fetch_default_menu_from_supabase(self, supabase, restaurant_id: str) -> Optional[Dict]:
+        """Fetch the restaurant's default menu (or its oldest menu) in one query"""
         try:
-            menus_response = supabase.table("menus").select("*").eq("restaurant_id", restaurant_id).execute()
+            menus_response = (
+                self._menu_query(supabase)
+                .eq("restaurant_id", restaurant_id)
+                .order("is_default", desc=True)
+                .order("created_at", desc=False)
+                .limit(1)
+                .execute()
+            )
             if not menus_response.data:
                 return None
-            
-            menus = menus_response.data
-            default_menu = next((m for m in menus if m.get("is_default") or m.get("isDefault")), menus[0])
-            return self._fetch_menu_from_supabase(supabase, default_menu["id"])
+            return self._menu_from_row(menus_response.data[0])
         except Exception:
             return None
     
@@ -248,7 +492,7 @@ class PopulateMenuFromDB(BaseTool):
             if not SUPABASE_AVAILABLE:
                 return "Error: Supabase library not installed. Run: pip install supabase"
             
-            supabase = self._get_supabase_client()
+            supabase = get_supabase_client()
             if not supabase:
                 return "Error: Supabase credentials not found. Please set NEXT_PUBLIC_SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in .env"
             
@@ -271,38 +515,70 @@ class PopulateMenuFromDB(BaseTool):
             if not template_path.exists():
                 return f"Error: Template file not found: {template_path}"
             
-            with open(template_path, 'r', encoding='utf-8') as f:
-                template_content = f.read()
+            template_content, template_hash = read_template(template_path)
             
             # Step 6: Transform data for template
             template_data = self._transform_to_template_data(menu)
             
-            # Step 7: Render template using chevron (proper Mustache rendering)
-            populated_html = chevron.render(template_content, template_data)
+            # Step 7: Render template (compiled once per template; unchanged categories reuse cached fragments)
+            render_stats: Dict[str, int] = {}
+            populated_html = render_template(template_content, template_data, template_hash, render_stats)
             
-            # Step 8: Save populated HTML
+            # Step 8: Save populated HTML (skipped when the output is already identical)
             output_path = CACHE_DIR / self.output_filename
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(populated_html)
+            previous_screenshot = output_path.with_suffix('.png')
+            unchanged = (
+                output_path.exists()
+                and previous_screenshot.exists()
+                and previous_screenshot.stat().st_mtime_ns >= output_path.stat().st_mtime_ns
+                and output_path.read_text(encoding='utf-8') == populated_html
+            )
+            if not unchanged:
+                CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    f.write(populated_html)
             
-            # Step 9: Take screenshot
-            screenshot_path = self._take_html_screenshot(output_path)
+            # Step 9: Take screenshot (reuse the previous one if nothing changed; data-only
+            # edits skip it unless asked, since the template's layout was already reviewed)
+            if self.take_screenshot is None:
+                template_reviewed = (
+                    previous_screenshot.exists()
+                    and previous_screenshot.stat().st_mtime_ns >= template_path.stat().st_mtime_ns
+                )
+                screenshot_wanted = not template_reviewed
+            else:
+                screenshot_wanted = self.take_screenshot
+            if unchanged and self.take_screenshot is not False:
+                screenshot_path = previous_screenshot
+            elif screenshot_wanted:
+                screenshot_path = self._take_html_screenshot(output_path)
+            else:
+                screenshot_path = None
             
             # Step 10: Return result
             restaurant_name = template_data.get("restaurantName", "Unknown")
             categories_count = len(template_data.get("categories", []))
             total_items = sum(len(cat.get("items", [])) for cat in template_data.get("categories", []))
             
+            # Handles let SaveMenuToDB / SaveHTMLFile take the populated HTML without it passing through the model
+            summary = f"{restaurant_name}: {categories_count} categories, {total_items} items"
             result_data = {
                 "success": True,
                 "output_file": str(output_path),
+                "html_artifact": store_artifact(populated_html, "html", summary=summary, media_type="text/html"),
                 "restaurant_name": restaurant_name,
                 "categories_count": categories_count,
                 "total_items": total_items,
+                "categories_rerendered": render_stats.get("fragments_rendered", 0),
+                "categories_reused": render_stats.get("fragments_reused", 0),
+                "unchanged": unchanged,
                 "message": f"Menu populated successfully with {categories_count} categories and {total_items} items"
             }
             
             if screenshot_path and screenshot_path.exists():
+                result_data["screenshot_artifact"] = store_artifact(
+                    screenshot_path.read_bytes(), "screenshot", summary=summary, media_type="image/png"
+                )
                 summary_text = json.dumps(result_data, indent=2)
                 summary_text += f"\n\n✓ Screenshot saved: {screenshot_path.name}"
                 summary_text += "\n\n**IMPORTANT: The populated menu is displayed above as an image.**"
@@ -314,10 +590,18 @@ class PopulateMenuFromDB(BaseTool):
                 summary_text += "\n- Responsive design problems"
                 summary_text += "\n- Any other visual imperfections"
                 summary_text += "\n\n**If you find any issues, update the template (menu.html) and re-populate.**"
+                summary_text += f"\n\nTo store this menu, pass html_content=\"{result_data['html_artifact']}\" to SaveMenuToDB."
                 return [
                     tool_output_image_from_path(screenshot_path, detail="low"),  # Use "low" to avoid size limits
                     ToolOutputText(text=summary_text)
                 ]
+            elif not screenshot_wanted:
+                result_data["screenshot_note"] = (
+                    "Screenshot skipped (take_screenshot=false, or the template has not changed since the "
+                    "last screenshot). Set take_screenshot=true to review the layout with the new data."
+                )
+                result_data["save_hint"] = f"To store this menu, pass html_content=\"{result_data['html_artifact']}\" to SaveMenuToDB."
+                return json.dumps(result_data, indent=2)
             else:
                 result_data["screenshot_note"] = "Screenshot could not be generated"
                 return json.dumps(result_data, indent=2)
@@ -328,6 +612,9 @@ class PopulateMenuFromDB(BaseTool):
 
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
     # Test the tool
     print("Testing PopulateMenuFromDB with chevron Mustache rendering...")
     tool = PopulateMenuFromDB(
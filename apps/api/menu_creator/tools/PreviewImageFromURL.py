@@ -5,13 +5,9 @@ from pydantic import Field
 from typing import Union, List
 from pathlib import Path
 import requests
-from dotenv import load_dotenv
 
-load_dotenv()
-
-# Cache directory for downloaded images
+# Cache directory for downloaded images (created on first write)
 CACHE_IMAGES_DIR = Path(__file__).resolve().parent.parent.parent / "cache" / "images"
-CACHE_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
 
 class PreviewImageFromURL(BaseTool):
@@ -58,6 +54,7 @@ class PreviewImageFromURL(BaseTool):
             if '.' not in filename:
                 filename += '.jpg'
             
+            CACHE_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
             cache_path = CACHE_IMAGES_DIR / filename
             
             # Download and save image
@@ -3,26 +3,29 @@ from pydantic import Field
 import os
 from pathlib import Path
 from typing import Optional
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
 
-load_dotenv()
+# Shared HTML column resolution, parsed-DOM cache and artifact store (handles for full documents).
+# Some tests dynamically load this module without package context, so we need fallbacks.
+try:
+    from .html_storage import read_menu_html, SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+    from .html_index import db_source_key, db_source_version, file_source_key, get_cached_index, store_html_index  # type: ignore
+    from .artifact_store import ARTIFACT_INLINE_MAX_CHARS, store_artifact  # type: ignore
+except Exception:  # pragma: no cover
+    try:
+        from menu_creator.tools.html_storage import read_menu_html, SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+        from menu_creator.tools.html_index import db_source_key, db_source_version, file_source_key, get_cached_index, store_html_index  # type: ignore
+        from menu_creator.tools.artifact_store import ARTIFACT_INLINE_MAX_CHARS, store_artifact  # type: ignore
+    except Exception:  # pragma: no cover
+        from html_storage import read_menu_html, SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+        from html_index import db_source_key, db_source_version, file_source_key, get_cached_index, store_html_index  # type: ignore
+        from artifact_store import ARTIFACT_INLINE_MAX_CHARS, store_artifact  # type: ignore
 
 # Cache directory for HTML menus
 CACHE_DIR = Path(__file__).resolve().parent.parent.parent / "cache" / "menus"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 # Default menu filename
 DEFAULT_MENU_FILE = "menu.html"
 
-# Try to import Supabase client
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
-except ImportError:
-    SUPABASE_AVAILABLE = False
-    Client = None
-
 
 class ReadHTMLPart(BaseTool):
     """
@@ -32,6 +35,9 @@ class ReadHTMLPart(BaseTool):
     If menu_id is not provided, reads from local file system (for local development).
     
     Useful for checking what content exists before updating or for reading specific sections.
+    
+    For 'all', a large document is returned as an artifact handle with its structure instead of
+    the full text; pass the handle as html_content to SaveHTMLFile, UpdateHTMLFile or SaveMenuToDB.
     """
     part: str = Field(
         default="all",
@@ -47,60 +53,52 @@ class ReadHTMLPart(BaseTool):
     field_name: str = Field(
         default="html_content", description="Database field name to read from (only used if menu_id provided). Defaults to 'html_content'."
     )
-
-    def _get_supabase_client(self) -> Optional[Client]:
-        """Create Supabase client from environment variables"""
-        if not SUPABASE_AVAILABLE:
-            return None
-        
-        supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL") or os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        
-        if not supabase_url or not supabase_key:
-            return None
-        
-        try:
-            return create_client(supabase_url, supabase_key)
-        except Exception:
-            return None
+    inline: bool = Field(
+        default=False, description="For part='all': return the full HTML text instead of an artifact handle. Only set when you must read every line; prefer reading individual parts."
+    )
 
     def _read_html_from_db(self, menu_id: str) -> Optional[str]:
-        """Read HTML content from database"""
+        """Read HTML content from database (single select on the resolved HTML column)"""
         if not SUPABASE_AVAILABLE:
             return None
         
-        supabase = self._get_supabase_client()
+        supabase = get_supabase_client()
         if not supabase:
             return None
         
         try:
-            # Try multiple field names
-            field_names_to_try = [self.field_name, "html_content", "html", "menu_html"]
-            
-            for field_name in field_names_to_try:
-                try:
-                    menu_response = supabase.table("menus").select(f"id, name, {field_name}").eq("id", menu_id).single().execute()
-                    if menu_response.data:
-                        html_content = menu_response.data.get(field_name)
-                        if html_content:
-                            return html_content
-                except Exception:
-                    continue
-            
+            menu, field_name = read_menu_html(supabase, menu_id, self.field_name)
+            if menu:
+                return menu.get(field_name) or None
             return None
         except Exception:
             return None
 
+    @staticmethod
+    def _outline(index: dict) -> str:
+        """Structural summary of an indexed document (parts present, sizes, section titles)."""
+        lines = []
+        for name in ("header", "styles", "footer"):
+            if index.get(name):
+                lines.append(f"- {name}: {len(index[name]):,} characters")
+        sections = index.get("sections") or []
+        if sections:
+            lines.append(f"- {len(sections)} menu sections:")
+            for i, section in enumerate(sections, 1):
+                lines.append(f"  {i}. {section['title'].strip()} ({len(section['html']):,} characters)")
+        return "\n".join(lines) or "- no header, styles, footer or menu sections found"
+
     def run(self):
         """
         Step 1: Check if menu_id provided (use database) or filename (use file system)
-        Step 2a (DB): Read from database
-        Step 2b (File): Read from file system
-        Step 3: Parse and extract requested part
-        Step 4: Return the requested part
+        Step 2: Reuse the cached parsed index if this menu was read before and not written since
+        Step 3a (DB): Read from database
+        Step 3b (File): Read from file system
+        Step 4: Parse once and index header/footer/styles/sections
+        Step 5: Return the requested part
         """
         try:
-            html_content = None
+            index = None
             
             # Try to get menu_id from context if not provided
             menu_id_to_use = self.menu_id
@@ -115,25 +113,33 @@ class ReadHTMLPart(BaseTool):
                 if not SUPABASE_AVAILABLE:
                     return "Error: Supabase library not installed. Run: pip install supabase"
                 
-                html_content = self._read_html_from_db(menu_id_to_use)
+                # Reuse the cached index unless a worker saved this menu since (shared version token)
+                source_key = db_source_key(menu_id_to_use)
+                db_version = db_source_version(source_key)
+                index = get_cached_index(source_key, db_version)
                 
-                if html_content is None:
-                    supabase = self._get_supabase_client()
-                    if not supabase:
-                        return "Error: Supabase credentials not found. Please set NEXT_PUBLIC_SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in .env"
+                if index is None:
+                    html_content = self._read_html_from_db(menu_id_to_use)
+                    
+                    if html_content is None:
+                        supabase = get_supabase_client()
+                        if not supabase:
+                            return "Error: Supabase credentials not found. Please set NEXT_PUBLIC_SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in .env"
+                        
+                        # Verify menu exists
+                        try:
+                            menu_response = supabase.table("menus").select("id, name").eq("id", menu_id_to_use).single().execute()
+                            if not menu_response.data:
+                                return f"Error: Menu with id '{menu_id_to_use}' not found in database."
+                            menu_name = menu_response.data.get("name", "Unknown")
+                            return f"Error: Menu '{menu_name}' found but HTML content is not stored in database. Use SaveHTMLFile with menu_id to save HTML first."
+                        except Exception as e:
+                            return f"Error: Could not read menu from database: {str(e)}"
                     
-                    # Verify menu exists
-                    try:
-                        menu_response = supabase.table("menus").select("id, name").eq("id", menu_id_to_use).single().execute()
-                        if not menu_response.data:
-                            return f"Error: Menu with id '{menu_id_to_use}' not found in database."
-                        menu_name = menu_response.data.get("name", "Unknown")
-                        return f"Error: Menu '{menu_name}' found but HTML content is not stored in database. Use SaveHTMLFile with menu_id to save HTML first."
-                    except Exception as e:
-                        return f"Error: Could not read menu from database: {str(e)}"
+                    index = store_html_index(source_key, html_content, db_version)
             
             # Otherwise, read from file system (local development)
-            if html_content is None:
+            if index is None:
                 # Step 1: Sanitize filename
                 if not self.filename.endswith('.html'):
                     self.filename = f"{self.filename}.html"
@@ -148,59 +154,76 @@ class ReadHTMLPart(BaseTool):
                 if not file_path.exists():
                     return f"Menu file '{filename}' not found. Use SaveHTMLFile to create a new menu."
                 
-                # Step 4: Read file content
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    html_content = f.read()
+                # Step 4: Reuse the cached index unless the file changed on disk
+                source_key = file_source_key(file_path)
+                file_version = file_path.stat().st_mtime_ns
+                index = get_cached_index(source_key, file_version)
+                
+                if index is None:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        html_content = f.read()
+                    if html_content:
+                        index = store_html_index(source_key, html_content, file_version)
             
             # Step 5: Extract requested part
-            if not html_content:
+            if not index or not index["html"]:
                 source = "database" if self.menu_id else "file system"
                 return f"Error: No HTML content found in {source}."
             
-            # Parse HTML
-            soup = BeautifulSoup(html_content, 'html.parser')
+            html_content = index["html"]
+            part = self.part.lower()
             
             # Extract requested part
-            if self.part.lower() == "all":
+            if part == "all":
                 source_note = f" (from database, menu_id: {menu_id_to_use})" if menu_id_to_use else f" (from file: {self.filename})"
-                return f"Full menu content ({len(html_content)} characters){source_note}:\n\n{html_content}"
+                if self.inline or len(html_content) <= ARTIFACT_INLINE_MAX_CHARS:
+                    return f"Full menu content ({len(html_content)} characters){source_note}:\n\n{html_content}"
+                
+                # Large documents go to the artifact store; the model gets a handle and the structure
+                outline = self._outline(index)
+                handle = store_artifact(html_content, "html", summary=outline, media_type="text/html")
+                return (
+                    f"Full menu content ({len(html_content)} characters){source_note} stored as {handle}\n\n"
+                    f"Structure:\n{outline}\n\n"
+                    f"To save or replace this document, pass html_content=\"{handle}\" to SaveHTMLFile, "
+                    f"UpdateHTMLFile or SaveMenuToDB (no need to copy the HTML). Read a part with "
+                    f"part='header', 'styles', 'footer' or a section name, or inline=True for the full text."
+                )
             
-            if self.part.lower() == "header":
-                header = soup.find('header') or soup.find('.menu-header')
-                if header:
-                    return f"Header section:\n\n{str(header)}"
+            if part == "header":
+                if index["header"]:
+                    return f"Header section:\n\n{index['header']}"
                 return "Header section not found in menu."
             
-            elif self.part.lower() == "footer":
-                footer = soup.find('footer') or soup.find('.menu-footer')
-                if footer:
-                    return f"Footer section:\n\n{str(footer)}"
+            elif part == "footer":
+                if index["footer"]:
+                    return f"Footer section:\n\n{index['footer']}"
                 return "Footer section not found in menu."
             
-            elif self.part.lower() == "styles":
-                styles = soup.find('style')
-                if styles:
-                    return f"CSS Styles:\n\n{styles.string or str(styles)}"
+            elif part == "styles":
+                if index["styles"]:
+                    return f"CSS Styles:\n\n{index['styles']}"
                 return "Styles section not found in menu."
             
-            elif self.part.lower() == "sections":
-                sections = soup.find_all('section', class_='menu-section')
+            elif part == "sections":
+                sections = index["sections"]
                 if sections:
                     result = f"Found {len(sections)} menu sections:\n\n"
                     for i, section in enumerate(sections, 1):
-                        title = section.find('h2') or section.find('.section-title')
-                        title_text = title.get_text() if title else f"Section {i}"
-                        result += f"{i}. {title_text}\n"
+                        result += f"{i}. {section['title']}\n"
                     return result
                 return "No menu sections found."
             
             else:
-                # Try to find a specific section by name
-                sections = soup.find_all('section', class_='menu-section')
-                for section in sections:
-                    title = section.find('h2') or section.find('.section-title')
-                    if title and self.part.lower() in title.get_text().lower():
-                        return f"Section '{self.part}':\n\n{str(section)}"
+                # Try to find a specific section by name (exact title first, then partial match)
+                section_html = index["sections_by_title"].get(part.strip())
+                if section_html is None:
+                    section_html = next(
+                        (s["html"] for s in index["sections"] if s["has_title"] and part in s["title"].lower()),
+                        None
+                    )
+                if section_html is not None:
+                    return f"Section '{self.part}':\n\n{section_html}"
                 
                 return f"Section '{self.part}' not found. Available sections: Use 'sections' to list all sections."
             
@@ -208,8 +231,10 @@ class ReadHTMLPart(BaseTool):
             import traceback
             return f"Error reading HTML part: {str(e)}\n{traceback.format_exc()}"
 
-
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
     # Test the tool
     tool = ReadHTMLPart(part="all", filename="test_menu.html")
     result = tool.run()
@@ -1,16 +1,29 @@
 from agency_swarm.tools import BaseTool
 from pydantic import Field
 import os
+import re
+from html.parser import HTMLParser
 from pathlib import Path
-from typing import Optional
-from dotenv import load_dotenv
-from bs4 import BeautifulSoup
+from typing import Dict, Optional
 
-load_dotenv()
+# Shared HTML column resolution / single round-trip saves, and ReadHTMLPart cache invalidation.
+# Some tests dynamically load this module without package context, so we need fallbacks.
+try:
+    from .html_storage import save_menu_html, SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+    from .html_index import db_source_key, file_source_key, invalidate_html_index  # type: ignore
+    from .artifact_store import resolve_text_input  # type: ignore
+except Exception:  # pragma: no cover
+    try:
+        from menu_creator.tools.html_storage import save_menu_html, SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+        from menu_creator.tools.html_index import db_source_key, file_source_key, invalidate_html_index  # type: ignore
+        from menu_creator.tools.artifact_store import resolve_text_input  # type: ignore
+    except Exception:  # pragma: no cover
+        from html_storage import save_menu_html, SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+        from html_index import db_source_key, file_source_key, invalidate_html_index  # type: ignore
+        from artifact_store import resolve_text_input  # type: ignore
 
-# Cache directory for HTML menus
+# Cache directory for HTML menus (created on first write)
 CACHE_DIR = Path(__file__).resolve().parent.parent.parent / "cache" / "menus"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 # Mobile-first hardening baseline (injected deterministically on save/update)
 MOBILE_BASELINE_MARKER = "menoo-mobile-baseline v1"
@@ -30,57 +43,187 @@ pre, code {{ white-space: pre-wrap; word-break: break-word; overflow-wrap: anywh
 """
 
 
+# Lexical patterns for the fast path (no tree is built for documents that are already hardened)
+HEAD_OPEN_PATTERN = re.compile(r"<head(?:\s[^>]*)?>", re.IGNORECASE)
+HEAD_CLOSE_PATTERN = re.compile(r"</head\s*>", re.IGNORECASE)
+# Comments and <script>/<style> bodies are raw text: tags and the marker inside them do not count
+RAW_TEXT_START_PATTERN = re.compile(r"<!--|<(?:script|style)(?=[\s/>])", re.IGNORECASE)
+RAW_TEXT_PATTERN = re.compile(
+    r"<!--.*?-->|<(?P<tag>script|style)(?:\s[^>]*)?>(?P<body>.*?)</(?P=tag)\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+META_TAG_PATTERN = re.compile(r"<meta\b[^>]*>", re.IGNORECASE)
+CONTENT_ATTR_PATTERN = re.compile(r"""(\scontent\s*=\s*)("[^"]*"|'[^']*'|[^\s"'>]+)""", re.IGNORECASE)
+VIEWPORT_META_TAG = f'<meta name="viewport" content="{MOBILE_VIEWPORT_CONTENT}"/>'
+
+
+class _TagAttributes(HTMLParser):
+    """Reads the attributes of a single start tag (handles quoting like a real parser)."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.attrs: Dict[str, Optional[str]] = {}
+
+    def handle_starttag(self, tag, attrs):
+        self.attrs = {name.lower(): value for name, value in attrs}
+
+    handle_startendtag = handle_starttag
+
+
+def _tag_attributes(tag_text: str) -> Dict[str, Optional[str]]:
+    parser = _TagAttributes()
+    parser.feed(tag_text)
+    parser.close()
+    return parser.attrs
+
+
+def _scan_head(html_content: str, head_start: int):
+    """
+    Finds the end of the <head> that starts at head_start, stepping over comments and
+    <script>/<style> elements. Returns (head_end, masked_head, style_bodies) where masked_head
+    is the head text with those ranges blanked out (same length, so positions line up) and
+    style_bodies are the (start, end) offsets of each <style> body within the head. Returns
+    None for an unterminated comment/element or a missing </head>.
+    """
+    pieces = []
+    style_bodies = []
+    position = head_start
+    while True:
+        head_close = HEAD_CLOSE_PATTERN.search(html_content, position)
+        if head_close is None:
+            return None
+        raw_start = RAW_TEXT_START_PATTERN.search(html_content, position, head_close.start())
+        if raw_start is None:
+            break
+        raw = RAW_TEXT_PATTERN.match(html_content, raw_start.start())
+        if raw is None:
+            return None
+        pieces.append(html_content[position:raw.start()])
+        pieces.append(" " * (raw.end() - raw.start()))
+        if (raw.group("tag") or "").lower() == "style":
+            style_bodies.append((raw.start("body") - head_start, raw.end("body") - head_start))
+        position = raw.end()
+
+    pieces.append(html_content[position:head_close.start()])
+    return head_close.start(), "".join(pieces), style_bodies
+
+
+def _ensure_mobile_optimized_html_fast(html_content: str) -> Optional[str]:
+    """
+    Lexical version of the hardening step: scans only the <head> and splices text into it.
+    Returns the input unchanged (same bytes) when both the viewport and the baseline CSS are
+    already present, or None when the head cannot be located unambiguously (caller falls back
+    to the tree-based path).
+    """
+    head_open = HEAD_OPEN_PATTERN.search(html_content)
+    if head_open is None:
+        return html_content
+    scanned = _scan_head(html_content, head_open.end())
+    if scanned is None:
+        return None
+    head_end, masked_head, style_bodies = scanned
+    if HEAD_OPEN_PATTERN.search(masked_head):
+        return None
+
+    head_start = head_open.end()
+    head = html_content[head_start:head_end]
+
+    viewport_tag = charset_tag = None
+    for meta in META_TAG_PATTERN.finditer(masked_head):
+        attrs = _tag_attributes(meta.group(0))
+        if viewport_tag is None and (attrs.get("name") or "").lower() == "viewport":
+            viewport_tag = (meta, attrs)
+        if charset_tag is None and "charset" in attrs:
+            charset_tag = meta
+
+    has_viewport = viewport_tag is not None and viewport_tag[1].get("content") == MOBILE_VIEWPORT_CONTENT
+    has_baseline = any(MOBILE_BASELINE_MARKER in head[start:end] for start, end in style_bodies)
+    if has_viewport and has_baseline:
+        return html_content
+
+    # Edits are (position in head, characters to remove, text to insert), applied back to front.
+    edits = []
+    if not has_viewport:
+        if viewport_tag is None:
+            position = charset_tag.end() if charset_tag is not None else 0
+            edits.append((position, 0, VIEWPORT_META_TAG))
+        else:
+            meta = viewport_tag[0]
+            content_attr = CONTENT_ATTR_PATTERN.search(meta.group(0))
+            if content_attr is None:
+                # Add the attribute right after "<meta"
+                edits.append((meta.start() + len("<meta"), 0, f' content="{MOBILE_VIEWPORT_CONTENT}"'))
+            else:
+                edits.append((meta.start() + content_attr.start(2), len(content_attr.group(2)), f'"{MOBILE_VIEWPORT_CONTENT}"'))
+
+    if not has_baseline:
+        if not style_bodies:
+            edits.append((len(head), 0, f"<style>{MOBILE_BASELINE_CSS}</style>"))
+        else:
+            edits.append((style_bodies[0][0], 0, MOBILE_BASELINE_CSS + "\n"))
+
+    for position, remove, text in sorted(edits, key=lambda edit: edit[0], reverse=True):
+        head = head[:position] + text + head[position + remove:]
+
+    return html_content[:head_start] + head + html_content[head_end:]
+
+
+def _ensure_mobile_optimized_html_tree(html_content: str) -> str:
+    """Tree-based hardening (BeautifulSoup), used when the lexical fast path cannot locate <head>."""
+    from bs4 import BeautifulSoup  # only needed for malformed documents
+
+    soup = BeautifulSoup(html_content, "html.parser")
+    head = soup.find("head")
+    if head is None:
+        return html_content
+
+    # 1) Ensure viewport meta exists + includes viewport-fit=cover (safe area support).
+    viewport_meta = head.find("meta", attrs={"name": "viewport"})
+    if viewport_meta is None:
+        viewport_meta = soup.new_tag("meta")
+        viewport_meta.attrs["name"] = "viewport"
+        # Insert after charset meta if present, otherwise at start of head.
+        charset_meta = head.find("meta", attrs={"charset": True})
+        if charset_meta is not None:
+            charset_meta.insert_after(viewport_meta)
+        else:
+            head.insert(0, viewport_meta)
+    viewport_meta.attrs["content"] = MOBILE_VIEWPORT_CONTENT
+
+    # 2) Ensure our baseline CSS is present (first style tag in <head>, or create one).
+    existing_marker = head.find(string=lambda s: isinstance(s, str) and MOBILE_BASELINE_MARKER in s)
+    if existing_marker is None:
+        style_tag = head.find("style")
+        if style_tag is None:
+            style_tag = soup.new_tag("style")
+            style_tag.string = MOBILE_BASELINE_CSS
+            head.append(style_tag)
+        else:
+            existing_css = style_tag.string if style_tag.string is not None else style_tag.get_text()
+            style_tag.clear()
+            style_tag.append(MOBILE_BASELINE_CSS + "\n" + (existing_css or ""))
+
+    return str(soup)
+
+
 def ensure_mobile_optimized_html(html_content: str) -> str:
     """
     Ensure the HTML includes a mobile-correct viewport + a minimal CSS baseline.
     This is intentionally deterministic so every generated menu "fits perfectly" on mobile screens
     (no horizontal overflow primitives, safe-area compatible, mobile-first defaults).
+    
+    Only the <head> is scanned and edited; already-hardened documents are returned byte-identical
+    without building a tree.
     """
     try:
-        soup = BeautifulSoup(html_content, "html.parser")
-        head = soup.find("head")
-        if head is None:
-            return html_content
-
-        # 1) Ensure viewport meta exists + includes viewport-fit=cover (safe area support).
-        viewport_meta = head.find("meta", attrs={"name": "viewport"})
-        if viewport_meta is None:
-            viewport_meta = soup.new_tag("meta")
-            viewport_meta.attrs["name"] = "viewport"
-            # Insert after charset meta if present, otherwise at start of head.
-            charset_meta = head.find("meta", attrs={"charset": True})
-            if charset_meta is not None:
-                charset_meta.insert_after(viewport_meta)
-            else:
-                head.insert(0, viewport_meta)
-        viewport_meta.attrs["content"] = MOBILE_VIEWPORT_CONTENT
-
-        # 2) Ensure our baseline CSS is present (first style tag in <head>, or create one).
-        existing_marker = head.find(string=lambda s: isinstance(s, str) and MOBILE_BASELINE_MARKER in s)
-        if existing_marker is None:
-            style_tag = head.find("style")
-            if style_tag is None:
-                style_tag = soup.new_tag("style")
-                style_tag.string = MOBILE_BASELINE_CSS
-                head.append(style_tag)
-            else:
-                existing_css = style_tag.string if style_tag.string is not None else style_tag.get_text()
-                style_tag.clear()
-                style_tag.append(MOBILE_BASELINE_CSS + "\n" + (existing_css or ""))
-
-        return str(soup)
+        hardened = _ensure_mobile_optimized_html_fast(html_content)
+        if hardened is not None:
+            return hardened
+        return _ensure_mobile_optimized_html_tree(html_content)
     except Exception:
         # Never block saving because of a hardening step; fall back to original HTML.
         return html_content
 
-# Try to import Supabase client
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
-except ImportError:
-    SUPABASE_AVAILABLE = False
-    Client = None
-
 
 class SaveHTMLFile(BaseTool):
     """
@@ -92,7 +235,7 @@ class SaveHTMLFile(BaseTool):
     For Cloud Run deployments, always provide menu_id to ensure persistence across instances.
     """
     html_content: str = Field(
-        ..., description="The complete HTML content to save as a string."
+        ..., description="The complete HTML content to save as a string, or an artifact handle ('artifact:…') returned by ReadHTMLPart or PopulateMenuFromDB."
     )
     filename: str = Field(
         default="menu.html", description="The filename to save the HTML to (only used if menu_id not provided). Defaults to 'menu.html'. Should include .html extension."
@@ -104,22 +247,6 @@ class SaveHTMLFile(BaseTool):
         default="html_content", description="Database field name to store HTML (only used if menu_id provided). Defaults to 'html_content'."
     )
 
-    def _get_supabase_client(self) -> Optional[Client]:
-        """Create Supabase client from environment variables"""
-        if not SUPABASE_AVAILABLE:
-            return None
-        
-        supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL") or os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        
-        if not supabase_url or not supabase_key:
-            return None
-        
-        try:
-            return create_client(supabase_url, supabase_key)
-        except Exception:
-            return None
-
     def run(self):
         """
         Step 1: Check if menu_id provided (use database) or retrieve from context
@@ -129,8 +256,13 @@ class SaveHTMLFile(BaseTool):
         Step 4: Return success message
         """
         try:
+            # html_content may be an artifact handle instead of the document itself
+            html_content, artifact_error = resolve_text_input(self.html_content)
+            if artifact_error:
+                return artifact_error
+            
             # Always harden the HTML for mobile before saving anywhere.
-            self.html_content = ensure_mobile_optimized_html(self.html_content)
+            self.html_content = ensure_mobile_optimized_html(html_content)
 
             # Try to get menu_id from context if not provided
             menu_id_to_use = self.menu_id
@@ -145,37 +277,24 @@ class SaveHTMLFile(BaseTool):
                 if not SUPABASE_AVAILABLE:
                     return "Error: Supabase library not installed. Run: pip install supabase"
                 
-                supabase = self._get_supabase_client()
+                supabase = get_supabase_client()
                 if not supabase:
                     return "Error: Supabase credentials not found. Please set NEXT_PUBLIC_SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in .env"
                 
-                # Verify menu exists
+                # Single UPDATE ... RETURNING id, name (the HTML column is resolved once per process)
                 try:
-                    menu_response = supabase.table("menus").select("id, name").eq("id", menu_id_to_use).single().execute()
-                    if not menu_response.data:
-                        return f"Error: Menu with id '{menu_id_to_use}' not found in database."
-                    menu_name = menu_response.data.get("name", "Unknown")
+                    saved_menu, actual_field, save_error = save_menu_html(
+                        supabase, menu_id_to_use, self.html_content, self.field_name
+                    )
                 except Exception as e:
-                    return f"Error: Could not verify menu exists: {str(e)}"
+                    return f"Error: Could not save HTML to database: {str(e)}"
                 
-                # Try to update menu with HTML content
-                field_names_to_try = [self.field_name, "html_content", "html", "menu_html"]
-                update_success = False
-                actual_field = self.field_name
-                
-                for field_name in field_names_to_try:
-                    try:
-                        update_data = {field_name: self.html_content}
-                        update_response = supabase.table("menus").update(update_data).eq("id", menu_id_to_use).execute()
-                        if update_response.data:
-                            update_success = True
-                            actual_field = field_name
-                            break
-                    except Exception:
-                        continue
-                
-                if not update_success:
-                    return f"Error: Could not save HTML to database. Tried fields: {', '.join(field_names_to_try)}. You may need to add an '{self.field_name}' column to the menus table."
+                if save_error:
+                    return f"Error: Could not save HTML to database. {save_error}"
+                if not saved_menu:
+                    return f"Error: Menu with id '{menu_id_to_use}' not found in database."
+                menu_name = saved_menu.get("name", "Unknown")
+                invalidate_html_index(db_source_key(menu_id_to_use))
                 
                 return (
                     f"✓ HTML saved successfully to database!\n\n"
@@ -197,11 +316,13 @@ class SaveHTMLFile(BaseTool):
             filename = filename.replace('/', '').replace('\\', '').replace('..', '')
             
             # Step 3: Create full file path
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
             file_path = CACHE_DIR / filename
             
             # Step 4: Write HTML content to file
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(self.html_content)
+            invalidate_html_index(file_source_key(file_path))
             
             # Step 5: Return success message
             return (
@@ -215,6 +336,9 @@ class SaveHTMLFile(BaseTool):
 
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
     # Test the tool
     test_html = """<!DOCTYPE html>
 <html>
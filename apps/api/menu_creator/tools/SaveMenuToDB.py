@@ -1,23 +1,26 @@
 from agency_swarm.tools import BaseTool
 from pydantic import Field
-import os
 from pathlib import Path
 from typing import Optional
-from dotenv import load_dotenv
 
-load_dotenv()
+# Shared HTML column resolution / single round-trip saves, and ReadHTMLPart cache invalidation.
+# Some tests dynamically load this module without package context, so we need fallbacks.
+try:
+    from .html_storage import save_menu_html, SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+    from .html_index import db_source_key, invalidate_html_index  # type: ignore
+    from .artifact_store import resolve_text_input  # type: ignore
+except Exception:  # pragma: no cover
+    try:
+        from menu_creator.tools.html_storage import save_menu_html, SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+        from menu_creator.tools.html_index import db_source_key, invalidate_html_index  # type: ignore
+        from menu_creator.tools.artifact_store import resolve_text_input  # type: ignore
+    except Exception:  # pragma: no cover
+        from html_storage import save_menu_html, SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+        from html_index import db_source_key, invalidate_html_index  # type: ignore
+        from artifact_store import resolve_text_input  # type: ignore
 
 # Cache directory for HTML menus
 CACHE_DIR = Path(__file__).resolve().parent.parent.parent / "cache" / "menus"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
-
-# Try to import Supabase client
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
-except ImportError:
-    SUPABASE_AVAILABLE = False
-    Client = None
 
 
 class SaveMenuToDB(BaseTool):
@@ -28,7 +31,7 @@ class SaveMenuToDB(BaseTool):
     The HTML content is saved to the menus table under the 'html_content' or 'html' field.
     
     You can provide either:
-    - The HTML content directly as a string
+    - The HTML content directly as a string, or an artifact handle ('artifact:…')
     - The filename of an HTML file in cache/menus/ directory
     
     The menu will be updated with the HTML content in the database.
@@ -38,7 +41,7 @@ class SaveMenuToDB(BaseTool):
     )
     html_content: Optional[str] = Field(
         default=None,
-        description="The HTML content as a string. If not provided, will read from html_filename."
+        description="The HTML content as a string, or an artifact handle ('artifact:…') returned by ReadHTMLPart or PopulateMenuFromDB. If not provided, will read from html_filename."
     )
     html_filename: Optional[str] = Field(
         default=None,
@@ -49,32 +52,18 @@ class SaveMenuToDB(BaseTool):
         description="Database field name to store HTML. Options: 'html_content', 'html', or 'menu_html'. Defaults to 'html_content'."
     )
 
-    def _get_supabase_client(self) -> Optional[Client]:
-        """Create Supabase client from environment variables"""
-        if not SUPABASE_AVAILABLE:
-            return None
-        
-        supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL") or os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        
-        if not supabase_url or not supabase_key:
-            return None
-        
-        try:
-            return create_client(supabase_url, supabase_key)
-        except Exception:
-            return None
-
     def run(self):
         """
         Step 1: Get HTML content (from parameter or file)
-        Step 2: Validate menu_id exists in database
-        Step 3: Update menu record with HTML content
+        Step 2: Get Supabase client
+        Step 3: Update menu record with HTML content (single round trip, returns id/name)
         Step 4: Return success message with menu details
         """
         try:
-            # Step 1: Get HTML content
-            html_to_save = self.html_content
+            # Step 1: Get HTML content (html_content may be an artifact handle)
+            html_to_save, artifact_error = resolve_text_input(self.html_content)
+            if artifact_error:
+                return artifact_error
             
             if not html_to_save:
                 # Read from file
@@ -94,57 +83,28 @@ class SaveMenuToDB(BaseTool):
             if not SUPABASE_AVAILABLE:
                 return "Error: Supabase library not installed. Run: pip install supabase"
             
-            supabase = self._get_supabase_client()
+            supabase = get_supabase_client()
             if not supabase:
                 return "Error: Supabase credentials not found. Please set NEXT_PUBLIC_SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in .env"
             
-            # Step 3: Verify menu exists
+            # Step 3: Save with a single UPDATE ... RETURNING id, name
+            # (the HTML column is resolved once per process instead of trying every candidate)
             try:
-                menu_response = supabase.table("menus").select("id, name, restaurant_id").eq("id", self.menu_id).single().execute()
-                if not menu_response.data:
-                    return f"Error: Menu with id '{self.menu_id}' not found in database."
-                
-                menu_name = menu_response.data.get("name", "Unknown")
+                saved_menu, actual_field, save_error = save_menu_html(
+                    supabase, self.menu_id, html_to_save, self.field_name
+                )
             except Exception as e:
-                return f"Error: Could not verify menu exists: {str(e)}"
-            
-            # Step 4: Update menu with HTML content
-            # Try multiple field names in case the schema uses different names
-            update_data = {}
-            
-            # Try the specified field name first
-            field_names_to_try = [self.field_name, "html_content", "html", "menu_html"]
+                return f"Error: Could not save HTML to database: {str(e)}"
             
-            # Update with the first available field name
-            # Note: We'll try to update, and if it fails, we'll try other field names
-            update_success = False
-            last_error = None
+            if save_error:
+                return f"Error: Could not save HTML to database. {save_error}"
+            if not saved_menu:
+                return f"Error: Menu with id '{self.menu_id}' not found in database."
             
-            for field_name in field_names_to_try:
-                try:
-                    update_data = {field_name: html_to_save}
-                    update_response = supabase.table("menus").update(update_data).eq("id", self.menu_id).execute()
-                    
-                    if update_response.data:
-                        update_success = True
-                        actual_field = field_name
-                        break
-                except Exception as e:
-                    last_error = str(e)
-                    continue
+            menu_name = saved_menu.get("name", "Unknown")
+            invalidate_html_index(db_source_key(self.menu_id))
             
-            if not update_success:
-                # If all field names failed, try a generic update
-                # This might work if the field doesn't exist yet (depending on Supabase settings)
-                try:
-                    update_data = {self.field_name: html_to_save}
-                    update_response = supabase.table("menus").update(update_data).eq("id", self.menu_id).execute()
-                    update_success = True
-                    actual_field = self.field_name
-                except Exception as e:
-                    return f"Error: Could not save HTML to database. Tried fields: {', '.join(field_names_to_try)}. Last error: {str(e)}. You may need to add an '{self.field_name}' column to the menus table."
-            
-            # Step 5: Return success message
+            # Step 4: Return success message
             html_size = len(html_to_save)
             return (
                 f"✓ Menu HTML saved successfully to database!\n\n"
@@ -161,6 +121,9 @@ class SaveMenuToDB(BaseTool):
 
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
     # Test the tool
     import sys
     
@@ -3,13 +3,9 @@ from pydantic import Field
 from typing import List, Dict, Optional
 from pathlib import Path
 import json
-from dotenv import load_dotenv
 
-load_dotenv()
-
-# Cache directory for screenshots
+# Cache directory for screenshots (created on first write)
 CACHE_IMAGES_DIR = Path(__file__).resolve().parent.parent.parent / "cache" / "images"
-CACHE_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
 
 class TakeMenuScreenshots(BaseTool):
@@ -80,6 +76,7 @@ class TakeMenuScreenshots(BaseTool):
             parsed = urlparse(url)
             domain = parsed.netloc.replace('www.', '').replace('.', '_')[:50]
             filename = f"menu_screenshot_{domain}_{index}.png"
+            CACHE_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
             screenshot_path = CACHE_IMAGES_DIR / filename
             
             with sync_playwright() as p:
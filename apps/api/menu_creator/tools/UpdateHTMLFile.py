@@ -3,7 +3,6 @@ from pydantic import Field
 import os
 from pathlib import Path
 from typing import Optional
-from dotenv import load_dotenv
 
 # Import mobile hardening helper.
 # Some tests dynamically load this module without package context, so we need fallbacks.
@@ -15,19 +14,32 @@ except Exception:  # pragma: no cover
     except Exception:  # pragma: no cover
         from SaveHTMLFile import ensure_mobile_optimized_html  # type: ignore
 
-load_dotenv()
+# Shared HTML column resolution / single round-trip saves, and ReadHTMLPart cache invalidation.
+try:
+    from .html_storage import save_menu_html, read_menu_html, SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+    from .html_index import db_source_key, file_source_key, invalidate_html_index  # type: ignore
+    from .artifact_store import resolve_text_input  # type: ignore
+except Exception:  # pragma: no cover
+    try:
+        from menu_creator.tools.html_storage import save_menu_html, read_menu_html, SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+        from menu_creator.tools.html_index import db_source_key, file_source_key, invalidate_html_index  # type: ignore
+        from menu_creator.tools.artifact_store import resolve_text_input  # type: ignore
+    except Exception:  # pragma: no cover
+        from html_storage import save_menu_html, read_menu_html, SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+        from html_index import db_source_key, file_source_key, invalidate_html_index  # type: ignore
+        from artifact_store import resolve_text_input  # type: ignore
+
+# Patch mode helpers (targeted operations / unified diff).
+try:
+    from .html_patch import apply_patch_operations, apply_unified_diff, HTMLPatchError  # type: ignore
+except Exception:  # pragma: no cover
+    try:
+        from menu_creator.tools.html_patch import apply_patch_operations, apply_unified_diff, HTMLPatchError  # type: ignore
+    except Exception:  # pragma: no cover
+        from html_patch import apply_patch_operations, apply_unified_diff, HTMLPatchError  # type: ignore
 
 # Cache directory for HTML menus
 CACHE_DIR = Path(__file__).resolve().parent.parent.parent / "cache" / "menus"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
-
-# Try to import Supabase client
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
-except ImportError:
-    SUPABASE_AVAILABLE = False
-    Client = None
 
 
 class UpdateHTMLFile(BaseTool):
@@ -38,9 +50,28 @@ class UpdateHTMLFile(BaseTool):
     If menu_id is not provided, updates local file system (for local development).
     
     For Cloud Run deployments, always provide menu_id to ensure persistence across instances.
+    
+    Provide exactly one of:
+    - html_content: the complete new document (full rewrite)
+    - patch_operations: targeted edits applied to the stored HTML (preferred for small changes)
+    - unified_diff: a unified diff against the stored HTML
+    
+    In patch/diff mode the HTML is only written back when the result actually changed.
     """
-    html_content: str = Field(
-        ..., description="The new HTML content to replace the existing content."
+    html_content: Optional[str] = Field(
+        default=None, description="The new HTML content to replace the existing content, or an artifact handle ('artifact:…') returned by ReadHTMLPart or PopulateMenuFromDB. Omit when using patch_operations or unified_diff."
+    )
+    patch_operations: Optional[str] = Field(
+        default=None,
+        description=(
+            "JSON string array of targeted edits applied to the stored HTML instead of resending the whole document. "
+            "Operations: {\"op\": \"replace_section\", \"selector\": \"<css selector>\", \"html\": \"<new element>\"}, "
+            "{\"op\": \"edit_css_rule\", \"selector\": \".menu-item .price\", \"css\": \"color: #b33;\"} (replaces the rule's declarations or adds the rule), "
+            "{\"op\": \"insert_item\", \"selector\": \"<css selector>\", \"html\": \"<li>...</li>\", \"position\": \"append|prepend|before|after\"}."
+        )
+    )
+    unified_diff: Optional[str] = Field(
+        default=None, description="A unified diff (with @@ hunk headers) to apply to the stored HTML. Alternative to patch_operations."
     )
     filename: str = Field(
         default="menu.html", description="The filename to update (only used if menu_id not provided). Defaults to 'menu.html'. Should include .html extension."
@@ -52,33 +83,39 @@ class UpdateHTMLFile(BaseTool):
         default="html_content", description="Database field name to update (only used if menu_id provided). Defaults to 'html_content'."
     )
 
-    def _get_supabase_client(self) -> Optional[Client]:
-        """Create Supabase client from environment variables"""
-        if not SUPABASE_AVAILABLE:
-            return None
-        
-        supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL") or os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        
-        if not supabase_url or not supabase_key:
-            return None
-        
-        try:
-            return create_client(supabase_url, supabase_key)
-        except Exception:
-            return None
+    def _patch_mode(self) -> bool:
+        return bool(self.patch_operations or self.unified_diff)
+
+    def _apply_patch(self, current_html: str) -> tuple:
+        """Apply patch_operations or unified_diff to the stored HTML and re-harden it for mobile."""
+        if self.patch_operations:
+            patched, applied = apply_patch_operations(current_html, self.patch_operations)
+        else:
+            patched, applied = apply_unified_diff(current_html, self.unified_diff)
+        return ensure_mobile_optimized_html(patched), applied
 
     def run(self):
         """
         Step 1: Check if menu_id provided (use database) or retrieve from context
         Step 2: If no menu_id, check filename (use file system)
-        Step 3a (DB): Update database
-        Step 3b (File): Update file system
-        Step 4: Return success message
+        Step 3: In patch mode, load the stored HTML and apply the patch
+        Step 4a (DB): Update database (skipped if the patch changed nothing)
+        Step 4b (File): Update file system (skipped if the patch changed nothing)
+        Step 5: Return success message
         """
         try:
-            # Always harden the HTML for mobile before saving anywhere.
-            self.html_content = ensure_mobile_optimized_html(self.html_content)
+            modes = [bool(self.html_content), bool(self.patch_operations), bool(self.unified_diff)]
+            if sum(modes) != 1:
+                return "Error: Provide exactly one of html_content, patch_operations or unified_diff."
+            
+            applied = []
+            if not self._patch_mode():
+                # html_content may be an artifact handle instead of the document itself
+                html_content, artifact_error = resolve_text_input(self.html_content)
+                if artifact_error:
+                    return artifact_error
+                # Always harden the HTML for mobile before saving anywhere.
+                self.html_content = ensure_mobile_optimized_html(html_content)
 
             # Try to get menu_id from context if not provided
             menu_id_to_use = self.menu_id
@@ -93,43 +130,51 @@ class UpdateHTMLFile(BaseTool):
                 if not SUPABASE_AVAILABLE:
                     return "Error: Supabase library not installed. Run: pip install supabase"
                 
-                supabase = self._get_supabase_client()
+                supabase = get_supabase_client()
                 if not supabase:
                     return "Error: Supabase credentials not found. Please set NEXT_PUBLIC_SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in .env"
                 
-                # Verify menu exists and get current HTML
-                try:
-                    menu_response = supabase.table("menus").select("id, name").eq("id", menu_id_to_use).single().execute()
-                    if not menu_response.data:
+                if self._patch_mode():
+                    try:
+                        stored_menu, stored_field = read_menu_html(supabase, menu_id_to_use, self.field_name)
+                    except Exception as e:
+                        return f"Error: Could not read menu from database: {str(e)}"
+                    if not stored_menu:
                         return f"Error: Menu with id '{menu_id_to_use}' not found in database."
-                    menu_name = menu_response.data.get("name", "Unknown")
-                except Exception as e:
-                    return f"Error: Could not verify menu exists: {str(e)}"
+                    current_html = stored_menu.get(stored_field)
+                    if not current_html:
+                        return f"Error: Menu '{stored_menu.get('name', 'Unknown')}' has no stored HTML to patch. Use SaveHTMLFile first."
+                    
+                    self.html_content, applied = self._apply_patch(current_html)
+                    if self.html_content == current_html:
+                        return (
+                            f"No changes: the patch left the stored HTML identical, nothing was written.\n\n"
+                            f"Menu ID: {menu_id_to_use}\n"
+                            f"Menu Name: {stored_menu.get('name', 'Unknown')}"
+                        )
                 
-                # Update menu with new HTML content
-                field_names_to_try = [self.field_name, "html_content", "html", "menu_html"]
-                update_success = False
-                actual_field = self.field_name
-                
-                for field_name in field_names_to_try:
-                    try:
-                        update_data = {field_name: self.html_content}
-                        update_response = supabase.table("menus").update(update_data).eq("id", menu_id_to_use).execute()
-                        if update_response.data:
-                            update_success = True
-                            actual_field = field_name
-                            break
-                    except Exception:
-                        continue
+                # Single UPDATE ... RETURNING id, name (the HTML column is resolved once per process)
+                try:
+                    updated_menu, actual_field, save_error = save_menu_html(
+                        supabase, menu_id_to_use, self.html_content, self.field_name
+                    )
+                except Exception as e:
+                    return f"Error: Could not update HTML in database: {str(e)}"
                 
-                if not update_success:
-                    return f"Error: Could not update HTML in database. Tried fields: {', '.join(field_names_to_try)}. You may need to add an '{self.field_name}' column to the menus table."
+                if save_error:
+                    return f"Error: Could not update HTML in database. {save_error}"
+                if not updated_menu:
+                    return f"Error: Menu with id '{menu_id_to_use}' not found in database."
+                menu_name = updated_menu.get("name", "Unknown")
+                invalidate_html_index(db_source_key(menu_id_to_use))
                 
+                applied_note = f"Applied: {'; '.join(applied)}\n" if applied else ""
                 return (
                     f"✓ HTML updated successfully in database!\n\n"
                     f"Menu ID: {menu_id_to_use}\n"
                     f"Menu Name: {menu_name}\n"
                     f"Field: {actual_field}\n"
+                    f"{applied_note}"
                     f"New HTML Size: {len(self.html_content):,} characters"
                 )
             
@@ -149,21 +194,35 @@ class UpdateHTMLFile(BaseTool):
             if not file_path.exists():
                 return f"Error: File '{filename}' not found. Use SaveHTMLFile to create a new file."
             
+            if self._patch_mode():
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    current_html = f.read()
+                self.html_content, applied = self._apply_patch(current_html)
+                if self.html_content == current_html:
+                    return f"No changes: the patch left '{filename}' identical, nothing was written."
+            
             # Step 5: Write new content
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(self.html_content)
+            invalidate_html_index(file_source_key(file_path))
             
+            applied_note = f"Applied: {'; '.join(applied)}\n" if applied else ""
             return (
                 f"HTML file updated successfully: {file_path}\n"
+                f"{applied_note}"
                 f"New file size: {len(self.html_content)} characters\n\n"
                 f"Note: For Cloud Run/production, provide menu_id to update database instead."
             )
             
+        except HTMLPatchError as e:
+            return f"Error applying patch: {str(e)}"
         except Exception as e:
             return f"Error updating HTML: {str(e)}"
 
-
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
     # Test the tool
     test_html = """<!DOCTYPE html>
 <html>
@@ -5,13 +5,9 @@ from pydantic import Field
 from typing import List, Dict, Optional, Union
 from pathlib import Path
 import json
-from dotenv import load_dotenv
-
-load_dotenv()
 
 # Cache directory for menu files
 CACHE_IMAGES_DIR = Path(__file__).resolve().parent.parent.parent / "cache" / "images"
-CACHE_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
 
 class UploadMenuImages(BaseTool):
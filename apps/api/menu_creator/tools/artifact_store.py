@@ -0,0 +1,151 @@
+"""
+Content-addressed store for large tool outputs (menu HTML, populated menus, screenshots).
+
+Instead of returning a whole HTML document as tool output, which the model reads, re-sends on
+every turn and copies into the next tool call, a tool stores it here and returns a handle
+("artifact:<sha256 prefix>") plus a structural summary. Tools that take HTML input (SaveHTMLFile,
+UpdateHTMLFile, SaveMenuToDB) accept a handle wherever they accept HTML, so the document goes from
+tool to tool without passing through the model.
+
+Artifacts are files under cache/artifacts/ (shared by the worker processes of an instance), named
+by content hash, so storing the same content twice is free. The least recently used ones are
+removed once the store exceeds ARTIFACT_STORE_MAX_BYTES.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+ARTIFACT_DIR = Path(os.getenv(
+    "ARTIFACT_DIR",
+    str(Path(__file__).resolve().parent.parent.parent / "cache" / "artifacts"),
+))
+ARTIFACT_STORE_MAX_BYTES = int(os.getenv("ARTIFACT_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Tool outputs longer than this are returned as a handle instead of inline
+ARTIFACT_INLINE_MAX_CHARS = int(os.getenv("ARTIFACT_INLINE_MAX_CHARS", "4000"))
+
+HANDLE_PREFIX = "artifact:"
+HANDLE_PATTERN = re.compile(r"artifact:([0-9a-f]{32})")
+
+# Size is checked (and the least recently used artifacts removed) every this many writes
+_PRUNE_EVERY_WRITES = 100
+
+_writes = 0
+_writes_lock = threading.Lock()
+
+
+def _paths(artifact_id: str) -> Tuple[Path, Path]:
+    folder = ARTIFACT_DIR / artifact_id[:2]
+    return folder / f"{artifact_id}.bin", folder / f"{artifact_id}.json"
+
+
+def store_artifact(content: Union[str, bytes], kind: str, summary: str = "",
+                   media_type: str = "text/plain") -> str:
+    """Store content and return its handle (existing content is only marked as recently used)."""
+    global _writes
+    data = content.encode("utf-8") if isinstance(content, str) else bytes(content)
+    artifact_id = hashlib.sha256(data).hexdigest()[:32]
+    data_path, meta_path = _paths(artifact_id)
+    if data_path.exists():
+        os.utime(data_path)
+        return HANDLE_PREFIX + artifact_id
+
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    meta = {"kind": kind, "media_type": media_type, "bytes": len(data), "summary": summary, "created_at": time.time()}
+    for path, payload in ((data_path, data), (meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))):
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(payload)
+        os.replace(tmp, path)
+
+    with _writes_lock:
+        _writes += 1
+        prune = _writes % _PRUNE_EVERY_WRITES == 0
+    if prune:
+        _prune()
+    return HANDLE_PREFIX + artifact_id
+
+
+def parse_handle(value: Any) -> Optional[str]:
+    """Artifact id if value is a handle (surrounding whitespace and quotes allowed), else None."""
+    if not isinstance(value, str) or len(value) > 80:
+        return None
+    match = HANDLE_PATTERN.fullmatch(value.strip().strip("'\"`"))
+    return match.group(1) if match else None
+
+
+def load_artifact(handle: str) -> Optional[bytes]:
+    artifact_id = parse_handle(handle)
+    if artifact_id is None:
+        return None
+    data_path, _ = _paths(artifact_id)
+    try:
+        data = data_path.read_bytes()
+    except OSError:
+        return None
+    os.utime(data_path)
+    return data
+
+
+def artifact_info(handle: str) -> Optional[Dict[str, Any]]:
+    artifact_id = parse_handle(handle)
+    if artifact_id is None:
+        return None
+    try:
+        return json.loads(_paths(artifact_id)[1].read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def resolve_text_input(value: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Tool input that may be a handle: returns (text, None), or (None, error message) when the
+    handle is unknown. Plain text is returned unchanged.
+    """
+    if parse_handle(value) is None:
+        return value, None
+    data = load_artifact(value)
+    if data is None:
+        return None, (
+            f"Error: Artifact '{value.strip()}' not found (artifacts are kept per instance and expire). "
+            "Read the HTML again with ReadHTMLPart to get a fresh handle."
+        )
+    return data.decode("utf-8"), None
+
+
+def _prune() -> None:
+    """Remove the least recently used artifacts until the store fits ARTIFACT_STORE_MAX_BYTES."""
+    try:
+        entries = []
+        for data_path in ARTIFACT_DIR.glob("*/*.bin"):
+            stat = data_path.stat()
+            entries.append((stat.st_mtime, stat.st_size, data_path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    if total <= ARTIFACT_STORE_MAX_BYTES:
+        return
+    for _, size, data_path in sorted(entries):
+        for path in (data_path, data_path.with_suffix(".json")):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        total -= size
+        if total <= ARTIFACT_STORE_MAX_BYTES * 0.9:
+            break
+
+
+def artifact_stats() -> Dict[str, Any]:
+    """Artifact count and bytes (for /metrics)."""
+    count = size = 0
+    try:
+        for data_path in ARTIFACT_DIR.glob("*/*.bin"):
+            count += 1
+            size += data_path.stat().st_size
+    except OSError:
+        pass
+    return {"path": str(ARTIFACT_DIR), "artifacts": count, "bytes": size, "max_bytes": ARTIFACT_STORE_MAX_BYTES}
@@ -0,0 +1,136 @@
+"""
+In-memory cache of parsed menu HTML for ReadHTMLPart.
+
+The agent usually reads 'header', 'styles', 'sections' and individual sections back to back.
+Each menu is parsed once into a structural index (header, footer, styles, sections by title);
+follow-up reads are dictionary lookups. Entries are keyed by source ('db:<menu_id>' or
+'file:<path>') and content hash, invalidated by SaveHTMLFile / UpdateHTMLFile / SaveMenuToDB
+writes and expire after a TTL so edits made outside this process are picked up.
+
+Database entries are versioned through the cache shared by the worker processes: a write
+stores a new version token there, so the other workers' entries for that menu stop matching
+(file entries use the file's mtime instead).
+"""
+import os
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from bs4 import BeautifulSoup
+
+# Some tests dynamically load this module without package context, so we need fallbacks.
+try:
+    from .shared_cache import cache_get, cache_set  # type: ignore
+except Exception:  # pragma: no cover
+    try:
+        from menu_creator.tools.shared_cache import cache_get, cache_set  # type: ignore
+    except Exception:  # pragma: no cover
+        from shared_cache import cache_get, cache_set  # type: ignore
+
+HTML_INDEX_CACHE_MAX_ENTRIES = int(os.getenv("HTML_INDEX_CACHE_MAX_ENTRIES", "64"))
+HTML_INDEX_CACHE_TTL_SECONDS = float(os.getenv("HTML_INDEX_CACHE_TTL_SECONDS", "300"))
+
+# Shared cache namespace holding the current version token of each database source
+VERSION_NAMESPACE = "html_versions"
+
+_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def db_source_key(menu_id: str) -> str:
+    return f"db:{menu_id}"
+
+
+def file_source_key(file_path) -> str:
+    return f"file:{os.path.abspath(str(file_path))}"
+
+
+def db_source_version(source_key: str) -> Optional[bytes]:
+    """
+    Version token of a database source, shared by all workers (None until its first write).
+    Read it before fetching the HTML and pass it to get_cached_index / store_html_index.
+    """
+    return cache_get(VERSION_NAMESPACE, source_key)
+
+
+def content_hash(html_content: str) -> str:
+    return hashlib.sha256(html_content.encode("utf-8")).hexdigest()
+
+
+def build_html_index(html_content: str) -> Dict[str, Any]:
+    """Parse the HTML once and extract every part ReadHTMLPart can return."""
+    soup = BeautifulSoup(html_content, "html.parser")
+
+    header = soup.find("header") or soup.select_one(".menu-header")
+    footer = soup.find("footer") or soup.select_one(".menu-footer")
+    styles = soup.find("style")
+
+    sections = []
+    for i, section in enumerate(soup.find_all("section", class_="menu-section"), 1):
+        title = section.find("h2") or section.select_one(".section-title")
+        sections.append({
+            "title": title.get_text() if title else f"Section {i}",
+            "has_title": title is not None,
+            "html": str(section),
+        })
+
+    return {
+        "html": html_content,
+        "hash": content_hash(html_content),
+        "header": str(header) if header else None,
+        "footer": str(footer) if footer else None,
+        "styles": (styles.string or str(styles)) if styles else None,
+        "sections": sections,
+        "sections_by_title": {s["title"].strip().lower(): s["html"] for s in sections if s["has_title"]},
+    }
+
+
+def get_cached_index(source_key: str, version: Any = None) -> Optional[Dict[str, Any]]:
+    """
+    Return the cached index for a source, or None if missing, expired or stale.
+
+    Args:
+        source_key: 'db:<menu_id>' or 'file:<path>'
+        version: Optional freshness token (file mtime, db_source_version); must match the stored one
+    """
+    with _lock:
+        entry = _cache.get(source_key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry["cached_at"] > HTML_INDEX_CACHE_TTL_SECONDS or entry["version"] != version:
+            del _cache[source_key]
+            return None
+        _cache.move_to_end(source_key)
+        return entry["index"]
+
+
+def store_html_index(source_key: str, html_content: str, version: Any = None) -> Dict[str, Any]:
+    """Index the HTML for a source, reusing the existing index when the content hash is unchanged."""
+    digest = content_hash(html_content)
+    with _lock:
+        entry = _cache.get(source_key)
+        index = entry["index"] if entry and entry["index"]["hash"] == digest else None
+
+    if index is None:
+        index = build_html_index(html_content)
+
+    with _lock:
+        _cache[source_key] = {"index": index, "version": version, "cached_at": time.monotonic()}
+        _cache.move_to_end(source_key)
+        while len(_cache) > HTML_INDEX_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return index
+
+
+def invalidate_html_index(source_key: Optional[str] = None) -> None:
+    """Drop one source (after a write; database sources also in the other workers) or the whole cache."""
+    with _lock:
+        if source_key is None:
+            _cache.clear()
+        else:
+            _cache.pop(source_key, None)
+    if source_key is not None and source_key.startswith("db:"):
+        cache_set(VERSION_NAMESPACE, source_key, uuid.uuid4().hex)
@@ -0,0 +1,216 @@
+"""
+Targeted HTML edits for UpdateHTMLFile's patch mode.
+
+Instead of re-sending a whole menu document, the agent sends small operations (or a unified diff)
+that are applied to the stored HTML:
+
+- {"op": "replace_section", "selector": "section.menu-section:nth-of-type(2)", "html": "<section>...</section>"}
+- {"op": "edit_css_rule", "selector": ".menu-item .price", "css": "color: #b33; font-weight: 600;"}
+- {"op": "insert_item", "selector": "section.menu-section:nth-of-type(2) ul", "html": "<li>...</li>", "position": "append"}
+
+CSS edits work on the text of the <style> blocks so they never re-serialize the document.
+"""
+import re
+import json
+from typing import Any, Dict, List, Tuple
+
+from bs4 import BeautifulSoup
+
+PATCH_OPERATIONS = ("replace_section", "edit_css_rule", "insert_item")
+INSERT_POSITIONS = ("append", "prepend", "before", "after")
+
+STYLE_BLOCK_PATTERN = re.compile(r"(<style\b[^>]*>)(.*?)(</style>)", re.IGNORECASE | re.DOTALL)
+HUNK_HEADER_PATTERN = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class HTMLPatchError(ValueError):
+    """Raised when a patch cannot be applied to the stored HTML."""
+
+
+def parse_patch_operations(patch_operations: Any) -> List[Dict[str, Any]]:
+    """Parse and validate a JSON string (or list) of patch operations."""
+    operations = json.loads(patch_operations) if isinstance(patch_operations, str) else patch_operations
+    if isinstance(operations, dict):
+        operations = [operations]
+    if not isinstance(operations, list) or not operations:
+        raise HTMLPatchError("patch_operations must be a non-empty JSON array of operations")
+
+    for i, operation in enumerate(operations, 1):
+        if not isinstance(operation, dict):
+            raise HTMLPatchError(f"Operation {i} must be a JSON object")
+        op = operation.get("op")
+        if op not in PATCH_OPERATIONS:
+            raise HTMLPatchError(f"Operation {i}: unknown op '{op}'. Use one of: {', '.join(PATCH_OPERATIONS)}")
+        if not operation.get("selector"):
+            raise HTMLPatchError(f"Operation {i} ({op}): 'selector' is required")
+        if op == "edit_css_rule" and "css" not in operation:
+            raise HTMLPatchError(f"Operation {i} (edit_css_rule): 'css' is required")
+        if op in ("replace_section", "insert_item") and "html" not in operation:
+            raise HTMLPatchError(f"Operation {i} ({op}): 'html' is required")
+        if op == "insert_item" and operation.get("position", "append") not in INSERT_POSITIONS:
+            raise HTMLPatchError(f"Operation {i} (insert_item): position must be one of {', '.join(INSERT_POSITIONS)}")
+    return operations
+
+
+def _format_declarations(css: str) -> str:
+    declarations = css.strip().strip("{}").strip()
+    if declarations and not declarations.endswith(";"):
+        declarations += ";"
+    return declarations
+
+
+def edit_css_rule(html_content: str, selector: str, css: str) -> Tuple[str, str]:
+    """
+    Replace the declarations of a CSS rule in the document's <style> blocks.
+    If the rule does not exist yet, it is appended to the last <style> block.
+    """
+    declarations = _format_declarations(css)
+    # The selector must start the rule: at the start of the stylesheet or after '}', '{' (inside
+    # @media) or ';', with only whitespace and comments in between, so that a descendant rule
+    # like '.x .menu-item' or a selector list is not mistaken for '.menu-item'
+    rule_pattern = re.compile(
+        r"(?:\A|[{};])(?:\s|/\*.*?\*/)*" + re.escape(selector.strip()) + r"\s*\{(?P<declarations>[^{}]*)\}",
+        re.DOTALL,
+    )
+
+    style_blocks = list(STYLE_BLOCK_PATTERN.finditer(html_content))
+    if not style_blocks:
+        raise HTMLPatchError("No <style> block found to edit")
+
+    for block in style_blocks:
+        css_text = block.group(2)
+        match = rule_pattern.search(css_text)
+        if match:
+            new_css = css_text[:match.start("declarations")] + f" {declarations} " + css_text[match.end("declarations"):]
+            start, end = block.span(2)
+            return html_content[:start] + new_css + html_content[end:], f"edited CSS rule '{selector}'"
+
+    last_block = style_blocks[-1]
+    insert_at = last_block.end(2)
+    new_rule = f"\n{selector.strip()} {{ {declarations} }}\n"
+    return html_content[:insert_at] + new_rule + html_content[insert_at:], f"added CSS rule '{selector}'"
+
+
+def _apply_dom_operations(html_content: str, operations: List[Dict[str, Any]]) -> Tuple[str, List[str]]:
+    """Apply selector-based operations with a single parse and a single serialization."""
+    soup = BeautifulSoup(html_content, "html.parser")
+    applied = []
+
+    for operation in operations:
+        op, selector = operation["op"], operation["selector"]
+        target = soup.select_one(selector)
+        if target is None:
+            raise HTMLPatchError(f"{op}: no element matches selector '{selector}'")
+
+        fragment = BeautifulSoup(operation["html"], "html.parser")
+        nodes = list(fragment.contents)
+
+        if op == "replace_section":
+            for node in nodes:
+                target.insert_before(node)
+            target.decompose()
+            applied.append(f"replaced '{selector}'")
+        else:
+            position = operation.get("position", "append")
+            if position == "append":
+                for node in nodes:
+                    target.append(node)
+            elif position == "prepend":
+                for node in reversed(nodes):
+                    target.insert(0, node)
+            elif position == "before":
+                for node in nodes:
+                    target.insert_before(node)
+            else:
+                for node in reversed(nodes):
+                    target.insert_after(node)
+            applied.append(f"inserted into '{selector}' ({position})")
+
+    return str(soup), applied
+
+
+def apply_patch_operations(html_content: str, patch_operations: Any) -> Tuple[str, List[str]]:
+    """
+    Apply patch operations to an HTML document.
+
+    Returns:
+        Tuple of (patched HTML, list of human-readable descriptions of what was applied)
+    """
+    operations = parse_patch_operations(patch_operations)
+    applied = []
+    patched = html_content
+
+    # CSS edits are text-level; consecutive DOM edits share one parse/serialize.
+    pending_dom_operations: List[Dict[str, Any]] = []
+    for operation in operations + [None]:
+        if operation is not None and operation["op"] != "edit_css_rule":
+            pending_dom_operations.append(operation)
+            continue
+        if pending_dom_operations:
+            patched, dom_applied = _apply_dom_operations(patched, pending_dom_operations)
+            applied.extend(dom_applied)
+            pending_dom_operations = []
+        if operation is not None:
+            patched, description = edit_css_rule(patched, operation["selector"], operation["css"])
+            applied.append(description)
+
+    return patched, applied
+
+
+def apply_unified_diff(html_content: str, diff_text: str) -> Tuple[str, List[str]]:
+    """
+    Apply a unified diff to an HTML document.
+
+    Hunks are matched on their context/removed lines; if line numbers drifted, the first
+    exact match after the previous hunk is used.
+    """
+    lines = html_content.splitlines(keepends=True)
+    hunks = []
+    current = None
+    for raw_line in diff_text.splitlines():
+        header = HUNK_HEADER_PATTERN.match(raw_line)
+        if header:
+            current = {"old_start": int(header.group(1)), "old": [], "new": []}
+            hunks.append(current)
+            continue
+        if current is None or raw_line.startswith("\\"):
+            # File headers (---/+++) before the first hunk, or "\ No newline at end of file"
+            continue
+        tag, text = raw_line[:1], raw_line[1:]
+        if tag in (" ", ""):
+            current["old"].append(text)
+            current["new"].append(text)
+        elif tag == "-":
+            current["old"].append(text)
+        elif tag == "+":
+            current["new"].append(text)
+
+    if not hunks:
+        raise HTMLPatchError("unified_diff contains no hunks")
+
+    def matches_at(position: int, expected: List[str]) -> bool:
+        if position < 0 or position + len(expected) > len(lines):
+            return False
+        return all(lines[position + i].rstrip("\r\n") == expected[i] for i in range(len(expected)))
+
+    cursor = 0
+    offset = 0
+    for number, hunk in enumerate(hunks, 1):
+        expected_position = max(hunk["old_start"] - 1, 0) + offset
+        if matches_at(expected_position, hunk["old"]):
+            position = expected_position
+        else:
+            position = next((p for p in range(cursor, len(lines) + 1) if matches_at(p, hunk["old"])), None)
+            if position is None:
+                raise HTMLPatchError(f"Hunk {number} does not apply: context not found in stored HTML")
+
+        replacement = [line + "\n" for line in hunk["new"]]
+        # Preserve a missing trailing newline at the end of the document
+        end = position + len(hunk["old"])
+        if end == len(lines) and lines and not lines[-1].endswith("\n") and replacement:
+            replacement[-1] = replacement[-1][:-1]
+        lines[position:end] = replacement
+        cursor = position + len(replacement)
+        offset += len(replacement) - len(hunk["old"])
+
+    return "".join(lines), [f"applied {len(hunks)} diff hunk(s)"]
@@ -0,0 +1,136 @@
+"""
+Shared database helpers for the HTML menu tools (SaveHTMLFile, UpdateHTMLFile, SaveMenuToDB,
+ReadHTMLPart, PopulateMenuFromDB).
+
+The menus table has used different column names for the HTML over time ('html_content', 'html',
+'menu_html'). Instead of trying every candidate on every save, the column is resolved once per
+process and cached, so a save is a single UPDATE ... RETURNING id, name.
+
+The tools use the service's shared Supabase client (thread_persistence.get_supabase_client):
+supabase is imported when it is first created, and its connection pool is reused across calls.
+"""
+from typing import Dict, List, Optional, Tuple, Any
+
+try:
+    from thread_persistence import SUPABASE_AVAILABLE, get_supabase_client  # type: ignore
+except ImportError:  # pragma: no cover - tools loaded without the API directory on sys.path
+    SUPABASE_AVAILABLE = False
+
+    def get_supabase_client():
+        return None
+
+# Candidate column names for the menu HTML, in order of preference
+HTML_FIELD_CANDIDATES = ["html_content", "html", "menu_html"]
+
+# Columns returned by a save (never the HTML itself, to keep responses small)
+SAVE_RETURNING_COLUMNS = "id, name"
+
+# Process-wide cache: requested field name -> column that actually exists in the menus table
+_resolved_html_columns: Dict[str, str] = {}
+
+
+def html_field_candidates(preferred: Optional[str]) -> List[str]:
+    """Return the candidate column names, with the caller's preferred field first."""
+    candidates = [preferred] if preferred else []
+    candidates.extend(name for name in HTML_FIELD_CANDIDATES if name not in candidates)
+    return candidates
+
+
+def resolve_html_column(supabase, preferred: Optional[str] = "html_content") -> Optional[str]:
+    """
+    Resolve which HTML column exists in the menus table (cached per process).
+
+    One round trip reads the column names from any menu row. Only an empty table falls back
+    to probing each candidate with a zero-row select.
+    """
+    cache_key = preferred or ""
+    if cache_key in _resolved_html_columns:
+        return _resolved_html_columns[cache_key]
+
+    candidates = html_field_candidates(preferred)
+    column = None
+
+    try:
+        sample = supabase.table("menus").select("*").limit(1).execute()
+        if sample.data:
+            existing_columns = set(sample.data[0].keys())
+            column = next((name for name in candidates if name in existing_columns), None)
+        else:
+            for name in candidates:
+                try:
+                    supabase.table("menus").select(name).limit(0).execute()
+                    column = name
+                    break
+                except Exception:
+                    continue
+    except Exception:
+        return None
+
+    if column:
+        _resolved_html_columns[cache_key] = column
+    return column
+
+
+def forget_html_column(preferred: Optional[str] = None) -> None:
+    """Drop cached column resolutions (e.g. after a schema change made a save fail)."""
+    if preferred is None:
+        _resolved_html_columns.clear()
+    else:
+        _resolved_html_columns.pop(preferred, None)
+
+
+def _with_returning(query, columns: str):
+    """Restrict the representation PostgREST returns for a write to the given columns."""
+    # On a write builder, select() adds ?select= and Prefer: return=representation
+    select = getattr(query, "select", None)
+    if not callable(select):
+        return query
+    return select(*(name.strip() for name in columns.split(",")))
+
+
+def save_menu_html(supabase, menu_id: str, html_content: str, preferred: Optional[str] = "html_content") -> Tuple[Optional[Dict[str, Any]], Optional[str], Optional[str]]:
+    """
+    Write menu HTML with a single UPDATE ... RETURNING id, name.
+
+    Args:
+        supabase: Supabase client
+        menu_id: UUID of the menu to update
+        html_content: HTML to store
+        preferred: Preferred column name (falls back to the other known HTML columns)
+
+    Returns:
+        Tuple of (returned row or None if the menu does not exist, column used, error message or None)
+    """
+    column = resolve_html_column(supabase, preferred)
+    if not column:
+        tried = ", ".join(html_field_candidates(preferred))
+        return None, None, f"No HTML column found in menus table. Tried fields: {tried}. You may need to add an '{preferred}' column to the menus table."
+
+    try:
+        query = supabase.table("menus").update({column: html_content}).eq("id", menu_id)
+        response = _with_returning(query, SAVE_RETURNING_COLUMNS).execute()
+    except Exception as e:
+        # The cached column may be stale (schema changed); re-resolve on the next save
+        forget_html_column(preferred)
+        return None, column, str(e)
+
+    if not response.data:
+        return None, column, None
+    return response.data[0], column, None
+
+
+def read_menu_html(supabase, menu_id: str, preferred: Optional[str] = "html_content") -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Read a menu's id, name and HTML in a single select on the resolved HTML column.
+
+    Returns:
+        Tuple of (menu row or None if not found, column used). The HTML is row[column].
+    """
+    column = resolve_html_column(supabase, preferred)
+    if not column:
+        return None, None
+
+    response = supabase.table("menus").select(f"id, name, {column}").eq("id", menu_id).limit(1).execute()
+    if not response.data:
+        return None, column
+    return response.data[0], column
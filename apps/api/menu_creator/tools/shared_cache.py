@@ -0,0 +1,167 @@
+"""
+Cache shared by all worker processes of an instance (SQLite file under cache/).
+
+With several uvicorn workers, per-process dicts would each warm up separately. Entries that are
+plain data are kept here instead, so one worker's work benefits the others:
+- "http": fetched HTML pages (FindMenuFiles and AnalyzeWebsiteStyles fetch the same homepage)
+- "style_profiles": AnalyzeWebsiteStyles results per website
+- "fragments": rendered template fragments (second level behind PopulateMenuFromDB's in-memory LRU)
+- "html_versions": version tokens of database menus, bumped on every HTML write, so each
+  worker's parsed-HTML index (html_index.py) notices saves made by the others
+
+The store is WAL-mode SQLite: reads do not block, writes are short, and it works across processes
+without a server. Every error is treated as a cache miss; the cache never fails a tool call.
+"""
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SHARED_CACHE_PATH = Path(os.getenv(
+    "SHARED_CACHE_PATH",
+    str(Path(__file__).resolve().parent.parent.parent / "cache" / "shared_cache.sqlite3"),
+))
+SHARED_CACHE_MAX_BYTES = int(os.getenv("SHARED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+HTTP_CACHE_TTL_SECONDS = float(os.getenv("HTTP_CACHE_TTL_SECONDS", "600"))
+HTTP_CACHE_MAX_BODY_BYTES = 2 * 1024 * 1024
+
+# Size is checked (and the oldest entries evicted) every this many writes
+_PRUNE_EVERY_WRITES = 200
+
+_local = threading.local()
+_writes = 0
+_writes_lock = threading.Lock()
+
+
+def _connection() -> Optional[sqlite3.Connection]:
+    """One connection per thread and process (a forked child must not reuse its parent's)."""
+    if not SHARED_CACHE_ENABLED:
+        return None
+    connection = getattr(_local, "connection", None)
+    if connection is not None and _local.pid == os.getpid():
+        return connection
+    SHARED_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(SHARED_CACHE_PATH), timeout=5, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS entries ("
+        " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+        " stored_at REAL NOT NULL, expires_at REAL, size INTEGER NOT NULL,"
+        " PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS entries_stored_at ON entries (stored_at)")
+    _local.connection, _local.pid = connection, os.getpid()
+    return connection
+
+
+def cache_get(namespace: str, key: str) -> Optional[bytes]:
+    """Stored value, or None when missing, expired or the cache is unavailable."""
+    try:
+        connection = _connection()
+        if connection is None:
+            return None
+        row = connection.execute(
+            "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+    except (sqlite3.Error, OSError):
+        return None
+    if row is None or (row[1] is not None and row[1] < time.time()):
+        return None
+    return row[0]
+
+
+def cache_set(namespace: str, key: str, value: Union[bytes, str], ttl_seconds: Optional[float] = None) -> None:
+    """Store a value (str is stored as UTF-8); entries without ttl_seconds live until evicted."""
+    global _writes
+    data = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+    now = time.time()
+    try:
+        connection = _connection()
+        if connection is None:
+            return
+        connection.execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, stored_at, expires_at, size) VALUES (?, ?, ?, ?, ?, ?)",
+            (namespace, key, data, now, now + ttl_seconds if ttl_seconds else None, len(data)),
+        )
+        with _writes_lock:
+            _writes += 1
+            prune = _writes % _PRUNE_EVERY_WRITES == 0
+        if prune:
+            _prune(connection)
+    except (sqlite3.Error, OSError):
+        pass
+
+
+def cache_delete(namespace: str, key: Optional[str] = None) -> None:
+    """Drop one entry, or a whole namespace."""
+    try:
+        connection = _connection()
+        if connection is None:
+            return
+        if key is None:
+            connection.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+        else:
+            connection.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+    except (sqlite3.Error, OSError):
+        pass
+
+
+def _prune(connection: sqlite3.Connection) -> None:
+    """Remove expired entries, then the oldest ones until the store fits SHARED_CACHE_MAX_BYTES."""
+    connection.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+    total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= SHARED_CACHE_MAX_BYTES:
+        return
+    excess = total - int(SHARED_CACHE_MAX_BYTES * 0.9)
+    freed = 0
+    oldest = []
+    for namespace, key, size in connection.execute("SELECT namespace, key, size FROM entries ORDER BY stored_at"):
+        oldest.append((namespace, key))
+        freed += size
+        if freed >= excess:
+            break
+    connection.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", oldest)
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Entries and bytes per namespace (for /metrics)."""
+    try:
+        connection = _connection()
+        if connection is None:
+            return {"enabled": False}
+        namespaces = {
+            namespace: {"entries": entries, "bytes": size}
+            for namespace, entries, size in connection.execute(
+                "SELECT namespace, COUNT(*), COALESCE(SUM(size), 0) FROM entries GROUP BY namespace"
+            )
+        }
+    except (sqlite3.Error, OSError) as e:
+        return {"enabled": True, "error": str(e)}
+    return {"enabled": True, "path": str(SHARED_CACHE_PATH), "max_bytes": SHARED_CACHE_MAX_BYTES, "namespaces": namespaces}
+
+
+def fetch_page(url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 10) -> Tuple[bytes, str]:
+    """
+    GET an HTML page through the shared HTTP cache; returns (body, final URL).
+
+    Only successful HTML responses up to HTTP_CACHE_MAX_BODY_BYTES are cached, for
+    HTTP_CACHE_TTL_SECONDS. Raises requests exceptions like requests.get + raise_for_status.
+    """
+    import requests
+
+    cached = cache_get("http", url)
+    if cached is not None:
+        final_url, _, body = cached.partition(b"\n")
+        return body, final_url.decode("utf-8")
+
+    response = requests.get(url, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    body = response.content
+    content_type = response.headers.get("content-type", "")
+    if "html" in content_type and len(body) <= HTTP_CACHE_MAX_BODY_BYTES and "\n" not in response.url:
+        cache_set("http", url, response.url.encode("utf-8") + b"\n" + body, ttl_seconds=HTTP_CACHE_TTL_SECONDS)
+    return body, response.url
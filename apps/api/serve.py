@@ -0,0 +1,54 @@
+"""
+Production entry point: uvicorn with one worker process per available CPU.
+
+Each worker holds its own agencies and in-process caches. Data caches shared between workers
+live in SQLite (menu_creator/tools/shared_cache.py), and turns on one conversation are
+serialized across workers by file locks (thread_locks.py).
+
+Environment:
+    PORT               port to listen on (default 8080)
+    WEB_CONCURRENCY    worker processes (default: CPUs available to the container)
+    MAX_WORKERS        upper bound for the default (each worker loads its own agencies and
+                       Chromium instances; default 4)
+
+Usage (from apps/api):
+    python serve.py
+    WEB_CONCURRENCY=1 python serve.py    # single process
+"""
+import os
+
+import uvicorn
+
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "4"))
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: affinity mask, capped by a cgroup v2 CPU quota (Cloud Run --cpu)."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) // int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def worker_count() -> int:
+    configured = os.getenv("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    return max(1, min(available_cpus(), MAX_WORKERS))
+
+
+if __name__ == "__main__":
+    workers = worker_count()
+    # Workers read this to enable cross-process turn locks (main.WORKER_COUNT)
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8080")),
+        workers=workers,
+    )
@@ -0,0 +1,210 @@
+"""
+Server-Sent Events protocol for /chat/stream.
+
+Agency Swarm stream events are translated into small typed events instead of stringified
+event objects:
+
+    start       {"type": "start", "thread_id"}                        sent before the agency is loaded
+    text_delta  {"type": "text_delta", "content"}                     consecutive deltas are merged
+    tool_start  {"type": "tool_start", "call_id", "tool", "arguments"}
+    tool_end    {"type": "tool_end", "call_id", "tool", "duration_ms", "output_bytes", "output_preview"}
+    progress    {"type": "progress", "stage", ...}                    agent switches / handoffs
+    error       {"type": "error", "message"}
+    done        {"type": "done", "thread_id", "result", "duration_ms", "ttfb_ms", "bytes_sent"}
+
+Only text_delta carries "content", so clients that concatenate data.content get exactly the
+assistant text. Tool arguments and outputs are truncated previews and never inline image bytes.
+A comment line (": heartbeat") is sent when nothing else was sent for SSE_HEARTBEAT_SECONDS.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# Translated events buffered ahead of a slow client before the agency stream is paused
+SSE_QUEUE_MAX_EVENTS = int(os.getenv("SSE_QUEUE_MAX_EVENTS", "256"))
+SSE_PREVIEW_CHARS = int(os.getenv("SSE_PREVIEW_CHARS", "300"))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # disable proxy buffering (nginx / Cloud Run front ends)
+}
+
+HEARTBEAT_FRAME = ": heartbeat\n\n"
+
+DATA_URI_PATTERN = re.compile(r"data:([\w/+.-]+);base64,[A-Za-z0-9+/=]+")
+BASE64_RUN_PATTERN = re.compile(r"[A-Za-z0-9+/]{200,}={0,2}")
+
+_END_OF_STREAM = object()
+
+
+def format_sse(event: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """Encode one event as a compact SSE frame."""
+    frame = f"event: {event['type']}\n"
+    if event_id is not None:
+        frame += f"id: {event_id}\n"
+    return frame + "data: " + json.dumps(event, ensure_ascii=False, separators=(",", ":"), default=str) + "\n\n"
+
+
+def compact_preview(value: Any, limit: int = SSE_PREVIEW_CHARS) -> str:
+    """Short text preview of a tool argument/output with base64 payloads removed."""
+    if isinstance(value, (list, tuple)):
+        text = " ".join(compact_preview(part, limit) for part in value)
+    elif isinstance(value, dict) or not isinstance(value, str):
+        # ToolOutputImage / ToolOutputText objects and dicts: summarize their text-ish fields
+        text = getattr(value, "text", None) or (value.get("text") if isinstance(value, dict) else None)
+        image = getattr(value, "image_url", None) or (value.get("image_url") if isinstance(value, dict) else None)
+        text = text if isinstance(text, str) else ("[image]" if image else str(value))
+    else:
+        text = value
+
+    text = DATA_URI_PATTERN.sub(lambda m: f"[{m.group(1)} image omitted]", text)
+    text = BASE64_RUN_PATTERN.sub("[binary omitted]", text)
+    if len(text) > limit:
+        text = text[:limit] + "…"
+    return text
+
+
+def _output_size(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (list, tuple)):
+        return sum(_output_size(part) for part in value)
+    return len(str(value).encode("utf-8"))
+
+
+class StreamTranslator:
+    """Turns Agency Swarm / Agents SDK stream events into protocol events (tracks tool timings)."""
+
+    def __init__(self):
+        self._tool_starts: Dict[str, Dict[str, Any]] = {}
+
+    def translate(self, event: Any) -> List[Dict[str, Any]]:
+        if isinstance(event, dict):
+            if event.get("type") == "error":
+                return [{"type": "error", "message": str(event.get("content") or event.get("message") or "")}]
+            return []
+
+        event_type = getattr(event, "type", None)
+
+        if event_type == "raw_response_event":
+            data = getattr(event, "data", None)
+            if getattr(data, "type", None) == "response.output_text.delta" and getattr(data, "delta", ""):
+                return [{"type": "text_delta", "content": data.delta}]
+            return []
+
+        if event_type == "agent_updated_stream_event":
+            agent = getattr(getattr(event, "new_agent", None), "name", None)
+            return [{"type": "progress", "stage": "agent", "agent": agent}]
+
+        if event_type == "run_item_stream_event":
+            return self._translate_item(getattr(event, "name", None), getattr(event, "item", None))
+
+        return []
+
+    def _translate_item(self, name: Optional[str], item: Any) -> List[Dict[str, Any]]:
+        raw_item = getattr(item, "raw_item", None)
+
+        if name == "tool_called":
+            call_id = _field(raw_item, "call_id") or _field(raw_item, "id") or str(len(self._tool_starts))
+            tool = _field(raw_item, "name") or _field(raw_item, "type") or "tool"
+            self._tool_starts[call_id] = {"tool": tool, "started": time.perf_counter()}
+            return [{
+                "type": "tool_start",
+                "call_id": call_id,
+                "tool": tool,
+                "arguments": compact_preview(_field(raw_item, "arguments") or ""),
+            }]
+
+        if name == "tool_output":
+            call_id = _field(raw_item, "call_id")
+            started = self._tool_starts.pop(call_id, None) if call_id else None
+            output = getattr(item, "output", None)
+            return [{
+                "type": "tool_end",
+                "call_id": call_id,
+                "tool": started["tool"] if started else None,
+                "duration_ms": round((time.perf_counter() - started["started"]) * 1000) if started else None,
+                "output_bytes": _output_size(output),
+                "output_preview": compact_preview(output),
+            }]
+
+        if name in ("handoff_requested", "handoff_occured", "handoff_occurred"):
+            return [{"type": "progress", "stage": "handoff"}]
+
+        return []
+
+
+def _field(raw_item: Any, key: str) -> Any:
+    if isinstance(raw_item, dict):
+        return raw_item.get(key)
+    return getattr(raw_item, key, None)
+
+
+async def stream_events(agency_events: AsyncIterator[Any], queue: "asyncio.Queue") -> None:
+    """
+    Producer: translate agency events into the queue (blocks when the client falls behind).
+
+    When cancelled (the client went away), the agency stream is closed, which stops the run,
+    and no end marker is queued: nobody reads it, and a full queue would block forever.
+    """
+    translator = StreamTranslator()
+    try:
+        async for event in agency_events:
+            for translated in translator.translate(event):
+                await queue.put(translated)
+    except asyncio.CancelledError:
+        aclose = getattr(agency_events, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception:
+                pass
+        raise
+    except Exception as e:
+        await queue.put({"type": "error", "message": str(e)})
+    await queue.put(_END_OF_STREAM)
+
+
+async def stop_producer(producer: Optional["asyncio.Task"]) -> None:
+    """Cancel a stream_events task and wait until it has closed the agency stream."""
+    if producer is None or producer.done():
+        return
+    producer.cancel()
+    await asyncio.wait({producer})
+
+
+async def sse_frames(queue: "asyncio.Queue", heartbeat_seconds: float = SSE_HEARTBEAT_SECONDS) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Consumer: yield queued events until the end marker, merging text deltas that piled up while
+    the previous frame was being sent, and yielding None when a heartbeat is due.
+    """
+    pending: Optional[Any] = None
+    while True:
+        if pending is not None:
+            event, pending = pending, None
+        else:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+        if event is _END_OF_STREAM:
+            return
+
+        if event["type"] == "text_delta":
+            parts = [event["content"]]
+            while not queue.empty():
+                following = queue.get_nowait()
+                if following is not _END_OF_STREAM and following["type"] == "text_delta":
+                    parts.append(following["content"])
+                else:
+                    pending = following
+                    break
+            if len(parts) > 1:
+                event = {"type": "text_delta", "content": "".join(parts)}
+        yield event
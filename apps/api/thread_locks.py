@@ -0,0 +1,157 @@
+"""
+Per-thread turn serialization for the chat endpoints.
+
+All requests for one thread_id share one Agency from main._agencies. Running two turns on it
+at the same time interleaves the thread history and saves it twice, so turns on the same
+conversation are queued behind an asyncio.Lock while different conversations run in parallel.
+Queue depth and wait times are tracked for /metrics/threads.
+
+With several worker processes (lock_dir set), a turn also holds an exclusive file lock per
+conversation, so the same thread never runs in two workers at once. The lock file stores a
+version that the worker bumps after its turn's history is saved; a worker whose in-memory agency
+was loaded at an older version reloads the history before its next turn.
+"""
+import os
+import time
+import fcntl
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
+
+# Polling interval while another worker holds a conversation's file lock (doubles up to the max)
+FILE_LOCK_POLL_SECONDS = 0.02
+FILE_LOCK_POLL_MAX_SECONDS = 0.5
+
+
+class ThreadTurnLocks:
+    """One asyncio.Lock per conversation key, created on demand and dropped when idle."""
+
+    def __init__(self, lock_dir: Optional[Path] = None):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_dir = lock_dir
+        # Open lock files of the turns this process is running (multi-worker mode)
+        self._files: Dict[str, int] = {}
+        # Requests holding or waiting for each key's lock
+        self._depth: Dict[str, int] = {}
+        self._turns = 0
+        self._waited_turns = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._max_depth = 0
+
+    @asynccontextmanager
+    async def turn(self, key: str) -> AsyncIterator[float]:
+        """Hold the conversation's lock for one turn; yields the seconds spent waiting for it."""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._depth[key] = self._depth.get(key, 0) + 1
+        self._max_depth = max(self._max_depth, self._depth[key])
+
+        queued_at = time.perf_counter()
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._release_slot(key)
+            raise
+        if self._lock_dir is not None:
+            try:
+                self._files[key] = await self._acquire_file_lock(key)
+            except BaseException:
+                lock.release()
+                self._release_slot(key)
+                raise
+
+        waited = time.perf_counter() - queued_at
+        self._turns += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+        if waited > 0.001:
+            self._waited_turns += 1
+
+        try:
+            yield waited
+        finally:
+            if key in self._files:
+                self._release_file_lock(self._files.pop(key))
+            lock.release()
+            self._release_slot(key)
+
+    @property
+    def shared(self) -> bool:
+        """True when turns are also serialized across worker processes."""
+        return self._lock_dir is not None
+
+    def _lock_path(self, key: str) -> Path:
+        return self._lock_dir / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.lock"
+
+    def _open_lock_file(self, key: str) -> int:
+        self._lock_dir.mkdir(parents=True, exist_ok=True)
+        return os.open(self._lock_path(key), os.O_RDWR | os.O_CREAT, 0o644)
+
+    @staticmethod
+    def _release_file_lock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    async def _acquire_file_lock(self, key: str) -> int:
+        """
+        Wait for another worker's turn on this conversation by polling a non-blocking flock,
+        so waiting turns (possibly for minutes) hold no thread of the tool pool.
+        """
+        fd = self._open_lock_file(key)
+        delay = FILE_LOCK_POLL_SECONDS
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, FILE_LOCK_POLL_MAX_SECONDS)
+        except BaseException:
+            os.close(fd)
+            raise
+
+    def read_version(self, key: str) -> Optional[int]:
+        """Saved-history version of a conversation (None in single-process mode)."""
+        if self._lock_dir is None:
+            return None
+        try:
+            return int(self._lock_path(key).read_text() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump_version(self, key: str) -> Optional[int]:
+        """Record that this turn's history is saved; only valid while holding the turn."""
+        fd = self._files.get(key)
+        if fd is None:
+            return None
+        version = (self.read_version(key) or 0) + 1
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, str(version).encode("ascii"), 0)
+        return version
+
+    def _release_slot(self, key: str) -> None:
+        self._depth[key] -= 1
+        if self._depth[key] == 0:
+            del self._depth[key]
+            self._locks.pop(key, None)
+
+    def queue_depth(self, key: str) -> int:
+        """Requests running or queued on one conversation."""
+        return self._depth.get(key, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cross_process": self.shared,
+            "active_threads": len(self._depth),
+            "queued_turns": sum(depth - 1 for depth in self._depth.values()),
+            "max_queue_depth": self._max_depth,
+            "turns": self._turns,
+            "turns_that_waited": self._waited_turns,
+            "avg_wait_ms": round(self._total_wait / self._turns * 1000, 2) if self._turns else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 2),
+        }
@@ -3,23 +3,27 @@ Thread persistence for Agency Swarm using Supabase.
 This allows chat history to persist across Cloud Run instances.
 """
 import os
+import importlib.util
 import json
-from typing import List, Dict, Optional
-from dotenv import load_dotenv
+import threading
+from typing import List, Dict, Optional, TYPE_CHECKING
+from tracing import traced
 
-load_dotenv()
+# Supabase is imported on first use (it is the slowest import of the service)
+SUPABASE_AVAILABLE = importlib.util.find_spec("supabase") is not None
+if TYPE_CHECKING:
+    from supabase import Client
 
-# Try to import Supabase client
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
-except ImportError:
-    SUPABASE_AVAILABLE = False
-    Client = None
 
+# One client per process: its HTTP connection pool stays open between saves and loads
+_client = None
+_client_credentials = None
+_client_lock = threading.Lock()
 
-def get_supabase_client() -> Optional[Client]:
-    """Create Supabase client from environment variables."""
+
+def get_supabase_client() -> Optional["Client"]:
+    """Return the shared Supabase client, created from environment variables on first use."""
+    global _client, _client_credentials
     if not SUPABASE_AVAILABLE:
         return None
     
@@ -29,12 +33,18 @@ def get_supabase_client() -> Optional[Client]:
     if not supabase_url or not supabase_key:
         return None
     
-    try:
-        return create_client(supabase_url, supabase_key)
-    except Exception:
-        return None
+    with _client_lock:
+        if _client is None or _client_credentials != (supabase_url, supabase_key):
+            try:
+                from supabase import create_client
+                _client = create_client(supabase_url, supabase_key)
+                _client_credentials = (supabase_url, supabase_key)
+            except Exception:
+                return None
+        return _client
 
 
+@traced("thread_persistence.save_threads")
 def save_threads(thread_dict: List[Dict], chat_id: str) -> bool:
     """
     Save conversation threads to Supabase database.
@@ -85,6 +95,7 @@ def save_threads(thread_dict: List[Dict], chat_id: str) -> bool:
         return False
 
 
+@traced("thread_persistence.load_threads")
 def load_threads(chat_id: str) -> Optional[List[Dict]]:
     """
     Load conversation threads from Supabase database.
@@ -121,6 +132,28 @@ def load_threads(chat_id: str) -> Optional[List[Dict]]:
         return None
 
 
+@traced("thread_persistence.thread_exists")
+def thread_exists(chat_id: str) -> bool:
+    """
+    Check whether a conversation thread has saved history (without loading it).
+    
+    Args:
+        chat_id: Unique identifier for the conversation thread
+        
+    Returns:
+        True if the thread is stored in the database, False otherwise
+    """
+    try:
+        supabase = get_supabase_client()
+        if not supabase:
+            return False
+        result = supabase.table("conversation_threads").select("id").eq("chat_id", chat_id).limit(1).execute()
+        return bool(result.data)
+    except Exception as e:
+        print(f"Warning: Could not look up thread in database: {e}")
+        return False
+
+
 def create_threads_table_sql() -> str:
     """
     Returns SQL to create the conversation_threads table in Supabase.
@@ -0,0 +1,265 @@
+"""
+Opt-in profiling of menu_creator tools (TOOL_PROFILING=true).
+
+Every BaseTool.run() call records wall time, CPU time (of the tool's thread), RSS and peak RSS
+growth, HTTP bytes downloaded (requests and httpx bodies), output size and the steps that ran:
+the tool's private methods (e.g. FindMenuFiles._download_file) plus HTTP/Playwright spans, in
+order with their durations. That shows which fallback branch actually ran and where the time
+went.
+
+- Calls slower than TOOL_SLOW_CALL_SECONDS are appended to TOOL_SLOW_CALL_LOG (JSON lines).
+- TOOL_PROFILE_DUMP=cprofile (or pyinstrument, if installed) writes a profile per call to
+  cache/profiling/.
+- /metrics/tools returns per-tool aggregates.
+Steps come from tracing spans, so they are only recorded while tracing is enabled.
+"""
+import os
+import json
+import time
+import resource
+import functools
+import threading
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from tracing import span, collect_spans
+
+TOOL_PROFILING = os.getenv("TOOL_PROFILING", "false").lower() in ("1", "true", "yes")
+TOOL_SLOW_CALL_SECONDS = float(os.getenv("TOOL_SLOW_CALL_SECONDS", "5"))
+PROFILING_DIR = Path(__file__).resolve().parent / "cache" / "profiling"
+TOOL_SLOW_CALL_LOG = Path(os.getenv("TOOL_SLOW_CALL_LOG", str(PROFILING_DIR / "slow_calls.jsonl")))
+TOOL_PROFILE_DUMP = os.getenv("TOOL_PROFILE_DUMP", "").lower()  # "", "cprofile" or "pyinstrument"
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+    PYINSTRUMENT_AVAILABLE = True
+except ImportError:
+    PYINSTRUMENT_AVAILABLE = False
+    PyinstrumentProfiler = None
+
+_downloaded: ContextVar[Optional[List[int]]] = ContextVar("downloaded_bytes", default=None)
+_lock = threading.Lock()
+_summary: Dict[str, Dict[str, float]] = {}
+PAGE_SIZE_KB = os.sysconf("SC_PAGE_SIZE") // 1024 if hasattr(os, "sysconf") else 4
+
+
+def _rss_kb() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE_KB
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _peak_rss_kb() -> int:
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _count_download(size: int) -> None:
+    counter = _downloaded.get()
+    if counter is not None:
+        counter[0] += size
+
+
+def _instrument_downloads() -> None:
+    """Count response body bytes read through requests and httpx in the current tool call."""
+    try:
+        import requests
+
+        original_iter_content = requests.models.Response.iter_content
+        if not getattr(original_iter_content, "_profiled", False):
+            @functools.wraps(original_iter_content)
+            def iter_content(self, *args, **kwargs):
+                for chunk in original_iter_content(self, *args, **kwargs):
+                    _count_download(len(chunk))
+                    yield chunk
+            iter_content._profiled = True
+            requests.models.Response.iter_content = iter_content
+    except ImportError:
+        pass
+
+    try:
+        import httpx
+
+        original_read = httpx.Response.read
+        if not getattr(original_read, "_profiled", False):
+            @functools.wraps(original_read)
+            def read(self):
+                already_read = hasattr(self, "_content")
+                content = original_read(self)
+                if not already_read:
+                    _count_download(len(content))
+                return content
+            read._profiled = True
+            httpx.Response.read = read
+    except ImportError:
+        pass
+
+
+def _start_profiler():
+    if TOOL_PROFILE_DUMP == "pyinstrument" and PYINSTRUMENT_AVAILABLE:
+        profiler = PyinstrumentProfiler()
+    elif TOOL_PROFILE_DUMP in ("cprofile", "pyinstrument"):
+        import cProfile
+        profiler = cProfile.Profile()
+    else:
+        return None
+    try:
+        profiler.start() if hasattr(profiler, "start") else profiler.enable()
+    except ValueError:
+        # Another profiler is active (e.g. a concurrent tool call on Python 3.12+)
+        return None
+    return profiler
+
+
+def _dump_profile(profiler, tool_name: str) -> Optional[str]:
+    PROFILING_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    if PYINSTRUMENT_AVAILABLE and isinstance(profiler, PyinstrumentProfiler):
+        profiler.stop()
+        path = PROFILING_DIR / f"{tool_name}_{stamp}_{threading.get_ident()}.html"
+        path.write_text(profiler.output_html(), encoding="utf-8")
+    else:
+        profiler.disable()
+        path = PROFILING_DIR / f"{tool_name}_{stamp}_{threading.get_ident()}.prof"
+        profiler.dump_stats(str(path))
+    return str(path)
+
+
+def _output_size(result: Any) -> int:
+    if isinstance(result, str):
+        return len(result.encode("utf-8"))
+    if isinstance(result, (list, tuple)):
+        return sum(_output_size(part) for part in result)
+    return len(str(result).encode("utf-8"))
+
+
+def _record(profile: Dict[str, Any]) -> None:
+    with _lock:
+        stats = _summary.setdefault(profile["tool"], {
+            "calls": 0, "errors": 0, "slow_calls": 0, "wall_seconds": 0.0, "max_wall_seconds": 0.0,
+            "cpu_seconds": 0.0, "downloaded_bytes": 0, "output_bytes": 0,
+        })
+        stats["calls"] += 1
+        stats["errors"] += profile["outcome"] != "ok"
+        stats["slow_calls"] += profile["slow"]
+        stats["wall_seconds"] += profile["wall_seconds"]
+        stats["max_wall_seconds"] = max(stats["max_wall_seconds"], profile["wall_seconds"])
+        stats["cpu_seconds"] += profile["cpu_seconds"]
+        stats["downloaded_bytes"] += profile["downloaded_bytes"]
+        stats["output_bytes"] += profile["output_bytes"]
+
+        if profile["slow"]:
+            try:
+                TOOL_SLOW_CALL_LOG.parent.mkdir(parents=True, exist_ok=True)
+                with open(TOOL_SLOW_CALL_LOG, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(profile, default=str) + "\n")
+            except OSError:
+                pass
+
+
+def profile_call(tool_name: str, tool, run, args=(), kwargs=None) -> Any:
+    """Run one tool call under the profiler and record its measurements."""
+    kwargs = kwargs or {}
+    counter = [0]
+    token = _downloaded.set(counter)
+    rss_before, peak_before = _rss_kb(), _peak_rss_kb()
+    cpu_started, wall_started = time.thread_time(), time.perf_counter()
+    profiler = _start_profiler()
+    outcome, result = "ok", None
+    try:
+        with collect_spans() as steps:
+            result = run(tool, *args, **kwargs)
+        if isinstance(result, str) and result.lstrip().lower().startswith("error"):
+            outcome = "error_result"
+        return result
+    except BaseException as e:
+        outcome = f"raised {type(e).__name__}"
+        raise
+    finally:
+        wall = time.perf_counter() - wall_started
+        cpu = time.thread_time() - cpu_started
+        _downloaded.reset(token)
+        profile = {
+            "tool": tool_name,
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "outcome": outcome,
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "rss_delta_kb": _rss_kb() - rss_before,
+            "peak_rss_delta_kb": _peak_rss_kb() - peak_before,
+            "downloaded_bytes": counter[0],
+            "output_bytes": _output_size(result) if result is not None else 0,
+            "steps": [
+                {"name": s.name, "ms": round(s.duration * 1000, 1), **({"status": s.status} if s.status != "OK" else {})}
+                for s in steps
+            ],
+            "arguments": {k: (v if len(str(v)) <= 200 else f"{str(v)[:200]}…") for k, v in tool.model_dump().items()} if hasattr(tool, "model_dump") else {},
+            "slow": wall >= TOOL_SLOW_CALL_SECONDS,
+        }
+        if profiler is not None:
+            profile["profile_dump"] = _dump_profile(profiler, tool_name)
+        _record(profile)
+
+
+def _wrap_private_methods(tool_class) -> None:
+    """Time the tool's own helper methods as steps ('<Tool>._method')."""
+    for name, attribute in list(tool_class.__dict__.items()):
+        if not name.startswith("_") or name.startswith("__"):
+            continue
+        function = attribute.__func__ if isinstance(attribute, (staticmethod, classmethod)) else attribute
+        if not callable(function) or not hasattr(function, "__code__") or getattr(function, "_profiled", False):
+            continue
+
+        def make_wrapper(func, step_name):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(step_name):
+                    return func(*args, **kwargs)
+            wrapper._profiled = True
+            return wrapper
+
+        wrapped = make_wrapper(function, f"{tool_class.__name__}.{name}")
+        if isinstance(attribute, staticmethod):
+            wrapped = staticmethod(wrapped)
+        elif isinstance(attribute, classmethod):
+            wrapped = classmethod(wrapped)
+        setattr(tool_class, name, wrapped)
+
+
+def instrument_tool_profiling() -> None:
+    """Wrap run() of every BaseTool subclass defined so far (no-op unless TOOL_PROFILING is set)."""
+    if not TOOL_PROFILING:
+        return
+    from agency_swarm.tools import BaseTool
+
+    _instrument_downloads()
+    pending = list(BaseTool.__subclasses__())
+    while pending:
+        tool_class = pending.pop()
+        pending.extend(tool_class.__subclasses__())
+        run = tool_class.__dict__.get("run")
+        if run is None or getattr(run, "_profiled", False):
+            continue
+        _wrap_private_methods(tool_class)
+
+        def make_run(original, tool_name):
+            @functools.wraps(original)
+            def profiled_run(self, *args, **kwargs):
+                return profile_call(tool_name, self, original, args, kwargs)
+            profiled_run._profiled = True
+            return profiled_run
+
+        tool_class.run = make_run(run, tool_class.__name__)
+
+
+def tool_profile_summary() -> Dict[str, Dict[str, float]]:
+    """Per-tool aggregates since startup (average wall/CPU time per call included)."""
+    with _lock:
+        summary = {name: dict(stats) for name, stats in _summary.items()}
+    for stats in summary.values():
+        stats["avg_wall_seconds"] = round(stats["wall_seconds"] / stats["calls"], 4) if stats["calls"] else 0.0
+        stats["avg_cpu_seconds"] = round(stats["cpu_seconds"] / stats["calls"], 4) if stats["calls"] else 0.0
+    return {"enabled": TOOL_PROFILING, "slow_call_seconds": TOOL_SLOW_CALL_SECONDS, "tools": summary}
@@ -0,0 +1,79 @@
+"""
+Keep blocking work off the FastAPI event loop.
+
+Agency Swarm runs synchronous BaseTool.run() methods with asyncio.to_thread, i.e. on the event
+loop's default executor. This module installs a bounded, named executor for that (sized for
+I/O-bound tools: requests, sync Playwright, the sync Supabase client) and moves the remaining
+blocking calls of a chat turn off the loop:
+- creating an agency (ThreadManager loads the thread history via load_threads_callback)
+- saving the thread history (PersistenceHooks.on_run_end calls save_threads_callback on the loop)
+"""
+import os
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+# Threads for tool calls (asyncio.to_thread / run_in_executor(None, ...))
+TOOL_THREAD_POOL_SIZE = int(os.getenv("TOOL_THREAD_POOL_SIZE", "32"))
+
+_tool_executor: Optional[ThreadPoolExecutor] = None
+
+# Single writer thread: saves leave the loop immediately but stay in submission order,
+# so an older snapshot of a thread can never overwrite a newer one. Created on first use.
+_persistence_executor: Optional[ThreadPoolExecutor] = None
+_persistence_executor_lock = threading.Lock()
+
+
+def install_tool_executor(loop: Optional[asyncio.AbstractEventLoop] = None) -> ThreadPoolExecutor:
+    """Make a bounded thread pool the loop's default executor (used by Agency Swarm for sync tools)."""
+    global _tool_executor
+    if _tool_executor is None:
+        _tool_executor = ThreadPoolExecutor(max_workers=TOOL_THREAD_POOL_SIZE, thread_name_prefix="tool")
+    (loop or asyncio.get_running_loop()).set_default_executor(_tool_executor)
+    return _tool_executor
+
+
+def _get_persistence_executor() -> ThreadPoolExecutor:
+    """The persistence thread's executor, created on first use (and again after a shutdown)."""
+    global _persistence_executor
+    with _persistence_executor_lock:
+        if _persistence_executor is None:
+            _persistence_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thread-save")
+        return _persistence_executor
+
+
+def shutdown_tool_executor() -> None:
+    """Wait for pending thread saves and stop the tool pool (on application shutdown)."""
+    global _tool_executor, _persistence_executor
+    with _persistence_executor_lock:
+        persistence_executor, _persistence_executor = _persistence_executor, None
+    if persistence_executor is not None:
+        persistence_executor.shutdown(wait=True)
+    if _tool_executor is not None:
+        _tool_executor.shutdown(wait=False, cancel_futures=True)
+        _tool_executor = None
+
+
+def background_save(save: Callable[[list], object]) -> Callable[[list], Future]:
+    """
+    Wrap a save_threads_callback so the write runs on the persistence thread instead of
+    the event loop. The message list is copied because the ThreadManager keeps mutating it.
+    """
+    def save_callback(thread_dict):
+        future = _get_persistence_executor().submit(save, list(thread_dict))
+        future.add_done_callback(_report_save_failure)
+        return future
+    return save_callback
+
+
+def _report_save_failure(future: Future) -> None:
+    """Nobody waits on a background save, so a failed one is reported here."""
+    error = None if future.cancelled() else future.exception()
+    if error is not None:
+        print(f"Warning: Background thread save failed: {type(error).__name__}: {error}")
+
+
+def flush_background_saves(timeout: Optional[float] = None) -> None:
+    """Block until every save submitted so far has been written."""
+    _get_persistence_executor().submit(lambda: None).result(timeout=timeout)
@@ -0,0 +1,382 @@
+"""
+Request tracing and latency histograms for the chat pipeline.
+
+Spans follow the OpenTelemetry data model (trace id, span id, parent, start/end in unix nanos,
+attributes, status) and are exported locally:
+- a latency histogram per span name, served by /metrics in Prometheus text format
+- the most recent spans in memory (/metrics/traces groups them by trace)
+- optionally one JSON line per span in TRACE_EXPORT_PATH
+If opentelemetry-api is installed, every span is also opened as an OpenTelemetry span, so a
+configured OTel SDK/exporter receives the same tree.
+
+Our own code uses span() / @traced. setup_tracing() instruments what cannot be decorated:
+every BaseTool.run(), requests and httpx (Supabase) HTTP calls, Playwright navigation and
+screenshots, and model responses (through an Agents SDK trace processor).
+"""
+import os
+import json
+import time
+import uuid
+import inspect
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager, ExitStack
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    from opentelemetry import trace as otel_trace
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+    otel_trace = None
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() not in ("0", "false", "no")
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "2000"))
+
+# Histogram bucket upper bounds in seconds (tool calls and model turns run up to minutes)
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+# Optional list that receives every span finished in the current context (used by tool profiling)
+_span_collector: ContextVar[Optional[list]] = ContextVar("span_collector", default=None)
+_lock = threading.Lock()
+_histograms: Dict[str, "LatencyHistogram"] = {}
+_recent_spans: deque = deque(maxlen=TRACE_BUFFER_SIZE)
+_otel_tracer = otel_trace.get_tracer("menoo") if OTEL_AVAILABLE else None
+
+
+class Span:
+    """One timed operation (OpenTelemetry-compatible fields)."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "start_time_unix_nano",
+                 "end_time_unix_nano", "attributes", "status", "_started")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_span_id = parent.span_id if parent else None
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano: Optional[int] = None
+        self.attributes = dict(attributes)
+        self.status = "OK"
+        self._started = time.perf_counter()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        return time.perf_counter() - self._started
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_unix_nano": self.start_time_unix_nano,
+            "end_time_unix_nano": self.end_time_unix_nano,
+            "duration_ms": round((self.end_time_unix_nano - self.start_time_unix_nano) / 1e6, 3) if self.end_time_unix_nano else None,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class LatencyHistogram:
+    """Cumulative-bucket histogram (Prometheus semantics)."""
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(HISTOGRAM_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+
+def record_duration(name: str, seconds: float, error: bool = False) -> None:
+    """Add one observation to a span name's latency histogram."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = LatencyHistogram()
+        histogram.observe(seconds, error)
+
+
+def _export(finished: Span) -> None:
+    record = finished.to_dict()
+    with _lock:
+        _recent_spans.append(record)
+        if TRACE_EXPORT_PATH:
+            try:
+                with open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+            except OSError:
+                pass
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Time a block as a child of the current span (yields None when tracing is disabled)."""
+    if not TRACING_ENABLED:
+        yield None
+        return
+
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    with ExitStack() as stack:
+        otel_span = stack.enter_context(_otel_tracer.start_as_current_span(name, attributes=attributes)) if _otel_tracer else None
+        try:
+            yield current
+        except BaseException as e:
+            current.status = "ERROR"
+            current.attributes.setdefault("error.type", type(e).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            current.end_time_unix_nano = time.time_ns()
+            if otel_span is not None:
+                for key, value in current.attributes.items():
+                    if isinstance(value, (str, bool, int, float)):
+                        otel_span.set_attribute(key, value)
+            record_duration(name, current.duration, current.status == "ERROR")
+            _export(current)
+            collector = _span_collector.get()
+            if collector is not None:
+                collector.append(current)
+
+
+def traced(name: str) -> Callable:
+    """Decorator: run the function (sync or async) inside a span."""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect_spans() -> Iterator[List[Span]]:
+    """Collect the spans finished inside the block (in finish order)."""
+    collected: List[Span] = []
+    token = _span_collector.set(collected)
+    try:
+        yield collected
+    finally:
+        _span_collector.reset(token)
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace_id if current else None
+
+
+# ---------------------------------------------------------------------------
+# Instrumentation of code we do not own
+# ---------------------------------------------------------------------------
+
+def _wrap_method(owner: Any, method_name: str, span_name: str, attributes: Callable[..., Dict[str, Any]] = None) -> None:
+    original = getattr(owner, method_name, None)
+    if original is None or getattr(original, "_traced", False):
+        return
+
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        extra = attributes(*args, **kwargs) if attributes else {}
+        with span(span_name, **extra):
+            return original(*args, **kwargs)
+
+    wrapper._traced = True
+    setattr(owner, method_name, wrapper)
+
+
+def instrument_base_tools() -> None:
+    """Wrap run() of every BaseTool subclass defined so far in a 'tool.<Name>' span."""
+    from agency_swarm.tools import BaseTool
+
+    pending = list(BaseTool.__subclasses__())
+    while pending:
+        tool_class = pending.pop()
+        pending.extend(tool_class.__subclasses__())
+        run = tool_class.__dict__.get("run")
+        if run is None or getattr(run, "_traced", False):
+            continue
+        wrapped = traced(f"tool.{tool_class.__name__}")(run)
+        wrapped._traced = True
+        tool_class.run = wrapped
+
+
+def _http_attributes(client, request, *args, **kwargs) -> Dict[str, Any]:
+    url = str(getattr(request, "url", ""))
+    host = url.split("/")[2] if "://" in url else ""
+    return {"http.method": getattr(request, "method", ""), "server.address": host}
+
+
+def instrument_http() -> None:
+    """Time every requests (tool downloads) and sync httpx (Supabase / PostgREST) request."""
+    try:
+        import requests
+        _wrap_method(requests.Session, "send", "http.requests", _http_attributes)
+    except ImportError:
+        pass
+    try:
+        import httpx
+        _wrap_method(httpx.Client, "send", "http.httpx", _http_attributes)
+    except ImportError:
+        pass
+
+
+def instrument_playwright() -> None:
+    """Time browser launches, navigations and screenshots of the sync Playwright API."""
+    try:
+        from playwright.sync_api import BrowserType, Page
+    except ImportError:
+        return
+    _wrap_method(BrowserType, "launch", "playwright.launch")
+    _wrap_method(Page, "goto", "playwright.goto", lambda page, url, *a, **k: {"url.host": url.split("/")[2] if "://" in url else url})
+    _wrap_method(Page, "set_content", "playwright.set_content")
+    _wrap_method(Page, "wait_for_load_state", "playwright.wait_for_load_state")
+    _wrap_method(Page, "screenshot", "playwright.screenshot")
+
+
+def _iso_seconds(value: Optional[str]) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value).timestamp() if value else None
+    except ValueError:
+        return None
+
+
+class ModelCallRecorder:
+    """Agents SDK trace processor: records model responses as 'model.response' spans."""
+
+    def on_trace_start(self, trace) -> None:
+        pass
+
+    def on_trace_end(self, trace) -> None:
+        pass
+
+    def on_span_start(self, sdk_span) -> None:
+        pass
+
+    def on_span_end(self, sdk_span) -> None:
+        data = getattr(sdk_span, "span_data", None)
+        if getattr(data, "type", None) not in ("response", "generation"):
+            return
+        started, ended = _iso_seconds(sdk_span.started_at), _iso_seconds(sdk_span.ended_at)
+        if started is None or ended is None:
+            return
+        response = getattr(data, "response", None)
+        usage = getattr(response, "usage", None)
+        record_duration("model.response", ended - started, getattr(sdk_span, "error", None) is not None)
+        _export_external("model.response", started, ended, {
+            "model": getattr(response, "model", None) or getattr(data, "model", None),
+            "input_tokens": getattr(usage, "input_tokens", None),
+            "output_tokens": getattr(usage, "output_tokens", None),
+        })
+
+    def shutdown(self) -> None:
+        pass
+
+    def force_flush(self) -> None:
+        pass
+
+
+def _export_external(name: str, started: float, ended: float, attributes: Dict[str, Any]) -> None:
+    """Export a span whose timing was measured elsewhere, under the current span if any."""
+    external = Span(name, _current_span.get(), {k: v for k, v in attributes.items() if v is not None})
+    external.start_time_unix_nano = int(started * 1e9)
+    external.end_time_unix_nano = int(ended * 1e9)
+    _export(external)
+
+
+def instrument_model_calls() -> None:
+    try:
+        from agents import add_trace_processor
+    except ImportError:
+        return
+    add_trace_processor(ModelCallRecorder())
+
+
+_setup_done = False
+
+
+def setup_tracing() -> None:
+    """Install all instrumentation once (no-op when TRACING_ENABLED is false)."""
+    global _setup_done
+    if _setup_done or not TRACING_ENABLED:
+        return
+    _setup_done = True
+    instrument_http()
+    instrument_playwright()
+    instrument_base_tools()
+    instrument_model_calls()
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def render_prometheus() -> str:
+    """Latency histograms in Prometheus text exposition format."""
+    lines = [
+        "# HELP menoo_span_duration_seconds Duration of traced operations.",
+        "# TYPE menoo_span_duration_seconds histogram",
+    ]
+    with _lock:
+        snapshot = {name: (list(h.bucket_counts), h.count, h.total, h.errors) for name, h in _histograms.items()}
+
+    error_lines = []
+    for name in sorted(snapshot):
+        bucket_counts, count, total, errors = snapshot[name]
+        cumulative = 0
+        for bound, bucket_count in zip(HISTOGRAM_BUCKETS, bucket_counts):
+            cumulative += bucket_count
+            lines.append(f'menoo_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'menoo_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {count}')
+        lines.append(f'menoo_span_duration_seconds_sum{{span="{name}"}} {total:.6f}')
+        lines.append(f'menoo_span_duration_seconds_count{{span="{name}"}} {count}')
+        error_lines.append(f'menoo_span_errors_total{{span="{name}"}} {errors}')
+
+    lines.append("# HELP menoo_span_errors_total Traced operations that raised.")
+    lines.append("# TYPE menoo_span_errors_total counter")
+    lines.extend(error_lines)
+    return "\n".join(lines) + "\n"
+
+
+def recent_traces(limit: int = 20) -> List[Dict[str, Any]]:
+    """The most recent traces, each with its spans ordered by start time."""
+    with _lock:
+        spans = list(_recent_spans)
+
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    for record in spans:
+        traces.setdefault(record["trace_id"], []).append(record)
+
+    result = []
+    for trace_id, trace_spans in list(traces.items())[-limit:]:
+        trace_spans.sort(key=lambda s: s["start_time_unix_nano"])
+        root = next((s for s in trace_spans if s["parent_span_id"] is None), trace_spans[0])
+        result.append({"trace_id": trace_id, "root": root["name"], "duration_ms": root["duration_ms"], "spans": trace_spans})
+    return result
@@ -0,0 +1,133 @@
+"""
+Startup warm-up, so the first requests on a fresh instance are not the slow ones.
+
+On startup main.py runs the configured steps concurrently (blocking ones in the thread pool):
+- agency: imports agency_swarm and the tools and builds the shared "default" agency
+- database: creates the shared Supabase client and opens its connection with one small query
+- auth: loads the bcrypt backend (first hash/verify otherwise pays for it)
+- templates: reads and compiles the menu templates in WARMUP_TEMPLATES
+- browser: launches and closes Chromium once (binary, shared libraries and fonts get cached)
+
+/health answers 503 until warm-up has finished (or WARMUP_TIMEOUT_SECONDS passed); the HTTP
+startup probe on /health configured in cloudbuild.yaml keeps traffic away until the instance is
+fast. A failing step is reported in the status but does not block readiness.
+"""
+import os
+import time
+import asyncio
+import inspect
+from typing import Any, Awaitable, Callable, Dict, List, Union
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+WARMUP_STEPS = [s.strip() for s in os.getenv("WARMUP_STEPS", "agency,database,auth,templates,browser").split(",") if s.strip()]
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "120"))
+WARMUP_TEMPLATES = [s.strip() for s in os.getenv("WARMUP_TEMPLATES", "menu.html").split(",") if s.strip()]
+
+WarmupStep = Callable[[], Union[Any, Awaitable[Any]]]
+
+_status: Dict[str, Any] = {"ready": not WARMUP_ENABLED, "duration_ms": None, "steps": {}}
+
+
+def warm_database() -> str:
+    from thread_persistence import get_supabase_client
+
+    supabase = get_supabase_client()
+    if supabase is None:
+        return "skipped: Supabase not configured"
+    supabase.table("conversation_threads").select("id").limit(1).execute()
+    return "ok"
+
+
+def warm_auth() -> str:
+    from auth import pwd_context
+
+    pwd_context.hash("warm-up")
+    return "ok"
+
+
+def warm_templates() -> str:
+    from menu_creator.tools.PopulateMenuFromDB import CACHE_DIR, compile_template, read_template
+
+    compiled = 0
+    for filename in WARMUP_TEMPLATES:
+        path = CACHE_DIR / os.path.basename(filename)
+        if path.exists():
+            content, content_hash = read_template(path)
+            compile_template(content, content_hash)
+            compiled += 1
+    return f"ok: {compiled} template(s) compiled" if compiled else "skipped: no templates found"
+
+
+def warm_browser() -> str:
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        page = browser.new_page()
+        page.set_content("<p>warm-up</p>")
+        browser.close()
+    return "ok"
+
+
+DEFAULT_STEPS: Dict[str, WarmupStep] = {
+    "database": warm_database,
+    "auth": warm_auth,
+    "templates": warm_templates,
+    "browser": warm_browser,
+}
+
+
+async def _run_step(name: str, step: WarmupStep) -> None:
+    started = time.perf_counter()
+    try:
+        if inspect.iscoroutinefunction(step):
+            result = await step()
+        else:
+            result = await asyncio.to_thread(step)
+        outcome = result if isinstance(result, str) else "ok"
+    except Exception as e:
+        outcome = f"error: {type(e).__name__}: {e}"
+    _status["steps"][name] = {"status": outcome, "ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+async def run_warmup(extra_steps: Dict[str, WarmupStep] = None) -> Dict[str, Any]:
+    """
+    Run the configured steps concurrently and mark the instance ready when they finish.
+
+    extra_steps adds steps that need the caller's state (main.py passes "agency"). Steps still
+    running after WARMUP_TIMEOUT_SECONDS keep running but no longer hold back readiness.
+    """
+    if not WARMUP_ENABLED:
+        _status["ready"] = True
+        return warmup_status()
+
+    steps = {**DEFAULT_STEPS, **(extra_steps or {})}
+    selected: List[str] = [name for name in WARMUP_STEPS if name in steps]
+    started = time.perf_counter()
+    for name in selected:
+        _status["steps"][name] = {"status": "running", "ms": None}
+
+    tasks = [asyncio.create_task(_run_step(name, steps[name])) for name in selected]
+    if tasks:
+        await asyncio.wait(tasks, timeout=WARMUP_TIMEOUT_SECONDS)
+        for name in selected:
+            if _status["steps"][name]["status"] == "running":
+                _status["steps"][name]["status"] = "timeout"
+
+    _status["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    _status["ready"] = True
+    print(f"Warm-up finished in {_status['duration_ms']} ms: "
+          + ", ".join(f"{name}={info['status']}" for name, info in _status["steps"].items()))
+    return warmup_status()
+
+
+def is_ready() -> bool:
+    return _status["ready"]
+
+
+def warmup_status() -> Dict[str, Any]:
+    return {
+        "ready": _status["ready"],
+        "duration_ms": _status["duration_ms"],
+        "steps": {name: dict(info) for name, info in _status["steps"].items()},
+    }
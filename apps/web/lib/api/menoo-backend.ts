@@ -37,6 +37,8 @@ export async function sendChatMessage(
 
   const response = await fetch(`${API_URL}/chat`, {
     method: "POST",
+    // Sends the instance-affinity cookies so the thread stays on the instance that has it loaded
+    credentials: "include",
     headers: {
       "Content-Type": "application/json",
       "Authorization": `Bearer ${token}`,
@@ -79,6 +81,7 @@ export async function streamChatMessage(
   try {
     response = await fetch(`${API_URL}/chat/stream`, {
       method: "POST",
+      credentials: "include",
       headers: {
         "Content-Type": "application/json",
         "Authorization": `Bearer ${token}`,